@@ -0,0 +1,153 @@
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict, deque
+
+import numpy as np
+
+EMBEDDING_DIMENSIONS = 1024
+
+# Words a rephrasing may add, drop or swap. Everything else, numbers
+# included, has to match before a cached reply counts as a near match.
+STOP_WORDS = frozenset("""
+    a an the and or but if of to in on at for with by from about as into
+    is are was were be been being am do does did done has have had having
+    can could should would will shall may might must
+    i me my we our you your he she it its they them their his her him
+    how what when where which who whom why whether
+    this that these those there here so just very too also
+    please much many some any more most really
+""".split())
+
+
+def normalize_prompt(text):
+    """Lowercase, drop punctuation and collapse whitespace, so trivially
+    different phrasings of a question share a cache entry."""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return ' '.join(re.findall(r'\w+', text))
+
+
+def content_words(text):
+    """The words of a normalized prompt that carry its meaning."""
+    return frozenset(word for word in text.split() if word not in STOP_WORDS)
+
+
+def hashed_embedding(text):
+    """A unit vector of hashed word and word-pair counts.
+
+    Computed locally in microseconds. It only measures word overlap, so
+    "2 month old" and "6 month old" score high; PromptCache checks the
+    content words before trusting it.
+    """
+    words = text.split()
+    vector = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)
+    for term in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        vector[zlib.crc32(term.encode('utf-8')) % EMBEDDING_DIMENSIONS] += 1
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class LatencyStats:
+    """Count, mean and percentiles over the most recent ``window`` samples."""
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self._samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self._samples.append(seconds)
+
+    def summary(self):
+        if not self._samples:
+            return {"count": self.count}
+        p50, p95 = np.percentile(np.array(self._samples) * 1000, [50, 95])
+        return {
+            "count": self.count,
+            "mean_ms": round(float(np.mean(self._samples)) * 1000, 2),
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+        }
+
+
+class PromptCache:
+    """AI replies keyed by normalized prompt, with TTL and LRU eviction.
+
+    ``context_key`` separates replies that were given with different user
+    context. With ``similarity`` set, a miss falls back to the most similar
+    cached prompt whose embedding has at least that cosine similarity and
+    which has exactly the same content words (see STOP_WORDS), so "should"
+    and "does" are interchangeable but "2 month" and "6 month", or "honey"
+    and "water", never are.
+    """
+
+    def __init__(self, max_entries=1000, ttl=24 * 3600, similarity=None, embed=hashed_embedding):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.embed = embed
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.latency = {"hit": LatencyStats(), "miss": LatencyStats()}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, prompt, context_key=""):
+        key = (context_key, normalize_prompt(prompt))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None and self.similarity:
+                key, entry = self._nearest(key, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _nearest(self, key, now):
+        words = content_words(key[1])
+        candidates = [
+            (candidate, entry) for candidate, entry in self._entries.items()
+            if candidate[0] == key[0] and entry[0] > now and entry[3] == words
+        ]
+        if not candidates:
+            return None, None
+        scores = np.stack([entry[2] for _, entry in candidates]) @ self.embed(key[1])
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None, None
+        self.similar_hits += 1
+        return candidates[best]
+
+    def put(self, prompt, reply, context_key=""):
+        text = normalize_prompt(prompt)
+        vector = self.embed(text)
+        words = content_words(text)
+        with self._lock:
+            self._entries[(context_key, text)] = (time.monotonic() + self.ttl, reply, vector, words)
+            self._entries.move_to_end((context_key, text))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_latency(self, hit, seconds):
+        self.latency["hit" if hit else "miss"].add(seconds)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "latency": {kind: stats.summary() for kind, stats in self.latency.items()},
+            }
@@ -0,0 +1,122 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from bounded_executor import BoundedExecutor, ExecutorBusy
+
+
+class ChatBusy(Exception):
+    """Raised when too many chats are already running or waiting."""
+
+
+class ChatTimeout(Exception):
+    pass
+
+
+# Marks the end of a streamed reply in the chunk queue
+_DONE = object()
+
+
+class ChatPool:
+    """Runs OpenAI chat completions on a BoundedExecutor of threads.
+
+    At most ``max_workers`` completions run at once and ``max_queue`` more may
+    wait for a thread; anything beyond that raises ChatBusy. ``timeout`` is
+    the total number of seconds a caller waits for a reply.
+    """
+
+    def __init__(self, get_client, model, max_workers=4, max_queue=4, timeout=30):
+        self.get_client = get_client
+        self.model = model
+        self.timeout = timeout
+        self.executor = BoundedExecutor(
+            lambda workers: ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai-chat"),
+            max_workers, max_queue
+        )
+
+    def pending(self):
+        return self.executor.pending()
+
+    def _submit(self, fn, *args):
+        try:
+            return self.executor.submit(fn, *args)
+        except ExecutorBusy:
+            raise ChatBusy() from None
+
+    def complete(self, messages):
+        """The whole reply as a string."""
+        future = self._submit(self._complete, messages)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise ChatTimeout()
+
+    def _complete(self, messages):
+        response = self.get_client().chat.completions.create(
+            model=self.model, messages=messages, timeout=self.timeout
+        )
+        if not response.choices:
+            raise ValueError("Invalid AI response")
+        return response.choices[0].message.content
+
+    def stream(self, messages):
+        """Start a completion and return a generator of the reply's pieces.
+
+        Raises ChatBusy here rather than on the first read, so callers can
+        still answer with an error status. Closing the generator (e.g. when
+        the client disconnects) stops reading from the model.
+        """
+        chunks = queue.Queue()
+        cancelled = threading.Event()
+        self._submit(self._stream, messages, chunks, cancelled)
+        return self._read(chunks, cancelled)
+
+    def _read(self, chunks, cancelled):
+        deadline = time.monotonic() + self.timeout
+        try:
+            while True:
+                try:
+                    chunk = chunks.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    raise ChatTimeout()
+                if chunk is _DONE:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            cancelled.set()
+
+    def _stream(self, messages, chunks, cancelled):
+        try:
+            response = self.get_client().chat.completions.create(
+                model=self.model, messages=messages, stream=True, timeout=self.timeout
+            )
+            with response:
+                for event in response:
+                    if cancelled.is_set():
+                        return
+                    if event.choices and event.choices[0].delta.content:
+                        chunks.put(event.choices[0].delta.content)
+            chunks.put(_DONE)
+        except Exception as e:
+            chunks.put(e)
+
+
+def estimate_tokens(text):
+    # About four characters per token for English text
+    return len(text) // 4 + 1
+
+
+def fit_token_budget(header, lines, max_tokens):
+    """``header`` followed by as many of ``lines`` as fit in ``max_tokens``."""
+    kept = [header]
+    used = estimate_tokens(header)
+    for line in lines:
+        used += estimate_tokens(line)
+        if used > max_tokens:
+            break
+        kept.append(line)
+    return "\n".join(kept)
@@ -0,0 +1,60 @@
+"""Structured logging setup.
+
+Records are written as one JSON object per line by a background thread, so
+request threads never block on stdout. LOG_LEVEL sets the level (default
+INFO) and LOG_DEBUG_SAMPLE_RATE keeps only that fraction of DEBUG records,
+which makes it possible to leave DEBUG on in production.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _STANDARD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Let through only ``rate`` of the DEBUG records; other levels always pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+def configure_logging():
+    records = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(JSONFormatter())
+    listener = logging.handlers.QueueListener(records, stream)
+    listener.start()
+    atexit.register(listener.stop)
+
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(DebugSampler(float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1.0))))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
@@ -1,31 +1,74 @@
-from flask import Flask, request, jsonify, make_response
+from flask import Flask, Blueprint, current_app, request, jsonify, make_response, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 from flask_cors import CORS
-from flask_bcrypt import Bcrypt
 import datetime
 import os
-from openai import OpenAI
+import json
+import base64
+import bisect
+import collections
+import csv
+import functools
+import hashlib
+import heapq
+import logging
+import io
+import time
+import zlib
+import click
 from dotenv import load_dotenv
-from firebase_admin import credentials, messaging
-import firebase_admin
-from apscheduler.schedulers.background import BackgroundScheduler
+import numpy as np
+import orjson
+from reminder_scheduler import ReminderScheduler
+import sleep_analytics
+import growth_standards
+from notification_dispatch import Notification, NotificationDispatcher, FCMTransport, StubTransport, TokenCache
+from response_cache import ResponseCache, LocalVersionStore, SQLVersionStore
+import db_config
+import metrics
+import app_logging
+import services
+from ai_chat import ChatPool, ChatBusy, ChatTimeout, estimate_tokens, fit_token_budget
+from ai_cache import PromptCache
+from password_hashing import PasswordHasher, HashingBusy, HashingTimeout
+from group_commit import GroupCommitter, WriteTimeout
+from event_hub import EventHub, LocalBroker, SQLBroker, StreamsBusy
+from cold_storage import ArchiveStore
 
 load_dotenv()
+app_logging.configure_logging()
+log = logging.getLogger('baby_backend')
 
-cred = credentials.Certificate('firebase_credentials.json')
-firebase_admin.initialize_app(cred)
+# Created on first use, see services.py
+firebase_service = services.LazyService(services.create_firebase_app)
+openai_service = services.LazyService(services.create_openai_client)
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+class ORJSONProvider(JSONProvider):
+    """jsonify() and request.json through orjson, which also writes datetimes in ISO format."""
 
-app = Flask(__name__)
-CORS(app)
+    options = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
 
-# SQLite Database Configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////tmp/baby_tracker.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.options).decode('utf-8')
 
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=self.options), mimetype='application/json')
+
+# Routes are registered on this blueprint and the app is built by create_app()
+api = Blueprint('api', __name__, cli_group=None)
+db = SQLAlchemy()
+
+def utcnow():
+    # Stored without a timezone, like the other DateTime columns
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
 
 # Database Models
 class User(db.Model):
@@ -44,6 +87,12 @@ class Feeding(db.Model):
     start_time = db.Column(db.DateTime, nullable=False)
     end_time = db.Column(db.DateTime, nullable=False)
     notes = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_feeding_user_start_time', 'user_id', 'start_time'),
+        db.Index('ix_feeding_user_updated_at', 'user_id', 'updated_at'),
+    )
 
 class Sleep(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -52,6 +101,13 @@ class Sleep(db.Model):
     end_time = db.Column(db.DateTime, nullable=False)
     wake_window = db.Column(db.Integer, nullable=True)
     notes = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_sleep_user_start_time', 'user_id', 'start_time'),
+        db.Index('ix_sleep_user_updated_at', 'user_id', 'updated_at'),
+        db.Index('ix_sleep_user_end_time', 'user_id', 'end_time'),
+    )
 
 class DiaperChange(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -59,6 +115,12 @@ class DiaperChange(db.Model):
     type = db.Column(db.String(10), nullable=False)
     time = db.Column(db.DateTime, nullable=False)
     notes = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_diaper_change_user_time', 'user_id', 'time'),
+        db.Index('ix_diaper_change_user_updated_at', 'user_id', 'updated_at'),
+    )
 
 class TummyTime(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -67,6 +129,12 @@ class TummyTime(db.Model):
     end_time = db.Column(db.DateTime, nullable=False)
     duration = db.Column(db.Integer, nullable=False)
     notes = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_tummy_time_user_start_time', 'user_id', 'start_time'),
+        db.Index('ix_tummy_time_user_updated_at', 'user_id', 'updated_at'),
+    )
 
 class Todo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -76,6 +144,16 @@ class Todo(db.Model):
     reminder_time = db.Column(db.DateTime, nullable=True)
     completed = db.Column(db.Boolean, default=False, nullable=False)
     reminder_notified = db.Column(db.Boolean, default=False, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_todo_user_time', 'user_id', 'time'),
+        db.Index('ix_todo_user_updated_at', 'user_id', 'updated_at'),
+        # Only todos still waiting on a notification, for the reminder scanner
+        db.Index('ix_todo_pending_reminder', 'reminder_time',
+                 sqlite_where=db.text('reminder_notified = 0 AND completed = 0'),
+                 postgresql_where=db.text('NOT reminder_notified AND NOT completed')),
+    )
 
 class Reminder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -83,6 +161,81 @@ class Reminder(db.Model):
     category = db.Column(db.String(50), nullable=False)
     reminder_time = db.Column(db.DateTime, nullable=False)
     notified = db.Column(db.Boolean, default=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_reminder_user_reminder_time', 'user_id', 'reminder_time'),
+        db.Index('ix_reminder_user_updated_at', 'user_id', 'updated_at'),
+        db.Index('ix_reminder_pending', 'reminder_time',
+                 sqlite_where=db.text('notified = 0'),
+                 postgresql_where=db.text('NOT notified')),
+    )
+
+# Weight in kg, height (length lying down, height standing) and head
+# circumference in cm
+class Growth(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    weight = db.Column(db.Float, nullable=True)
+    height = db.Column(db.Float, nullable=True)
+    head_circumference = db.Column(db.Float, nullable=True)
+    notes = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_growth_user_date', 'user_id', 'date'),
+        db.Index('ix_growth_user_updated_at', 'user_id', 'updated_at'),
+    )
+
+class Milestone(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    milestone = db.Column(db.String(100), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    notes = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_milestone_user_date', 'user_id', 'date'),
+        db.Index('ix_milestone_user_updated_at', 'user_id', 'updated_at'),
+    )
+
+# Deleted activity records, so /sync can tell clients what to remove
+class Tombstone(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    record_type = db.Column(db.String(20), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_tombstone_user_deleted_at', 'user_id', 'deleted_at'),
+    )
+
+# Per user, day and category totals behind /stats, kept up to date by the
+# add/update/delete handlers
+class DailyStat(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total_duration = db.Column(db.Integer, nullable=False, default=0)  # minutes
+    longest_duration = db.Column(db.Integer, nullable=False, default=0)  # minutes
+    bottle_amount = db.Column(db.Integer, nullable=False, default=0)
+    wet_count = db.Column(db.Integer, nullable=False, default=0)
+    dirty_count = db.Column(db.Integer, nullable=False, default=0)
+
+class IdempotencyKey(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(100), nullable=False)
+    record_type = db.Column(db.String(20), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_key'),
+    )
 
 class FCMToken(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -90,8 +243,208 @@ class FCMToken(db.Model):
     token = db.Column(db.String(255), nullable=False)
     platform = db.Column(db.String(10), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_fcm_token_user_id', 'user_id'),
+        db.Index('ix_fcm_token_token', 'token'),
+    )
+
+# Data version per user for the response cache when RESPONSE_CACHE_VERSIONS=database
+class CacheVersion(db.Model):
+    user_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Recent record changes shared between workers when EVENT_BROKER=database
+class StreamEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    __table_args__ = (
+        db.Index('ix_stream_event_created_at', 'created_at'),
+        # Pollers remember the last id they saw, so ids must never be reused
+        {'sqlite_autoincrement': True},
+    )
+
+
+# Record types tracked by /sync
+SYNC_MODELS = {
+    "feeding": Feeding,
+    "sleep": Sleep,
+    "diaper_change": DiaperChange,
+    "tummy_time": TummyTime,
+    "todo": Todo,
+    "reminder": Reminder,
+    "growth": Growth,
+    "milestone": Milestone,
+}
+
+# Daily statistics
+#
+# Each category names the model, the time column that decides which day a
+# record counts towards, the columns to read and a function turning one row
+# into (duration in minutes, bottle amount, wet, dirty).
+def minutes_between(start_time, end_time):
+    return int((end_time - start_time).total_seconds() / 60)
+
+STAT_SOURCES = {
+    "feeding": (Feeding, Feeding.start_time, (Feeding.start_time, Feeding.end_time, Feeding.bottle_amount),
+                lambda row: (minutes_between(row[0], row[1]), row[2] or 0, 0, 0)),
+    "sleep": (Sleep, Sleep.start_time, (Sleep.start_time, Sleep.end_time),
+              lambda row: (minutes_between(row[0], row[1]), 0, 0, 0)),
+    "diaper_change": (DiaperChange, DiaperChange.time, (DiaperChange.time, DiaperChange.type),
+                      lambda row: (0, 0, int(row[1] in ('Wet', 'Mixed')), int(row[1] in ('Dirty', 'Mixed')))),
+    "tummy_time": (TummyTime, TummyTime.start_time, (TummyTime.start_time, TummyTime.duration),
+                   lambda row: (row[1] or 0, 0, 0, 0)),
+}
+
+def daily_stat_values(category, rows):
+    extract = STAT_SOURCES[category][3]
+    values = {"count": 0, "total_duration": 0, "longest_duration": 0, "bottle_amount": 0, "wet_count": 0, "dirty_count": 0}
+    for row in rows:
+        duration, bottle_amount, wet, dirty = extract(row)
+        values["count"] += 1
+        values["total_duration"] += duration
+        values["longest_duration"] = max(values["longest_duration"], duration)
+        values["bottle_amount"] += bottle_amount
+        values["wet_count"] += wet
+        values["dirty_count"] += dirty
+    return values
+
+def lock_daily_stat(user_id, day, category):
+    """The DailyStat row for the day, created if missing and locked until commit.
+
+    On PostgreSQL the row lock makes concurrent refreshes of the same day
+    take turns, so each one reads the records after the previous one's
+    commit. SQLite serialises writers anyway.
+    """
+    query = db.select(DailyStat).where(
+        DailyStat.user_id == user_id,
+        DailyStat.date == day,
+        DailyStat.category == category
+    ).with_for_update().execution_options(populate_existing=True)
+    stat = db.session.execute(query).scalar_one_or_none()
+    if stat is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(DailyStat(user_id=user_id, date=day, category=category))
+        except IntegrityError:
+            # Another transaction created it first
+            pass
+        stat = db.session.execute(query).scalar_one()
+    return stat
+
+def refresh_daily_stats(user_id, category, times):
+    """Recompute the DailyStat rows for the days containing ``times``.
+
+    Called by the handlers before they commit, with the record's time before
+    and after an update so a record moved to another day is counted correctly.
+    A day only holds a handful of records, so this re-reads them rather than
+    applying deltas (a deleted record can't be subtracted from a maximum).
+    """
+    model, time_column, columns, _ = STAT_SOURCES[category]
+    # Days are locked in order, so two refreshes can't wait for each other
+    for day in sorted({t.date() for t in times if t is not None}):
+        stat = lock_daily_stat(user_id, day, category)
+        day_start = datetime.datetime.combine(day, datetime.time.min)
+        rows = db.session.execute(db.select(*columns).where(
+            model.user_id == user_id,
+            time_column >= day_start,
+            time_column < day_start + datetime.timedelta(days=1)
+        )).all()
+        if category in ARCHIVE_SOURCES:
+            rows += [
+                tuple(getattr(row, column.key) for column in columns)
+                for row in archive_store().iter_records(user_id, category, day_start, day_start + datetime.timedelta(days=1))
+            ]
+
+        if not rows:
+            db.session.delete(stat)
+            continue
+        for name, value in daily_stat_values(category, rows).items():
+            setattr(stat, name, value)
+
+# Schema migrations
+#
+# db.create_all() only creates missing tables, so changes to existing tables
+# (like new indexes) are applied here as numbered steps. The highest applied
+# version is stored in the schema_version table.
+def create_indexes(conn, names):
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            if index.name in names:
+                index.create(conn, checkfirst=True)
+
+def create_activity_indexes(conn):
+    create_indexes(conn, {
+        'ix_feeding_user_start_time', 'ix_sleep_user_start_time', 'ix_sleep_user_end_time',
+        'ix_diaper_change_user_time', 'ix_tummy_time_user_start_time', 'ix_todo_user_time',
+        'ix_todo_pending_reminder', 'ix_reminder_user_reminder_time', 'ix_reminder_pending'
+    })
+
+def create_fcm_token_indexes(conn):
+    create_indexes(conn, {'ix_fcm_token_user_id', 'ix_fcm_token_token'})
+
+def add_updated_at_columns(conn):
+    inspector = db.inspect(conn)
+    now = utcnow()
+    for model in SYNC_MODELS.values():
+        table = model.__table__
+        if 'updated_at' not in {column['name'] for column in inspector.get_columns(table.name)}:
+            # SQLite can only add NOT NULL columns with a constant default
+            conn.execute(db.text(
+                f"ALTER TABLE {table.name} ADD COLUMN updated_at DATETIME NOT NULL DEFAULT '1970-01-01 00:00:00'"
+            ))
+            conn.execute(table.update().values(updated_at=now))
+    create_indexes(conn, {f'ix_{model.__table__.name}_user_updated_at' for model in SYNC_MODELS.values()})
+
+def rebuild_daily_stats(conn):
+    conn.execute(DailyStat.__table__.delete())
+    for category, (model, time_column, columns, _) in STAT_SOURCES.items():
+        days = {}
+        for row in conn.execute(db.select(model.user_id, *columns)):
+            days.setdefault((row[0], row[1].date()), []).append(row[1:])
+        if days:
+            conn.execute(db.insert(DailyStat), [
+                dict(user_id=user_id, date=day, category=category, **daily_stat_values(category, rows))
+                for (user_id, day), rows in days.items()
+            ])
+
+SCHEMA_MIGRATIONS = [
+    (1, "Per-user time indexes and pending reminder indexes", create_activity_indexes),
+    (2, "FCM token lookup indexes", create_fcm_token_indexes),
+    (3, "updated_at change tracking for /sync", add_updated_at_columns),
+    (4, "Daily statistics for existing records", rebuild_daily_stats),
+]
+
+def migrate_schema(conn):
+    conn.execute(db.text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    current = conn.execute(db.text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+    applied = []
+    for version, description, step in SCHEMA_MIGRATIONS:
+        if version <= current:
+            continue
+        step(conn)
+        conn.execute(db.text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": version})
+        applied.append((version, description))
+    return applied
+
+@api.cli.command('migrate')
+def migrate_command():
+    """Create missing tables and apply pending schema migrations."""
+    db.create_all()
+    with db.engine.begin() as conn:
+        applied = migrate_schema(conn)
+    for version, description in applied:
+        print(f"Applied migration {version}: {description}")
+    if not applied:
+        print("Database schema is up to date")
 
 def send_notification(token, title, body):
+    from firebase_admin import messaging
+
     try:
         message = messaging.Message(
             notification=messaging.Notification(
@@ -100,85 +453,755 @@ def send_notification(token, title, body):
             ),
             token = token,
         )
-        response = messaging.send(message)
-        print(f"Notification sent to token: {token}. Response: {response}")
-    except Exception as e:
-        print(f"Error sending notification: {e}")
+        response = messaging.send(message, app=firebase_service.get())
+        log.info("Notification sent", extra={"token": token, "response": response})
+    except Exception:
+        log.exception("Error sending notification")
         
-def send_due_reminders():
+def dispatch_notifications(notifications):
+    """Send notifications through the dispatcher and remove tokens FCM rejected for good.
+
+    The caller commits, so token cleanup lands in the same commit as any
+    notified flags.
+    """
+    result = notification_dispatcher().dispatch(notifications)
+    if result.invalid_tokens:
+        FCMToken.query.filter(FCMToken.token.in_(result.invalid_tokens)).delete(synchronize_session=False)
+        fcm_token_cache().invalidate()
+        log.info("Removed invalid FCM tokens", extra={"count": len(result.invalid_tokens)})
+    return result
+
+def send_due_reminders(app, keys):
+    """Send the due reminders among ``keys`` and return the keys that were not delivered.
+
+    Keys that are no longer due (completed, already notified or moved to a
+    later time) count as handled.
+    """
     with app.app_context():
         now = datetime.datetime.now(datetime.timezone.utc)
+        # Allow for clock jitter between the scheduler and the stored time
+        due_before = now + datetime.timedelta(seconds=1)
         
-        print(f"[DEBUG] Checking reminders at {now.isoformat()}")
-        
-        # Get todos with reminders that are due in the next minute and haven't been notified
+        log.debug("Sending due reminders", extra={"count": len(keys)})
+
+        todo_ids = [item_id for kind, item_id in keys if kind == 'todo']
+        reminder_ids = [item_id for kind, item_id in keys if kind == 'reminder']
+
+        # Re-check the database, the todo may have changed in another worker
         due_todos = Todo.query.filter(
-            Todo.reminder_time != None,
+            Todo.id.in_(todo_ids),
             Todo.completed == False,
             Todo.reminder_notified == False,
-            Todo.reminder_time <= now + datetime.timedelta(minutes=1),
-            Todo.reminder_time > now - datetime.timedelta(minutes=1)
-        ).all()
-        
-        print(f"[DEBUG] Found {len(due_todos)} due todos in the next minute")
-        
-        # Process the due todos
+            Todo.reminder_time <= due_before
+        ).all() if todo_ids else []
+
+        due_reminders = Reminder.query.filter(
+            Reminder.id.in_(reminder_ids),
+            Reminder.notified == False,
+            Reminder.reminder_time <= due_before
+        ).all() if reminder_ids else []
+
+        # Look up the tokens for every user in the batch at once
+        tokens_by_user = fcm_token_cache().get_many(
+            [todo.user_id for todo in due_todos] + [r.user_id for r in due_reminders]
+        )
+
+        notifications = []
         for todo in due_todos:
-            tokens = FCMToken.query.filter_by(user_id=todo.user_id).all()
-            print(f"[DEBUG] Found {len(tokens)} tokens for user {todo.user_id}")
-            
+            tokens = tokens_by_user[todo.user_id]
             if not tokens:
-                print(f"[WARNING] No FCM tokens found for user {todo.user_id}")
+                log.warning("No FCM tokens found", extra={"user_id": todo.user_id})
                 continue
-                
-            for token_entry in tokens:
-                try:
-                    message = messaging.Message(
-                        token=token_entry.token,
-                        notification=messaging.Notification(
-                            title="Task Reminder",
-                            body=f"Don't forget: {todo.notes}"
-                        ),
-                        data={
-                            "type": "todo",
-                            "id": str(todo.id),
-                            "notes": todo.notes
-                        }
-                    )
-                    response = messaging.send(message)
-                    print(f"[✅] Reminder sent for Todo ID {todo.id}: {response}")
-                    
-                    # Mark the todo as notified
-                    todo.reminder_notified = True
-                    db.session.commit()
-                    
-                except Exception as e:
-                    print(f"[❌] Error sending reminder for Todo ID {todo.id}: {e}")
-
-scheduler = BackgroundScheduler()
-scheduler.add_job(send_due_reminders, 'interval', seconds=30)  # Check every 30 seconds
-scheduler.start()
+            notifications.append(Notification(
+                ('todo', todo.id),
+                tokens,
+                "Task Reminder",
+                f"Don't forget: {todo.notes}",
+                {"type": "todo", "id": str(todo.id), "notes": todo.notes or ""}
+            ))
+
+        for r in due_reminders:
+            notifications.append(Notification(
+                ('reminder', r.id),
+                tokens_by_user[r.user_id],
+                "Reminder",
+                f"Category: {r.category} at {r.reminder_time}"
+            ))
+
+        result = dispatch_notifications(notifications)
+        log.info("Sent reminder notifications", extra={"sent": result.sent, "failed": result.failed})
+
+        # A reminder counts as notified once any of its devices received it;
+        # the scheduler tries the others again
+        undelivered = []
+        for todo in due_todos:
+            if ('todo', todo.id) in result.delivered:
+                todo.reminder_notified = True
+            else:
+                undelivered.append(('todo', todo.id))
+        for r in due_reminders:
+            if ('reminder', r.id) in result.delivered:
+                r.notified = True
+            else:
+                undelivered.append(('reminder', r.id))
+        db.session.commit()
+        return undelivered
+
+def load_fcm_tokens(user_ids):
+    tokens = {}
+    rows = db.session.execute(
+        db.select(FCMToken.user_id, FCMToken.token).where(FCMToken.user_id.in_(user_ids))
+    )
+    for user_id, token in rows:
+        tokens.setdefault(user_id, []).append(token)
+    return tokens
+
+def load_pending_reminders(app):
+    with app.app_context():
+        # Reminders that were due while no process was running are still sent,
+        # as long as they are not older than the grace period
+        since = datetime.datetime.now(datetime.timezone.utc) - REMINDER_GRACE_PERIOD
+
+        todos = db.session.execute(db.select(Todo.id, Todo.reminder_time).where(
+            Todo.reminder_time >= since,
+            Todo.completed == False,
+            Todo.reminder_notified == False
+        )).all()
+        reminders = db.session.execute(db.select(Reminder.id, Reminder.reminder_time).where(
+            Reminder.reminder_time >= since,
+            Reminder.notified == False
+        )).all()
+
+        return [(('todo', t.id), t.reminder_time) for t in todos] + \
+               [(('reminder', r.id), r.reminder_time) for r in reminders]
+
+def reminder_scheduler():
+    return current_app.extensions['reminder_scheduler']
+
+def todo_reminder(todo):
+    """The todo's id and reminder time, or None for the time if nothing is left to remind of."""
+    pending = todo.reminder_time and not todo.completed and not todo.reminder_notified
+    return todo.id, todo.reminder_time if pending else None
+
+def schedule_todo_reminder(todo_id, reminder_time):
+    if reminder_time:
+        reminder_scheduler().schedule(('todo', todo_id), reminder_time)
+    else:
+        reminder_scheduler().cancel(('todo', todo_id))
+
+REMINDER_GRACE_PERIOD = datetime.timedelta(hours=1)
+
+# Both are built by create_app. FCM_TRANSPORT=stub records notifications
+# locally instead of sending them.
+def fcm_token_cache():
+    return current_app.extensions['fcm_token_cache']
+
+def notification_dispatcher():
+    return current_app.extensions['notification_dispatcher']
+
+# Response cache
+#
+# GET responses are cached per URL and user data version, and every commit
+# that touches a row with a user_id bumps that user's version. The local
+# version store only sees this process's writes, so use
+# RESPONSE_CACHE_VERSIONS=database when running several workers.
+def response_cache():
+    return current_app.extensions['response_cache']
+
+def mark_user_changed(user_id):
+    # For writes that bypass the unit of work, like bulk inserts
+    db.session.info.setdefault('changed_users', set()).add(user_id)
+
+@event.listens_for(Session, 'after_flush')
+def collect_changed_users(session, flush_context):
+    changed = session.info.setdefault('changed_users', set())
+    for obj in [*session.new, *session.dirty, *session.deleted]:
+        user_id = getattr(obj, 'user_id', None)
+        if user_id is not None:
+            changed.add(user_id)
+
+# after_commit and after_rollback also fire when a savepoint (begin_nested)
+# ends, while the outer transaction is still open. Those are skipped: the
+# changes are only visible, or gone, once the outer transaction ends.
+@event.listens_for(Session, 'after_commit')
+def bump_cache_versions(session):
+    if session.in_nested_transaction():
+        return
+    changed = session.info.pop('changed_users', None)
+    if changed:
+        response_cache().versions.bump(changed)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changed_users(session):
+    if not session.in_nested_transaction():
+        session.info.pop('changed_users', None)
+
+# Headers a view sets that are part of its response, so they are cached
+# along with the body
+CACHED_RESPONSE_HEADERS = ('X-Next-Cursor',)
+
+def cached_response(view=None, *, dated=False):
+    """Serve a per-user GET endpoint from the response cache.
+
+    Responses carry the user's data version as their ETag, so a client that
+    sends it back in If-None-Match gets a 304 without the view running.
+
+    ``dated`` is for views whose range ends today unless ``to`` is given
+    (see date_range_args): for those requests today's date is part of the
+    version, so yesterday's response isn't served after midnight UTC.
+    """
+    if view is None:
+        return functools.partial(cached_response, dated=dated)
+
+    @functools.wraps(view)
+    def wrapper(user_id, **kwargs):
+        cache = response_cache()
+        version = cache.versions.get(user_id)
+        if dated and 'to' not in request.args:
+            version = f"{version}-{utcnow().date().isoformat()}"
+        etag = f"{user_id}-{version}"
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            key = (request.full_path, version)
+            cached = cache.get(key)
+            if cached is None:
+                response = make_response(view(user_id, **kwargs))
+                if response.status_code != 200:
+                    return response
+                cache.put(key, response.get_data(), [
+                    (name, response.headers[name]) for name in CACHED_RESPONSE_HEADERS if name in response.headers
+                ])
+            else:
+                body, headers = cached
+                response = current_app.response_class(body, mimetype='application/json', headers=headers)
+        response.set_etag(etag)
+        # Clients may keep the response but must check it is still current
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
+
+# Group commit
+#
+# With GROUP_COMMIT=1 the add and update handlers hand their changes to one
+# writer thread per app, which commits the writes of many requests together
+# (see group_commit.py). Each request still returns only after its own write
+# is committed. Without it every request commits on its own.
+def commit_write(write):
+    """Run ``write`` against db.session, commit and return what it returned.
+
+    Under group commit ``write`` runs on the writer thread, possibly twice if
+    its batch fails, so it must only change the database and must return
+    plain values rather than ORM objects.
+    """
+    committer = current_app.extensions.get('group_committer')
+    if committer is None:
+        result = write()
+        db.session.commit()
+        return result
+    return committer.submit(write)
+
+def commit_batch(app, writes):
+    with app.app_context():
+        try:
+            results = [write() for write in writes]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    metrics.GROUP_COMMIT_BATCH_SIZE.observe(len(writes))
+    return results
+
+@api.errorhandler(WriteTimeout)
+def write_timed_out(error):
+    # The write is still queued and may yet be committed
+    return jsonify({"error": "Timed out waiting for the write to be saved"}), 503, {"Retry-After": "2"}
+
+# Request parsing shared by the single record endpoints and /batch
+def parse_feeding(data):
+    return {
+        "type": data['type'],
+        "left_breast_duration": data.get('left_breast_duration'),
+        "right_breast_duration": data.get('right_breast_duration'),
+        "bottle_amount": data.get('bottle_amount'),
+        "start_time": datetime.datetime.fromisoformat(data['start_time']),
+        "end_time": datetime.datetime.fromisoformat(data['end_time']),
+        "notes": data.get('notes')
+    }
+
+def parse_sleep(data):
+    return {
+        "start_time": datetime.datetime.fromisoformat(data['start_time']),
+        "end_time": datetime.datetime.fromisoformat(data['end_time']),
+        "notes": data.get('notes')
+    }
+
+def parse_diaper_change(data):
+    return {
+        "type": data['type'],
+        "time": datetime.datetime.fromisoformat(data['time']),
+        "notes": data.get('notes')
+    }
+
+def parse_tummy_time(data):
+    start_time = datetime.datetime.fromisoformat(data['start_time'])
+    end_time = datetime.datetime.fromisoformat(data['end_time'])
+    return {
+        "start_time": start_time,
+        "end_time": end_time,
+        "duration": int((end_time - start_time).total_seconds() / 60),
+        "notes": data.get('notes')
+    }
+
+def parse_growth(data):
+    return {
+        "date": datetime.date.fromisoformat(data['date'][:10]),
+        "weight": data.get('weight'),
+        "height": data.get('height'),
+        "head_circumference": data.get('head_circumference'),
+        "notes": data.get('notes')
+    }
+
+def parse_milestone(data):
+    return {
+        "milestone": data['milestone'],
+        "date": datetime.date.fromisoformat(data['date'][:10]),
+        "notes": data.get('notes')
+    }
+
+def parse_todo(data):
+    reminder_time = data.get('reminder_time')
+    return {
+        "time": datetime.datetime.fromisoformat(data['time']).replace(tzinfo=datetime.timezone.utc),
+        "notes": data.get('notes'),
+        "reminder_time": datetime.datetime.fromisoformat(reminder_time).replace(tzinfo=datetime.timezone.utc) if reminder_time else None
+    }
+
+# JSON for each record type, as returned by the list endpoints, /sync and /export.
+#
+# A field is either a column copied as is (datetimes are written in ISO
+# format by the JSON encoder) or the columns it is built from and a function
+# of the row. The list endpoints can return a subset of the fields, and only
+# the columns behind those fields are selected.
+def utc_timestamp(value):
+    return value.replace(tzinfo=None).isoformat(timespec='seconds') + 'Z' if value else None
+
+FEEDING_FIELDS = {
+    "id": "id",
+    "type": "type",
+    "start_time": "start_time",
+    "end_time": "end_time",
+    "left_breast_duration": "left_breast_duration",
+    "right_breast_duration": "right_breast_duration",
+    "bottle_amount": "bottle_amount",
+    "details": (("type", "start_time", "end_time"),
+                lambda f: f"Type: {f.type}, Duration: {(f.end_time - f.start_time).total_seconds() / 60:.0f} minutes"),
+    "notes": "notes",
+}
+
+SLEEP_FIELDS = {
+    "id": "id",
+    "start_time": "start_time",
+    "end_time": "end_time",
+    "wake_window": "wake_window",
+    "notes": "notes",
+}
+
+DIAPER_CHANGE_FIELDS = {
+    "id": "id",
+    "type": "type",
+    "time": "time",
+    "notes": "notes",
+}
+
+TUMMY_TIME_FIELDS = {
+    "id": "id",
+    "start_time": "start_time",
+    "end_time": "end_time",
+    "duration": "duration",
+    "notes": "notes",
+}
+
+TODO_FIELDS = {
+    "id": "id",
+    "time": (("time",), lambda t: utc_timestamp(t.time)),
+    "notes": "notes",
+    "completed": "completed",
+    "reminder_time": (("reminder_time",), lambda t: utc_timestamp(t.reminder_time)),
+}
+
+REMINDER_FIELDS = {
+    "id": "id",
+    "category": "category",
+    "reminder_time": "reminder_time",
+    "notified": (("notified",), lambda r: bool(r.notified)),
+}
+
+GROWTH_FIELDS = {
+    "id": "id",
+    "date": "date",
+    "weight": "weight",
+    "height": "height",
+    "head_circumference": "head_circumference",
+    "notes": "notes",
+}
+
+MILESTONE_FIELDS = {
+    "id": "id",
+    "milestone": "milestone",
+    "date": "date",
+    "notes": "notes",
+}
+
+RECORD_FIELDS = {
+    "feeding": FEEDING_FIELDS,
+    "sleep": SLEEP_FIELDS,
+    "diaper_change": DIAPER_CHANGE_FIELDS,
+    "tummy_time": TUMMY_TIME_FIELDS,
+    "todo": TODO_FIELDS,
+    "reminder": REMINDER_FIELDS,
+    "growth": GROWTH_FIELDS,
+    "milestone": MILESTONE_FIELDS,
+}
+
+def field_columns(spec):
+    return (spec,) if isinstance(spec, str) else spec[0]
+
+def compile_row_encoder(fields, names, columns):
+    """Build a function turning a row of ``columns`` into the dict of ``names`` fields.
+
+    Column positions are looked up once here, so plain fields are a tuple
+    index per row and only the computed fields cost a function call.
+    """
+    plain = [(name, columns.index(fields[name])) for name in names if isinstance(fields[name], str)]
+    computed = [(name, fields[name][1]) for name in names if not isinstance(fields[name], str)]
+
+    def encode(row):
+        record = {name: row[index] for name, index in plain}
+        for name, value in computed:
+            record[name] = value(row)
+        return record
+    return encode
+
+def select_records(model, fields, names, extra_columns=()):
+    """A Core select of the columns behind ``names`` and an encoder for its rows."""
+    columns = set(extra_columns)
+    for name in names:
+        columns.update(field_columns(fields[name]))
+    columns = sorted(columns)
+    query = db.select(*[model.__table__.c[column] for column in columns])
+    return query, compile_row_encoder(fields, names, columns)
+
+# Change events for /events
+#
+# Every committed change to a record type in SYNC_MODELS made through the
+# session becomes an event carrying the record's JSON as the GET endpoints
+# return it, captured when the change is flushed and published once the
+# transaction commits. Writes that bypass the session (like /batch) publish
+# their own. Within one process LocalBroker is enough; set
+# EVENT_BROKER=database to share events between workers.
+def event_hub():
+    return current_app.extensions['event_hub']
+
+def compile_object_encoder(fields, names=None):
+    """Like compile_row_encoder, but for an object with the columns as attributes.
+
+    E.g. a mapped object that was just flushed, or an archived row.
+    """
+    names = list(fields) if names is None else list(names)
+    columns = sorted({column for name in names for column in field_columns(fields[name])})
+    row_type = collections.namedtuple('Row', columns)
+    encode = compile_row_encoder(fields, names, columns)
+    return lambda obj: encode(row_type(*[getattr(obj, column) for column in columns]))
+
+OBJECT_ENCODERS = {record_type: compile_object_encoder(fields) for record_type, fields in RECORD_FIELDS.items()}
+SYNC_TYPES = {model: record_type for record_type, model in SYNC_MODELS.items()}
+
+def event_payload(record_type, action, record):
+    return orjson.dumps({"type": record_type, "action": action, "record": record},
+                        option=ORJSONProvider.options).decode('utf-8')
+
+@event.listens_for(Session, 'after_flush')
+def collect_record_events(session, flush_context):
+    for action, objs in (('created', session.new), ('updated', session.dirty), ('deleted', session.deleted)):
+        for obj in objs:
+            record_type = SYNC_TYPES.get(type(obj))
+            if record_type is None or not event_hub().wants(obj.user_id):
+                continue
+            if action == 'updated' and not session.is_modified(obj):
+                continue
+            events = session.info.setdefault('record_events', {})
+            previous = events.get((record_type, obj.id))
+            if action == 'updated' and previous and previous[1] == 'created':
+                # Still new as far as anyone outside this transaction knows
+                action = 'created'
+            record = {"id": obj.id} if action == 'deleted' else OBJECT_ENCODERS[record_type](obj)
+            events[(record_type, obj.id)] = (obj.user_id, action, record)
+
+@event.listens_for(Session, 'after_commit')
+def publish_record_events(session):
+    # Not for a savepoint, see bump_cache_versions
+    if session.in_nested_transaction():
+        return
+    events = session.info.pop('record_events', None)
+    if events:
+        publish_events([
+            (user_id, event_payload(record_type, action, record))
+            for (record_type, _), (user_id, action, record) in events.items()
+        ])
+
+@event.listens_for(Session, 'after_rollback')
+def discard_record_events(session):
+    if not session.in_nested_transaction():
+        session.info.pop('record_events', None)
+
+def publish_events(events):
+    # The change is already committed, so a broker failure only costs the
+    # streams this event
+    try:
+        event_hub().publish(events)
+    except Exception:
+        log.exception("Error publishing record events")
+
+def publish_created_records(user_id, ids_by_type):
+    """Publish ``created`` events for rows inserted without the session's unit of work."""
+    if not event_hub().wants(user_id):
+        return
+    events = []
+    for record_type, ids in ids_by_type.items():
+        if not ids:
+            continue
+        model = SYNC_MODELS[record_type]
+        fields = RECORD_FIELDS[record_type]
+        query, encode = select_records(model, fields, list(fields))
+        for row in db.session.execute(query.where(model.id.in_(ids)).order_by(model.id)):
+            events.append((user_id, event_payload(record_type, 'created', encode(row))))
+    publish_events(events)
+
+# Cold storage
+#
+# `flask archive` moves activity records older than ARCHIVE_AFTER_DAYS out of
+# the hot tables into per-user files under ARCHIVE_DIR (see cold_storage.py).
+# The list endpoints, the homepage feed, /calendar, /export, a full /sync,
+# the sleep analytics and the daily statistics merge them back in. Archived records are history: they can no
+# longer be updated or deleted, so the list endpoints, the homepage feed,
+# /calendar and /sync mark them with "read_only": true for the client to hide
+# its edit and delete buttons.
+ARCHIVE_SOURCES = {
+    "feeding": (Feeding, Feeding.start_time),
+    "sleep": (Sleep, Sleep.start_time),
+    "diaper_change": (DiaperChange, DiaperChange.time),
+    "tummy_time": (TummyTime, TummyTime.start_time),
+}
+ARCHIVE_DELETE_BATCH_SIZE = 500
+
+def archive_store():
+    return current_app.extensions['archive_store']
+
+@functools.lru_cache(maxsize=None)
+def archived_record_encoder(record_type, names, read_only=True):
+    encode = compile_object_encoder(RECORD_FIELDS[record_type], names)
+    if not read_only:
+        return encode
+
+    def encode_read_only(row):
+        record = encode(row)
+        record["read_only"] = True
+        return record
+    return encode_read_only
+
+def archive_records(cutoff):
+    """Move activity records from before ``cutoff`` into the users' archives.
+
+    A user's rows are written to their archive before they are deleted from
+    the hot tables. An interruption in between leaves them in both places,
+    and they show up twice until the next run archives them again. Returns
+    the number of rows moved per record type.
+    """
+    moved = dict.fromkeys(ARCHIVE_SOURCES, 0)
+    user_ids = set()
+    for model, time_column in ARCHIVE_SOURCES.values():
+        user_ids.update(db.session.execute(db.select(model.user_id).where(time_column < cutoff).distinct()).scalars())
+
+    for user_id in sorted(user_ids):
+        rows_by_type = {}
+        for record_type, (model, time_column) in ARCHIVE_SOURCES.items():
+            # SQLite hands out max(id) + 1 for new rows, so the newest row
+            # stays behind to keep archived ids from being reused
+            newest_id = db.session.execute(db.select(db.func.max(model.id))).scalar()
+            if newest_id is None:
+                rows_by_type[record_type] = []
+                continue
+            rows_by_type[record_type] = db.session.execute(db.select(model.__table__).where(
+                model.user_id == user_id,
+                time_column < cutoff,
+                model.id < newest_id
+            )).all()
+        if not any(rows_by_type.values()):
+            continue
+
+        archive_store().append(user_id, rows_by_type)
+        for record_type, rows in rows_by_type.items():
+            model = ARCHIVE_SOURCES[record_type][0]
+            ids = [row.id for row in rows]
+            for batch_start in range(0, len(ids), ARCHIVE_DELETE_BATCH_SIZE):
+                db.session.execute(db.delete(model).where(model.id.in_(ids[batch_start:batch_start + ARCHIVE_DELETE_BATCH_SIZE])))
+            moved[record_type] += len(ids)
+        mark_user_changed(user_id)
+        db.session.commit()
+    return moved
+
+@api.cli.command('archive')
+@click.option('--days', type=int, default=None, help="Archive records older than this many days (default: ARCHIVE_AFTER_DAYS).")
+def archive_command(days):
+    """Move old activity records into the per-user archive files."""
+    days = current_app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    moved = archive_records(utcnow() - datetime.timedelta(days=days))
+    for record_type, count in moved.items():
+        print(f"Archived {count} {record_type} records")
+
+# Filtering for the list endpoints
+#
+# Every list endpoint takes ``from``/``to`` (ISO dates or datetimes, ``to``
+# exclusive; a bare date for ``to`` includes that whole day), ``limit`` with a
+# keyset ``cursor`` from the X-Next-Cursor header of the previous page, and
+# ``fields`` (comma separated) to return only some of the fields.
+LIST_SOURCES = {
+    "feeding": (Feeding, Feeding.start_time, FEEDING_FIELDS),
+    "sleep": (Sleep, Sleep.start_time, SLEEP_FIELDS),
+    "diaper_change": (DiaperChange, DiaperChange.time, DIAPER_CHANGE_FIELDS),
+    "tummy_time": (TummyTime, TummyTime.start_time, TUMMY_TIME_FIELDS),
+    "todo": (Todo, Todo.time, TODO_FIELDS),
+    "growth": (Growth, Growth.date, GROWTH_FIELDS),
+    "milestone": (Milestone, Milestone.date, MILESTONE_FIELDS),
+}
+
+MAX_LIST_LIMIT = 1000
+
+def naive_utc(value):
+    """A datetime with a UTC offset as naive UTC, like the stored times; naive ones are left alone."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+def datetime_range_args():
+    """``from``/``to`` from the query string as a half-open [start, end) datetime range."""
+    start = end = None
+    if request.args.get('from'):
+        start = naive_utc(datetime.datetime.fromisoformat(request.args['from']))
+    if request.args.get('to'):
+        end = naive_utc(datetime.datetime.fromisoformat(request.args['to']))
+        if len(request.args['to']) == 10:
+            end += datetime.timedelta(days=1)
+    if start and end and start > end:
+        raise ValueError("from must not be after to")
+    return start, end
+
+def fields_arg(fields):
+    """Field names picked with ``fields=``, in the order the serializer uses."""
+    if not request.args.get('fields'):
+        return list(fields)
+    names = {name.strip() for name in request.args['fields'].split(',')}
+    unknown = names - fields.keys()
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [name for name in fields if name in names]
+
+def encode_list_cursor(time, record_id):
+    payload = json.dumps([time.isoformat(), record_id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_list_cursor(cursor):
+    time, record_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return datetime.datetime.fromisoformat(time), int(record_id)
+
+def list_records(user_id, record_type):
+    """Response for a list endpoint, newest first, filtered by the query string.
+
+    Only the columns behind the requested fields are selected, and the range
+    and cursor become predicates on the (user_id, time) index, so a page costs
+    the rows it returns rather than the user's whole history.
+    """
+    model, time_column, fields = LIST_SOURCES[record_type]
+    try:
+        start, end = datetime_range_args()
+        names = fields_arg(fields)
+        cursor = decode_list_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        limit = request.args.get('limit', type=int)
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid from, to, fields or cursor parameter"}), 400
+    if limit is not None:
+        limit = min(max(limit, 1), MAX_LIST_LIMIT)
+
+    if isinstance(time_column.type, db.Date):
+        # Growth and milestones are dated by day; a datetime bound counts from
+        # the start of its day, and a cursor from /growth is a bare date
+        start, end = (value.date() if value else None for value in (start, end))
+        if cursor:
+            cursor = (cursor[0].date(), cursor[1])
+
+    # id and the time column are always needed for the next cursor
+    query, encode = select_records(model, fields, names, extra_columns=("id", time_column.key))
+    query = query.where(model.user_id == user_id)
+
+    if start:
+        query = query.where(time_column >= start)
+    if end:
+        query = query.where(time_column < end)
+    if cursor:
+        cursor_time, cursor_id = cursor
+        query = query.where(db.or_(
+            time_column < cursor_time,
+            db.and_(time_column == cursor_time, model.id < cursor_id)
+        ))
+    query = query.order_by(time_column.desc(), model.id.desc())
+    if limit is not None:
+        # One extra row tells us whether there is another page
+        query = query.limit(limit + 1)
+
+    time_key = time_column.key
+    records = [(getattr(row, time_key), row.id, encode(row)) for row in db.session.execute(query)]
+    if record_type in ARCHIVE_SOURCES:
+        # The archive is sorted the same way, so it also only decodes the
+        # rows that could make the page
+        encode_archived = archived_record_encoder(record_type, tuple(names))
+        archived = archive_store().iter_records(user_id, record_type, start, end, before=cursor,
+                                              limit=None if limit is None else limit + 1, descending=True)
+        records.extend((getattr(row, time_key), row.id, encode_archived(row)) for row in archived)
+        records.sort(key=lambda record: record[:2], reverse=True)
+
+    next_cursor = None
+    if limit is not None and len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_list_cursor(*records[-1][:2])
+
+    response = jsonify([record for _, _, record in records])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 # API Endpoints
 
-@app.route('/debug-tokens/<int:user_id>', methods=['GET'])
+@api.route('/debug-tokens/<int:user_id>', methods=['GET'])
 def debug_tokens(user_id):
     tokens = FCMToken.query.filter_by(user_id=user_id).all()
     return jsonify([{"token": t.token, "platform": t.platform} for t in tokens])
 
-@app.route('/delete-token', methods=['POST'])
+@api.route('/delete-token', methods=['POST'])
 def delete_token():
     data = request.json
     token = data.get('token')
     if not token:
         return jsonify({"error": "Missing token"}), 400
 
+    owners = [t.user_id for t in FCMToken.query.filter_by(token=token).all()]
     deleted = FCMToken.query.filter_by(token=token).delete()
     db.session.commit()
+    fcm_token_cache().invalidate(owners)
     return jsonify({"message": f"Deleted {deleted} token(s)"}), 200
 
 
-@app.route('/test-reminders/<int:user_id>', methods=['POST'])
+@api.route('/test-reminders/<int:user_id>', methods=['POST'])
 def test_reminders(user_id):
     # Find all FCM tokens for this user
     tokens = FCMToken.query.filter_by(user_id=user_id).all()
@@ -187,48 +1210,61 @@ def test_reminders(user_id):
         return jsonify({"message": "No FCM tokens found for this user"}), 404
     
     # Send a test notification to all user's devices
-    success_count = 0
-    for token_entry in tokens:
-        try:
-            message = messaging.Message(
-                token=token_entry.token,
-                notification=messaging.Notification(
-                    title="Test Reminder",
-                    body="This is a test reminder notification"
-                ),
-                data={
-                    "type": "test",
-                    "id": "test-123"
-                }
-            )
-            response = messaging.send(message)
-            print(f"[✅] Test reminder sent to user {user_id} token: {token_entry.token}")
-            success_count += 1
-        except Exception as e:
-            print(f"[❌] Error sending test reminder: {e}")
+    result = dispatch_notifications([Notification(
+        'test',
+        [token_entry.token for token_entry in tokens],
+        "Test Reminder",
+        "This is a test reminder notification",
+        {"type": "test", "id": "test-123"}
+    )])
+    db.session.commit()
+    success_count = result.sent
     
     return jsonify({
         "message": f"Test notifications sent to {success_count} of {len(tokens)} devices"
     }), 200
 
-@app.route('/register', methods=['POST'])
+# BCRYPT_LOG_ROUNDS fixes the cost of new password hashes; without it the
+# cost is calibrated so one hash takes about BCRYPT_TARGET_MS, but never
+# below 12.
+def password_hasher():
+    return current_app.extensions['password_hasher']
+
+def password_hasher_busy():
+    return jsonify({"message": "Too many sign-ins right now, please try again shortly"}), 503, {"Retry-After": "2"}
+
+@api.route('/register', methods=['POST'])
 def register():
     data = request.json
-    hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+    try:
+        hashed_password = password_hasher().hash(data['password'])
+    except (HashingBusy, HashingTimeout):
+        return password_hasher_busy()
     new_user = User(name=data['name'], email=data['email'], password=hashed_password)
     db.session.add(new_user)
     db.session.commit()
     return jsonify({"message": "User registered successfully!"}), 201
 
-@app.route('/login', methods=['POST'])
+@api.route('/login', methods=['POST'])
 def login():
     data = request.json
     email = data['email']
     password = data['password']
 
     user = User.query.filter_by(email=email).first()
+    try:
+        valid = user is not None and password_hasher().check(user.password, password)
+    except (HashingBusy, HashingTimeout):
+        return password_hasher_busy()
 
-    if user and bcrypt.check_password_hash(user.password, password):
+    if valid:
+        if password_hasher().needs_rehash(user.password):
+            # Hashes made at a lower cost are upgraded on the next sign-in
+            try:
+                user.password = password_hasher().hash(password)
+                db.session.commit()
+            except (HashingBusy, HashingTimeout):
+                pass
         return jsonify({
             "message": "Login successful!",
             "user_id": user.id,
@@ -239,39 +1275,23 @@ def login():
         return jsonify({"message": "Invalid email or password"}), 401
         
 
-@app.route('/feeding/<int:user_id>', methods=['POST'])
+@api.route('/feeding/<int:user_id>', methods=['POST'])
 def add_feeding(user_id):
-    data = request.json
-    new_feeding = Feeding(
-        user_id=user_id,
-        type=data['type'],
-        left_breast_duration=data.get('left_breast_duration'),
-        right_breast_duration=data.get('right_breast_duration'),
-        bottle_amount=data.get('bottle_amount'),
-        start_time=datetime.datetime.fromisoformat(data['start_time']),
-        end_time=datetime.datetime.fromisoformat(data['end_time']),
-        notes=data.get('notes')
-    )
-    db.session.add(new_feeding)
-    db.session.commit()
+    values = parse_feeding(request.json)
+
+    def write():
+        db.session.add(Feeding(user_id=user_id, **values))
+        refresh_daily_stats(user_id, 'feeding', [values['start_time']])
+
+    commit_write(write)
     return jsonify({"message": "Feeding record added!"}), 201
 
-@app.route('/feeding/<int:user_id>', methods=['GET'])
+@api.route('/feeding/<int:user_id>', methods=['GET'])
+@cached_response
 def get_feeding_data(user_id):
-    feedings = Feeding.query.filter_by(user_id=user_id).order_by(Feeding.start_time.desc()).all()
-    return jsonify([{
-        "id": f.id,
-        "type": f.type,
-        "start_time": f.start_time.isoformat(),
-        "end_time": f.end_time.isoformat(),
-        "left_breast_duration": f.left_breast_duration,
-        "right_breast_duration": f.right_breast_duration,
-        "bottle_amount": f.bottle_amount,
-        "details": f"Type: {f.type}, Duration: {(f.end_time - f.start_time).total_seconds() / 60:.0f} minutes",
-        "notes": f.notes
-    } for f in feedings])
-
-@app.route('/feeding/<int:user_id>', methods=['DELETE'])
+    return list_records(user_id, 'feeding')
+
+@api.route('/feeding/<int:user_id>', methods=['DELETE'])
 def delete_feeding(user_id):
 
     feeding = Feeding.query.filter_by(id=user_id).first()
@@ -279,344 +1299,1152 @@ def delete_feeding(user_id):
         return jsonify({"error": "Feeding not found"}), 404
 
     db.session.delete(feeding)
+    db.session.add(Tombstone(user_id=feeding.user_id, record_type='feeding', record_id=feeding.id))
+    refresh_daily_stats(feeding.user_id, 'feeding', [feeding.start_time])
     db.session.commit()
     return jsonify({"message": "Feeding deleted successfully"}), 200
 
-@app.route('/feeding/<int:user_id>', methods=['PUT'])
+@api.route('/feeding/<int:user_id>', methods=['PUT'])
 def update_feeding(user_id):
     data = request.json
-    feeding = Feeding.query.filter_by(id=user_id).first()
-    if not feeding:
-        return jsonify({"error": "Feeding not found"}), 404
 
-    # Update the feeding record with new data
-    if 'type' in data:
-        feeding.type = data['type']
-    if 'left_breast_duration' in data:
-        feeding.left_breast_duration = data['left_breast_duration']
-    if 'right_breast_duration' in data:
-        feeding.right_breast_duration = data['right_breast_duration']
-    if 'bottle_amount' in data:
-        feeding.bottle_amount = data['bottle_amount']
-    if 'start_time' in data:
-        feeding.start_time = datetime.datetime.fromisoformat(data['start_time'])
-    if 'end_time' in data:
-        feeding.end_time = datetime.datetime.fromisoformat(data['end_time'])
-    if 'notes' in data:
-        feeding.notes = data.get('notes')
-
-    db.session.commit()
+    def write():
+        feeding = Feeding.query.filter_by(id=user_id).first()
+        if not feeding:
+            return False
+        previous_start_time = feeding.start_time
+
+        # Update the feeding record with new data
+        if 'type' in data:
+            feeding.type = data['type']
+        if 'left_breast_duration' in data:
+            feeding.left_breast_duration = data['left_breast_duration']
+        if 'right_breast_duration' in data:
+            feeding.right_breast_duration = data['right_breast_duration']
+        if 'bottle_amount' in data:
+            feeding.bottle_amount = data['bottle_amount']
+        if 'start_time' in data:
+            feeding.start_time = datetime.datetime.fromisoformat(data['start_time'])
+        if 'end_time' in data:
+            feeding.end_time = datetime.datetime.fromisoformat(data['end_time'])
+        if 'notes' in data:
+            feeding.notes = data.get('notes')
+
+        refresh_daily_stats(feeding.user_id, 'feeding', [previous_start_time, feeding.start_time])
+        return True
+
+    if not commit_write(write):
+        return jsonify({"error": "Feeding not found"}), 404
     return jsonify({"message": "Feeding updated successfully"}), 200
     
     
 
-@app.route('/sleeping/<int:user_id>', methods=['POST'])
+@api.route('/sleeping/<int:user_id>', methods=['POST'])
 def add_sleep(user_id):
     data = request.json
     start_time = datetime.datetime.fromisoformat(data['start_time'])
     end_time = datetime.datetime.fromisoformat(data['end_time'])
 
+    # The wake window depends on the previous sleep, so it is worked out in
+    # the same transaction as the insert
+    def write():
+        last_sleep = Sleep.query.filter_by(user_id=user_id).order_by(Sleep.end_time.desc()).first()
+        wake_window = None
+        if last_sleep:
+            wake_window = int((start_time - last_sleep.end_time).total_seconds() / 60)
+
+        new_sleep = Sleep(
+            user_id=user_id,
+            start_time=start_time,
+            end_time=end_time,
+            wake_window=wake_window,
+            notes=data.get('notes')
+        )
+        db.session.add(new_sleep)
+        refresh_daily_stats(user_id, 'sleep', [start_time])
+        return wake_window
 
-    last_sleep = Sleep.query.filter_by(user_id=user_id).order_by(Sleep.end_time.desc()).first()
-    wake_window = None
-    if last_sleep:
-        wake_window = int((start_time - last_sleep.end_time).total_seconds() / 60)
-
-    new_sleep = Sleep(
-        user_id=user_id,
-        start_time=start_time,
-        end_time=end_time,
-        wake_window=wake_window,
-        notes=data.get('notes')
-    )
-    db.session.add(new_sleep)
-    db.session.commit()
+    wake_window = commit_write(write)
     return jsonify({"message": "Sleep record added!", "wake_window": wake_window}), 201
 
-@app.route('/sleeping/<int:user_id>', methods=['GET'])
+@api.route('/sleeping/<int:user_id>', methods=['GET'])
+@cached_response
 def get_sleep_data(user_id):
-    sleep_data = Sleep.query.filter_by(user_id=user_id).order_by(Sleep.start_time.desc()).all()
-    return jsonify([{
-        "id": s.id,
-        "start_time": s.start_time.isoformat(),
-        "end_time": s.end_time.isoformat(),
-        "wake_window": s.wake_window,
-        "notes": s.notes
-    } for s in sleep_data])
-
-@app.route('/sleeping/<int:user_id>', methods=['DELETE'])
+    return list_records(user_id, 'sleep')
+
+@api.route('/sleeping/<int:user_id>', methods=['DELETE'])
 def delete_sleep(user_id):
     sleep_data = Sleep.query.filter_by(id=user_id).first()
     if not sleep_data:
         return jsonify({"error": "Sleep data not found"}), 404
 
     db.session.delete(sleep_data)
+    db.session.add(Tombstone(user_id=sleep_data.user_id, record_type='sleep', record_id=sleep_data.id))
+    refresh_daily_stats(sleep_data.user_id, 'sleep', [sleep_data.start_time])
     db.session.commit()
     return jsonify({"message": "Sleep data deleted successfully"}), 200
 
-@app.route('/sleeping/<int:user_id>', methods=['PUT'])
+@api.route('/sleeping/<int:user_id>', methods=['PUT'])
 def update_sleep(user_id):
     data = request.json
-    sleep_data = Sleep.query.filter_by(id=user_id).first()
-    if not sleep_data:
-        return jsonify({"error": "Sleep data not found"}), 404
-
-    # Update the sleep record with new data
-    if 'start_time' in data:
-        sleep_data.start_time = datetime.datetime.fromisoformat(data['start_time'])
-    if 'end_time' in data:
-        sleep_data.end_time = datetime.datetime.fromisoformat(data['end_time'])
-    if 'notes' in data:
-        sleep_data.notes = data.get('notes')
-    
-    # Recalculate wake window if needed
-    if 'start_time' in data and sleep_data.user_id:
-        last_sleep = Sleep.query.filter(
-            Sleep.user_id == sleep_data.user_id,
-            Sleep.end_time < sleep_data.start_time
-        ).order_by(Sleep.end_time.desc()).first()
-        
-        if last_sleep:
-            sleep_data.wake_window = int((sleep_data.start_time - last_sleep.end_time).total_seconds() / 60)
 
-    db.session.commit()
+    def write():
+        sleep_data = Sleep.query.filter_by(id=user_id).first()
+        if not sleep_data:
+            return False
+        previous_start_time = sleep_data.start_time
+
+        # Update the sleep record with new data
+        if 'start_time' in data:
+            sleep_data.start_time = datetime.datetime.fromisoformat(data['start_time'])
+        if 'end_time' in data:
+            sleep_data.end_time = datetime.datetime.fromisoformat(data['end_time'])
+        if 'notes' in data:
+            sleep_data.notes = data.get('notes')
+
+        # Recalculate wake window if needed
+        if 'start_time' in data and sleep_data.user_id:
+            last_sleep = Sleep.query.filter(
+                Sleep.user_id == sleep_data.user_id,
+                Sleep.end_time < sleep_data.start_time
+            ).order_by(Sleep.end_time.desc()).first()
+
+            if last_sleep:
+                sleep_data.wake_window = int((sleep_data.start_time - last_sleep.end_time).total_seconds() / 60)
+
+        refresh_daily_stats(sleep_data.user_id, 'sleep', [previous_start_time, sleep_data.start_time])
+        return True
+
+    if not commit_write(write):
+        return jsonify({"error": "Sleep data not found"}), 404
     return jsonify({"message": "Sleep data updated successfully"}), 200
 
-@app.route('/diaper-change/<int:user_id>', methods=['GET'])
+@api.route('/diaper-change/<int:user_id>', methods=['GET'])
+@cached_response
 def get_diaper_change_data(user_id):
-    diaper_change_data = DiaperChange.query.filter_by(user_id=user_id).order_by(DiaperChange.time.desc()).all()
-    return jsonify([{
-        "id": d.id,
-        "type": d.type,
-        "time": d.time.isoformat(),
-        "notes": d.notes
-    } for d in diaper_change_data])
-
-@app.route('/diaper-change/<int:user_id>', methods=['POST'])
+    return list_records(user_id, 'diaper_change')
+
+@api.route('/diaper-change/<int:user_id>', methods=['POST'])
 def add_diaper_change(user_id):
-    data = request.json
-    new_diaper_change = DiaperChange(
-        user_id=user_id,
-        type=data['type'],
-        time=datetime.datetime.fromisoformat(data['time']),
-        notes=data.get('notes')
-    )
-    db.session.add(new_diaper_change)
-    db.session.commit()
+    values = parse_diaper_change(request.json)
+
+    def write():
+        db.session.add(DiaperChange(user_id=user_id, **values))
+        refresh_daily_stats(user_id, 'diaper_change', [values['time']])
+
+    commit_write(write)
     return jsonify({"message": "Diaper change record added!"}), 201
 
-@app.route('/diaper-change/<int:user_id>', methods=['DELETE'])
+@api.route('/diaper-change/<int:user_id>', methods=['DELETE'])
 def delete_diaper_change(user_id):
     diaper_change = DiaperChange.query.filter_by(id=user_id).first()
     if not diaper_change:
         return jsonify({"error": "Diaper change not found"}), 404
 
     db.session.delete(diaper_change)
+    db.session.add(Tombstone(user_id=diaper_change.user_id, record_type='diaper_change', record_id=diaper_change.id))
+    refresh_daily_stats(diaper_change.user_id, 'diaper_change', [diaper_change.time])
     db.session.commit()
     return jsonify({"message": "Diaper change deleted successfully"}), 200
 
-@app.route('/diaper-change/<int:user_id>', methods=['PUT'])
+@api.route('/diaper-change/<int:user_id>', methods=['PUT'])
 def update_diaper_change(user_id):
     data = request.json
-    diaper_change = DiaperChange.query.filter_by(id=user_id).first()
-    if not diaper_change:
-        return jsonify({"error": "Diaper change not found"}), 404
 
-    # Update the diaper change record with new data
-    if 'type' in data:
-        diaper_change.type = data['type']
-    if 'time' in data:
-        diaper_change.time = datetime.datetime.fromisoformat(data['time'])
-    if 'notes' in data:
-        diaper_change.notes = data.get('notes')
+    def write():
+        diaper_change = DiaperChange.query.filter_by(id=user_id).first()
+        if not diaper_change:
+            return False
+        previous_time = diaper_change.time
 
-    db.session.commit()
+        # Update the diaper change record with new data
+        if 'type' in data:
+            diaper_change.type = data['type']
+        if 'time' in data:
+            diaper_change.time = datetime.datetime.fromisoformat(data['time'])
+        if 'notes' in data:
+            diaper_change.notes = data.get('notes')
+
+        refresh_daily_stats(diaper_change.user_id, 'diaper_change', [previous_time, diaper_change.time])
+        return True
+
+    if not commit_write(write):
+        return jsonify({"error": "Diaper change not found"}), 404
     return jsonify({"message": "Diaper change updated successfully"}), 200
 
-@app.route('/todo/<int:user_id>', methods=['GET'])
+@api.route('/todo/<int:user_id>', methods=['GET'])
+@cached_response
 def get_todo_list(user_id):
-    todos = Todo.query.filter_by(user_id=user_id).order_by(Todo.time.desc()).all()
-    return jsonify([{
-        "id": t.id,
-        "time": t.time.replace(tzinfo=datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
-        "notes": t.notes,
-        "completed": t.completed,
-        "reminder_time": t.reminder_time.replace(tzinfo=datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ") if t.reminder_time else None
-    } for t in todos])
-
-@app.route('/todo/<int:user_id>', methods=['POST'])
+    return list_records(user_id, 'todo')
+
+@api.route('/todo/<int:user_id>', methods=['POST'])
 def add_task(user_id):
     data = request.json
     reminder_time = data.get('reminder_time')
     
-    # Print the reminder time for debugging
-    if reminder_time:
-        print(f"[DEBUG] New todo with reminder at: {reminder_time}")
+    if reminder_time and log.isEnabledFor(logging.DEBUG):
         parsed_time = datetime.datetime.fromisoformat(reminder_time)
         now = datetime.datetime.now(datetime.timezone.utc)
         seconds_until_reminder = (parsed_time.replace(tzinfo=datetime.timezone.utc) - now).total_seconds()
-        print(f"[DEBUG] Seconds until reminder: {seconds_until_reminder}")
-    
-    new_task = Todo(
-        user_id=user_id,
-        time=datetime.datetime.fromisoformat(data['time']).replace(tzinfo=datetime.timezone.utc),
-        notes=data.get('notes'),
-        reminder_time=datetime.datetime.fromisoformat(reminder_time).replace(tzinfo=datetime.timezone.utc) if reminder_time else None
-    )
-    db.session.add(new_task)
-    db.session.commit()
+        log.debug("New todo with reminder", extra={
+            "user_id": user_id,
+            "reminder_time": reminder_time,
+            "seconds_until_reminder": seconds_until_reminder
+        })
+
+    values = parse_todo(data)
+
+    def write():
+        new_task = Todo(user_id=user_id, **values)
+        db.session.add(new_task)
+        db.session.flush()
+        return todo_reminder(new_task)
+
+    schedule_todo_reminder(*commit_write(write))
     return jsonify({"message": "task record added!"}), 201
 
-@app.route('/todo/<int:user_id>', methods=['DELETE'])
+@api.route('/todo/<int:user_id>', methods=['DELETE'])
 def remove_task(user_id):
     todo = Todo.query.filter_by(id=user_id).first()
     if not todo:
         return jsonify({"message": "Todo not found"}), 404
     
     db.session.delete(todo)
+    db.session.add(Tombstone(user_id=todo.user_id, record_type='todo', record_id=todo.id))
     db.session.commit()
+    reminder_scheduler().cancel(('todo', user_id))
     return jsonify({"message": "Todo deleted successfully"}), 200
 
-@app.route('/todo/<int:todo_id>', methods=['PUT'])
+@api.route('/todo/<int:todo_id>', methods=['PUT'])
 def update_todo(todo_id):
     data = request.json
-    todo = Todo.query.filter_by(id=todo_id).first()
-    if not todo:
-        return jsonify({"error": "Todo not found"}), 404
 
-    # Update the todo record with new data
-    if 'time' in data:
-        todo.time = datetime.datetime.fromisoformat(data['time']).replace(tzinfo=datetime.timezone.utc)
-    if 'notes' in data:
-        todo.notes = data.get('notes')
-    if 'completed' in data:
-        todo.completed = data['completed']
-    if 'reminder_time' in data:
-        reminder_time = data.get('reminder_time')
-        todo.reminder_time = datetime.datetime.fromisoformat(reminder_time).replace(tzinfo=datetime.timezone.utc) if reminder_time else None
-        # Reset the notified flag when reminder time is updated
-        todo.reminder_notified = False
-
-    db.session.commit()
+    def write():
+        todo = Todo.query.filter_by(id=todo_id).first()
+        if not todo:
+            return None
+
+        # Update the todo record with new data
+        if 'time' in data:
+            todo.time = datetime.datetime.fromisoformat(data['time']).replace(tzinfo=datetime.timezone.utc)
+        if 'notes' in data:
+            todo.notes = data.get('notes')
+        if 'completed' in data:
+            todo.completed = data['completed']
+        if 'reminder_time' in data:
+            reminder_time = data.get('reminder_time')
+            todo.reminder_time = datetime.datetime.fromisoformat(reminder_time).replace(tzinfo=datetime.timezone.utc) if reminder_time else None
+            # Reset the notified flag when reminder time is updated
+            todo.reminder_notified = False
+        return todo_reminder(todo)
+
+    reminder = commit_write(write)
+    if not reminder:
+        return jsonify({"error": "Todo not found"}), 404
+    schedule_todo_reminder(*reminder)
     return jsonify({"message": "Todo updated successfully"}), 200
 
-@app.route('/todo/<int:todo_id>/toggle', methods=['PATCH'])
+@api.route('/todo/<int:todo_id>/toggle', methods=['PATCH'])
 def toggle_todo(todo_id):
     try:
         todo = Todo.query.get_or_404(todo_id)
         todo.completed = not todo.completed
         db.session.commit()
+        schedule_todo_reminder(*todo_reminder(todo))
         return jsonify({
             'success': True,
             'completed': todo.completed
         }), 200
-    except Exception as e:
-        print(f"Error toggling todo: {e}")  # Add debugging
+    except Exception:
+        log.exception("Error toggling todo", extra={"todo_id": todo_id})
         db.session.rollback()
         return jsonify({'success': False}), 500
 
-@app.route('/tummy-time/<int:user_id>', methods=['POST'])
+@api.route('/tummy-time/<int:user_id>', methods=['POST'])
 def add_tummy_time(user_id):
-    data = request.json
-    start_time = datetime.datetime.fromisoformat(data['start_time'])
-    end_time = datetime.datetime.fromisoformat(data['end_time'])
-    duration = int((end_time - start_time).total_seconds() / 60)
-
-    tummy_time = TummyTime(
-        user_id=user_id,
-        start_time=start_time,
-        end_time=end_time,
-        duration=duration,
-        notes=data.get('notes')
-    )
-    db.session.add(tummy_time)
-    db.session.commit()
+    values = parse_tummy_time(request.json)
+
+    def write():
+        db.session.add(TummyTime(user_id=user_id, **values))
+        refresh_daily_stats(user_id, 'tummy_time', [values['start_time']])
+
+    commit_write(write)
     return jsonify({"message": "Tummy Time session recorded!"}), 201
 
-@app.route('/tummy-time/<int:user_id>', methods=['GET'])
+@api.route('/tummy-time/<int:user_id>', methods=['GET'])
+@cached_response
 def get_tummy_time_data(user_id):
-    tummy_time_data = TummyTime.query.filter_by(user_id=user_id).order_by(TummyTime.start_time.desc()).all()
-    return jsonify([{
-        "id": t.id,
-        "start_time": t.start_time.isoformat(),
-        "end_time": t.end_time.isoformat(),
-        "duration": t.duration,
-        "notes": t.notes
-    } for t in tummy_time_data])
-
-@app.route('/tummy-time/<int:user_id>', methods=['DELETE'])
+    return list_records(user_id, 'tummy_time')
+
+@api.route('/tummy-time/<int:user_id>', methods=['DELETE'])
 def delete_tummy_time(user_id):
     tummy_time = TummyTime.query.filter_by(id=user_id).first()
     if not tummy_time:
         return jsonify({"error": "Tummy time not found"}), 404
 
     db.session.delete(tummy_time)
+    db.session.add(Tombstone(user_id=tummy_time.user_id, record_type='tummy_time', record_id=tummy_time.id))
+    refresh_daily_stats(tummy_time.user_id, 'tummy_time', [tummy_time.start_time])
     db.session.commit()
     return jsonify({"message": "Tummy time deleted successfully"}), 200
 
-@app.route('/calendar/<int:user_id>', methods=['GET'])
+@api.route('/growth/<int:user_id>', methods=['POST'])
+def add_growth(user_id):
+    values = parse_growth(request.json)
+
+    def write():
+        growth = Growth(user_id=user_id, **values)
+        db.session.add(growth)
+        db.session.flush()
+        return growth.id
+
+    return jsonify({"message": "Growth measurement recorded!", "id": commit_write(write)}), 201
+
+@api.route('/growth/<int:user_id>', methods=['GET'])
+@cached_response
+def get_growth_data(user_id):
+    return list_records(user_id, 'growth')
+
+@api.route('/growth/<int:user_id>', methods=['DELETE'])
+def delete_growth(user_id):
+    growth = Growth.query.filter_by(id=user_id).first()
+    if not growth:
+        return jsonify({"error": "Growth measurement not found"}), 404
+
+    db.session.delete(growth)
+    db.session.add(Tombstone(user_id=growth.user_id, record_type='growth', record_id=growth.id))
+    db.session.commit()
+    return jsonify({"message": "Growth measurement deleted successfully"}), 200
+
+@api.route('/growth/<int:user_id>', methods=['PUT'])
+def update_growth(user_id):
+    data = request.json
+
+    def write():
+        growth = Growth.query.filter_by(id=user_id).first()
+        if not growth:
+            return False
+        if 'date' in data:
+            growth.date = datetime.date.fromisoformat(data['date'][:10])
+        for name in ('weight', 'height', 'head_circumference', 'notes'):
+            if name in data:
+                setattr(growth, name, data[name])
+        return True
+
+    if not commit_write(write):
+        return jsonify({"error": "Growth measurement not found"}), 404
+    return jsonify({"message": "Growth measurement updated successfully"}), 200
+
+# Measurement column -> WHO indicator. Height is compared with length for
+# length for age, which switches from lying to standing at two years.
+GROWTH_INDICATORS = {
+    "weight": "weight",
+    "height": "length",
+    "head_circumference": "head_circumference",
+}
+
+@api.route('/growth/<int:user_id>/percentiles', methods=['GET'])
+@cached_response
+def get_growth_percentiles(user_id):
+    """WHO z-scores and percentiles for every growth measurement of the user.
+
+    Takes the baby's ``sex`` (male or female) and ``birth_date``. Each
+    indicator is scored for the whole history in one call; measurements that
+    are missing or outside the 0 to 5 year range of the standards get null.
+    """
+    sex = request.args.get('sex')
+    try:
+        birth_date = datetime.date.fromisoformat(request.args.get('birth_date', ''))
+    except ValueError:
+        birth_date = None
+    if sex not in growth_standards.SEXES or birth_date is None:
+        return jsonify({"error": "sex (male or female) and birth_date (YYYY-MM-DD) are required"}), 400
+
+    rows = db.session.execute(
+        db.select(Growth.id, Growth.date, *[Growth.__table__.c[column] for column in GROWTH_INDICATORS])
+        .where(Growth.user_id == user_id)
+        .order_by(Growth.date, Growth.id)
+    ).all()
+
+    ages = np.array([(row.date - birth_date).days for row in rows], dtype=np.int64)
+    reference = growth_standards.reference()
+    scores = {}
+    for column, indicator in GROWTH_INDICATORS.items():
+        values = np.array([getattr(row, column) for row in rows], dtype=np.float64)
+        z = reference.z_scores(indicator, sex, ages, values)
+        percentiles = growth_standards.normal_cdf(z) * 100
+        # NaN is not JSON, so unknown scores become null
+        scores[column] = (
+            np.where(np.isnan(z), None, np.round(z, 2)).tolist(),
+            np.where(np.isnan(percentiles), None, np.round(percentiles, 1)).tolist(),
+        )
+
+    measurements = []
+    for i, row in enumerate(rows):
+        measurement = {"id": row.id, "date": row.date, "age_days": int(ages[i])}
+        for column, (z, percentiles) in scores.items():
+            measurement[column] = {"value": getattr(row, column), "z_score": z[i], "percentile": percentiles[i]}
+        measurements.append(measurement)
+    return jsonify({"sex": sex, "birth_date": birth_date, "measurements": measurements}), 200
+
+@api.route('/milestone/<int:user_id>', methods=['POST'])
+def add_milestone(user_id):
+    values = parse_milestone(request.json)
+
+    def write():
+        milestone = Milestone(user_id=user_id, **values)
+        db.session.add(milestone)
+        db.session.flush()
+        return milestone.id
+
+    return jsonify({"message": "Milestone recorded!", "id": commit_write(write)}), 201
+
+@api.route('/milestone/<int:user_id>', methods=['GET'])
+@cached_response
+def get_milestones(user_id):
+    return list_records(user_id, 'milestone')
+
+@api.route('/milestone/<int:user_id>', methods=['DELETE'])
+def delete_milestone(user_id):
+    milestone = Milestone.query.filter_by(id=user_id).first()
+    if not milestone:
+        return jsonify({"error": "Milestone not found"}), 404
+
+    db.session.delete(milestone)
+    db.session.add(Tombstone(user_id=milestone.user_id, record_type='milestone', record_id=milestone.id))
+    db.session.commit()
+    return jsonify({"message": "Milestone deleted successfully"}), 200
+
+@api.route('/milestone/<int:user_id>', methods=['PUT'])
+def update_milestone(user_id):
+    data = request.json
+
+    def write():
+        milestone = Milestone.query.filter_by(id=user_id).first()
+        if not milestone:
+            return False
+        if 'milestone' in data:
+            milestone.milestone = data['milestone']
+        if 'date' in data:
+            milestone.date = datetime.date.fromisoformat(data['date'][:10])
+        if 'notes' in data:
+            milestone.notes = data.get('notes')
+        return True
+
+    if not commit_write(write):
+        return jsonify({"error": "Milestone not found"}), 404
+    return jsonify({"message": "Milestone updated successfully"}), 200
+
+# Record types accepted by /batch, in the order they are inserted
+BATCH_TYPES = {
+    "feeding": (Feeding, parse_feeding),
+    "sleep": (Sleep, parse_sleep),
+    "diaper_change": (DiaperChange, parse_diaper_change),
+    "tummy_time": (TummyTime, parse_tummy_time),
+    "todo": (Todo, parse_todo),
+}
+
+MAX_BATCH_ITEMS = 1000
+
+def batch_wake_windows(user_id, sleeps):
+    """Fill in wake_window for a batch of new sleep mappings.
+
+    The wake window is measured from the latest sleep (stored or in the batch)
+    that ended before each sleep started, so the order of the batch doesn't matter.
+    """
+    first_start = min(sleep['start_time'] for sleep in sleeps)
+    last_start = max(sleep['start_time'] for sleep in sleeps)
+
+    previous_end = db.session.execute(
+        db.select(db.func.max(Sleep.end_time)).where(Sleep.user_id == user_id, Sleep.end_time < first_start)
+    ).scalar()
+    # Stored sleeps that ended between that one and the last sleep in the batch
+    end_times = [sleep['end_time'] for sleep in sleeps]
+    end_times.extend(db.session.execute(
+        db.select(Sleep.end_time).where(
+            Sleep.user_id == user_id,
+            Sleep.end_time >= (previous_end or first_start),
+            Sleep.end_time < last_start
+        )
+    ).scalars())
+    end_times.sort()
+
+    for sleep in sorted(sleeps, key=lambda sleep: sleep['start_time']):
+        position = bisect.bisect_left(end_times, sleep['start_time'])
+        if position:
+            sleep['wake_window'] = int((sleep['start_time'] - end_times[position - 1]).total_seconds() / 60)
+        else:
+            sleep['wake_window'] = None
+
+@api.route('/batch/<int:user_id>', methods=['POST'])
+def add_batch(user_id):
+    """Insert a mixed list of activity records in one transaction.
+
+    Each item looks like ``{"type": "feeding", "idempotency_key": "...", "data": {...}}``
+    where ``data`` is what the single record POST endpoint accepts. Items whose
+    idempotency key was already used return the id of the existing record.
+    """
+    items = request.json
+    if not isinstance(items, list):
+        return jsonify({"error": "Expected a list of records"}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"A batch can hold at most {MAX_BATCH_ITEMS} records"}), 400
+    for index, item in enumerate(items):
+        if isinstance(item, dict) and not isinstance(item.get('idempotency_key') or "", str):
+            return jsonify({"error": f"idempotency_key of item {index} must be a string"}), 400
+
+    keys = [item.get('idempotency_key') for item in items if isinstance(item, dict) and item.get('idempotency_key')]
+    seen_keys = {
+        k.key: (k.record_type, k.record_id)
+        for k in IdempotencyKey.query.filter(IdempotencyKey.user_id == user_id, IdempotencyKey.key.in_(keys)).all()
+    } if keys else {}
+
+    results = [None] * len(items)
+    mappings = {record_type: [] for record_type in BATCH_TYPES}
+    pending_keys = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or item.get('type') not in BATCH_TYPES:
+            results[index] = {"index": index, "status": "error", "error": "Unknown record type"}
+            continue
+
+        key = item.get('idempotency_key')
+        if key in seen_keys:
+            record_type, record_id = seen_keys[key]
+            results[index] = {"index": index, "status": "duplicate", "type": record_type, "id": record_id}
+            continue
+        if key in pending_keys:
+            results[index] = {"index": index, "status": "duplicate", "type": item['type'], "duplicate_of": pending_keys[key]}
+            continue
+
+        model, parse = BATCH_TYPES[item['type']]
+        try:
+            mapping = parse(item.get('data') or {})
+        except KeyError as e:
+            results[index] = {"index": index, "status": "error", "error": f"Missing field {e}"}
+            continue
+        except (ValueError, TypeError) as e:
+            results[index] = {"index": index, "status": "error", "error": str(e)}
+            continue
+
+        mapping['user_id'] = user_id
+        mappings[item['type']].append((index, mapping))
+        if key:
+            pending_keys[key] = index
+
+    if mappings['sleep']:
+        batch_wake_windows(user_id, [mapping for _, mapping in mappings['sleep']])
+
+    try:
+        for record_type, (model, _) in BATCH_TYPES.items():
+            if not mappings[record_type]:
+                continue
+            # return_defaults fills in the new primary keys
+            db.session.bulk_insert_mappings(model, [mapping for _, mapping in mappings[record_type]], return_defaults=True)
+            for index, mapping in mappings[record_type]:
+                results[index] = {"index": index, "status": "created", "type": record_type, "id": mapping['id']}
+
+        for category, (_, time_column, _, _) in STAT_SOURCES.items():
+            if mappings[category]:
+                refresh_daily_stats(user_id, category, [mapping[time_column.key] for _, mapping in mappings[category]])
+
+        mark_user_changed(user_id)
+        db.session.bulk_insert_mappings(IdempotencyKey, [
+            {"user_id": user_id, "key": key, "record_type": results[index]['type'], "record_id": results[index]['id']}
+            for key, index in pending_keys.items()
+        ])
+        db.session.commit()
+    except IntegrityError:
+        # Another request with the same idempotency keys won the race
+        db.session.rollback()
+        return jsonify({"error": "Batch conflicts with a concurrent request, please retry"}), 409
+
+    for index, mapping in mappings['todo']:
+        if mapping['reminder_time']:
+            reminder_scheduler().schedule(('todo', mapping['id']), mapping['reminder_time'])
+    publish_created_records(user_id, {
+        record_type: [mapping['id'] for _, mapping in mappings[record_type]] for record_type in BATCH_TYPES
+    })
+
+    for result in results:
+        if result['status'] == 'duplicate' and 'duplicate_of' in result:
+            original = results[result.pop('duplicate_of')]
+            result['id'] = original.get('id')
+
+    created = sum(1 for result in results if result['status'] == 'created')
+    return jsonify({"message": f"{created} records added!", "results": results}), 200
+
+# Calendar
+#
+# Event type -> (start column, end column, detail columns, details). Point
+# events like diaper changes have no end column and end when they start.
+CALENDAR_SOURCES = {
+    "Feeding": (Feeding.start_time, Feeding.end_time, (Feeding.type,), lambda type: type),
+    "Sleep": (Sleep.start_time, Sleep.end_time, (Sleep.wake_window,),
+              lambda wake_window: f"Wake Window: {wake_window or 'N/A'} minutes"),
+    "Tummy Time": (TummyTime.start_time, TummyTime.end_time, (TummyTime.duration,),
+                   lambda duration: f"{duration} minutes"),
+    "Diaper Change": (DiaperChange.time, None, (DiaperChange.type,), lambda type: type),
+    "Todo": (Todo.time, None, (Todo.notes,), lambda notes: notes),
+    "Reminder": (Reminder.reminder_time, None, (Reminder.category,), lambda category: category),
+}
+
+# Events that started this long before the range are not looked for, which
+# keeps the overlap query a range scan on the (user_id, start) index. No
+# feeding, nap or tummy time lasts this long.
+CALENDAR_MAX_EVENT_DURATION = datetime.timedelta(days=1)
+CALENDAR_MAX_RANGE = datetime.timedelta(days=366)
+
+def calendar_queries(user_id, start, end):
+    """One select per event type for the events overlapping [start, end)."""
+    queries = {}
+    for event_type, (start_column, end_column, columns, _) in CALENDAR_SOURCES.items():
+        model = start_column.class_
+        query = db.select(model.id, start_column, end_column if end_column is not None else start_column, *columns)
+        if end_column is None:
+            query = query.where(model.user_id == user_id, start_column >= start, start_column < end)
+        else:
+            query = query.where(
+                model.user_id == user_id,
+                start_column >= start - CALENDAR_MAX_EVENT_DURATION,
+                start_column < end,
+                end_column > start
+            )
+        queries[event_type] = query
+    return queries
+
+def calendar_days(event_start, event_end, start, end):
+    """The dates of the days in [start, end) that an event covers."""
+    first = max(event_start, start)
+    last = min(event_end, end)
+    day = first.date()
+    # An interval ending at midnight doesn't reach into the next day
+    last_day = (last - datetime.timedelta(microseconds=1)).date() if last > first else day
+    while day <= last_day:
+        yield day.isoformat()
+        day += datetime.timedelta(days=1)
+
+def archived_calendar_rows(user_id, event_type, start, end):
+    """What calendar_queries() selects for ``event_type``, from the archive."""
+    start_column, end_column, columns, _ = CALENDAR_SOURCES[event_type]
+    record_type = SYNC_TYPES[start_column.class_]
+    if record_type not in ARCHIVE_SOURCES:
+        return []
+    if end_column is None:
+        rows = archive_store().iter_records(user_id, record_type, start, end)
+        end_column = start_column
+    else:
+        rows = archive_store().iter_records(user_id, record_type, start - CALENDAR_MAX_EVENT_DURATION, end)
+        rows = (row for row in rows if getattr(row, end_column.key) > start)
+    return [
+        (row.id, getattr(row, start_column.key), getattr(row, end_column.key), *[getattr(row, column.key) for column in columns])
+        for row in rows
+    ]
+
+def calendar_events(user_id, start, end):
+    """Events overlapping [start, end) by day, each day's events in start order."""
+    days = {}
+    for event_type, query in calendar_queries(user_id, start, end).items():
+        details = CALENDAR_SOURCES[event_type][3]
+        archived_rows = archived_calendar_rows(user_id, event_type, start, end)
+        for read_only, rows in ((False, db.session.execute(query).all()), (True, archived_rows)):
+            for record_id, event_start, event_end, *values in rows:
+                event = {
+                    "id": record_id,
+                    "type": event_type,
+                    "start_time": event_start,
+                    "end_time": event_end,
+                    "details": details(*values)
+                }
+                if read_only:
+                    event["read_only"] = True
+                for day in calendar_days(event_start, event_end, start, end):
+                    days.setdefault(day, []).append(event)
+    for events in days.values():
+        events.sort(key=lambda event: (event["start_time"], event["type"], event["id"]))
+    return days
+
+@api.route('/calendar/<int:user_id>', methods=['GET'])
+@cached_response
 def get_calendar(user_id):
+    """Events overlapping ``from``/``to`` (at most a year apart), grouped by UTC day.
+
+    Events that span midnight appear under each day they cover; days without
+    events are left out.
+    """
+    try:
+        start, end = datetime_range_args()
+    except ValueError:
+        return jsonify({"error": "Invalid from or to parameter"}), 400
+    if not start or not end:
+        return jsonify({"error": "from and to are required"}), 400
+    if end - start > CALENDAR_MAX_RANGE:
+        return jsonify({"error": "from and to can be at most a year apart"}), 400
+
+    return jsonify({"days": calendar_events(user_id, start, end)}), 200
+
+# Changes committed by a slow transaction can carry an updated_at slightly
+# older than a sync that already ran, so every token overlaps the previous
+# sync by this much. Clients apply changes as upserts, so repeats are harmless.
+SYNC_OVERLAP = datetime.timedelta(seconds=5)
+
+@api.route('/sync/<int:user_id>', methods=['GET'])
+def sync(user_id):
+    """Return every record created, updated or deleted since the ``since`` token.
+
+    Without a token all records are returned. The response's ``token`` is
+    passed as ``since`` on the next call. Clients should apply ``deleted``
+    before ``changes``, since SQLite can reuse the id of a deleted row.
+    """
+    since = request.args.get('since')
+    try:
+        since = datetime.datetime.fromisoformat(since) if since else None
+    except ValueError:
+        return jsonify({"error": "Invalid sync token"}), 400
+
+    next_token = (utcnow() - SYNC_OVERLAP).isoformat()
+
+    changes = {}
+    for record_type, model in SYNC_MODELS.items():
+        fields = RECORD_FIELDS[record_type]
+        query, encode = select_records(model, fields, list(fields))
+        query = query.where(model.user_id == user_id)
+        if since:
+            query = query.where(model.updated_at > since)
+        changes[record_type] = [encode(row) for row in db.session.execute(query)]
+        if since is None and record_type in ARCHIVE_SOURCES:
+            encode_archived = archived_record_encoder(record_type, tuple(fields))
+            changes[record_type].extend(encode_archived(row) for row in archive_store().iter_records(user_id, record_type))
+
+    deleted = {record_type: [] for record_type in SYNC_MODELS}
+    if since:
+        tombstones = db.session.execute(db.select(Tombstone.record_type, Tombstone.record_id).where(
+            Tombstone.user_id == user_id,
+            Tombstone.deleted_at > since
+        ))
+        for record_type, record_id in tombstones:
+            deleted.setdefault(record_type, []).append(record_id)
+
+    return jsonify({
+        "token": next_token,
+        "changes": changes,
+        "deleted": deleted
+    }), 200
 
-    feedings = Feeding.query.filter_by(user_id=user_id).all()
-    feeding_events = [{
-        "id": f.id,
-        "type": "Feeding",
-        "start_time": f.start_time.isoformat(),
-        "end_time": f.end_time.isoformat(),
-        "details": f.type
-    } for f in feedings]
-
-    sleeps = Sleep.query.filter_by(user_id=user_id).all()
-    sleep_events = [{
-        "id": s.id,
-        "type": "Sleep",
-        "start_time": s.start_time.isoformat(),
-        "end_time": s.end_time.isoformat(),
-        "details": f"Wake Window: {s.wake_window or 'N/A'} minutes"
-    } for s in sleeps]
-
-    reminders = Reminder.query.filter_by(user_id=user_id).all()
-    reminder_events = [{
-        "id": r.id,
-        "type": "Reminder",
-        "start_time": r.start_time.isoformat(),
-        "end_time": r.reminder_time.isoformat(),
-        "details": r.category
-    } for r in reminders]
-
-    events = feeding_events + sleep_events + reminder_events
-    return jsonify({"events": events}), 200
-
-@app.route('/get-response', methods=['POST'])
+# Each stream holds a worker thread, so streams end after
+# EVENT_STREAM_SECONDS and EventSource reconnects by itself
+EVENT_KEEPALIVE_SECONDS = 15
+
+@api.route('/events/<int:user_id>', methods=['GET'])
+def stream_events(user_id):
+    """Server-sent events for every change to the user's records.
+
+    Each ``change`` event's data is ``{"type", "action", "record"}``, where
+    action is created, updated or deleted and record is the record as the
+    GET endpoints return it (only its id when deleted). Events are not
+    replayed, so a client that reconnects, or that gets a ``resync`` event
+    after falling too far behind, should catch up with /sync.
+    """
+    try:
+        subscription = event_hub().subscribe(user_id)
+    except StreamsBusy:
+        return jsonify({"error": "Too many open event streams, please try again shortly"}), 503, {"Retry-After": "10"}
+    stream_seconds = current_app.config['EVENT_STREAM_SECONDS']
+
+    def events():
+        deadline = time.monotonic() + stream_seconds
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                event = subscription.get(timeout=min(EVENT_KEEPALIVE_SECONDS, remaining))
+                if subscription.overflowed:
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    event_id, payload = event
+                    yield f"id: {event_id}\nevent: change\ndata: {payload}\n\n"
+        finally:
+            subscription.close()
+
+    return current_app.response_class(events(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+def date_range_args(default_days=90):
+    """Inclusive ``from``/``to`` dates from the query string, defaulting to the last ``default_days`` days."""
+    to_date = datetime.date.fromisoformat(request.args['to'][:10]) if 'to' in request.args else utcnow().date()
+    if 'from' in request.args:
+        from_date = datetime.date.fromisoformat(request.args['from'][:10])
+    else:
+        from_date = to_date - datetime.timedelta(days=default_days - 1)
+    if from_date > to_date:
+        raise ValueError("from must not be after to")
+    return from_date, to_date
+
+# Maps a day to the first day of the period it is reported under
+STAT_GRANULARITIES = {
+    "day": lambda day: day,
+    "week": lambda day: day - datetime.timedelta(days=day.weekday()),
+    "month": lambda day: day.replace(day=1),
+}
+
+@api.route('/stats/<int:user_id>', methods=['GET'])
+@cached_response(dated=True)
+def get_stats(user_id):
+    """Feeding, sleep, diaper and tummy time totals per day, week or month.
+
+    ``from`` and ``to`` are inclusive dates and default to the last 90 days.
+    """
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in STAT_GRANULARITIES:
+        return jsonify({"error": "granularity must be one of day, week or month"}), 400
+
+    try:
+        from_date, to_date = date_range_args()
+    except ValueError:
+        return jsonify({"error": "from and to must be dates like 2024-01-31"}), 400
+
+    stats = DailyStat.query.filter(
+        DailyStat.user_id == user_id,
+        DailyStat.date >= from_date,
+        DailyStat.date <= to_date
+    ).order_by(DailyStat.date).all()
+
+    bucket = STAT_GRANULARITIES[granularity]
+    periods = {}
+    for stat in stats:
+        totals = periods.setdefault(bucket(stat.date), {}).setdefault(stat.category, {
+            "count": 0, "total_duration": 0, "longest_duration": 0, "bottle_amount": 0, "wet_count": 0, "dirty_count": 0
+        })
+        totals["count"] += stat.count
+        totals["total_duration"] += stat.total_duration
+        totals["longest_duration"] = max(totals["longest_duration"], stat.longest_duration)
+        totals["bottle_amount"] += stat.bottle_amount
+        totals["wet_count"] += stat.wet_count
+        totals["dirty_count"] += stat.dirty_count
+
+    for categories in periods.values():
+        for totals in categories.values():
+            totals["average_duration"] = round(totals["total_duration"] / totals["count"], 1) if totals["count"] else 0
+
+    return jsonify({
+        "granularity": granularity,
+        "from": from_date.isoformat(),
+        "to": to_date.isoformat(),
+        "periods": [{"period": period.isoformat(), **categories} for period, categories in periods.items()]
+    }), 200
+
+@api.route('/analytics/sleep/<int:user_id>', methods=['GET'])
+@cached_response(dated=True)
+def get_sleep_analytics(user_id):
+    """Daily sleep totals, nap/night split, rolling average, wake windows and
+    longest stretch, computed from the user's whole sleep history, archived
+    sleeps included.
+
+    ``from``/``to`` pick the days reported (default: the last 30) and
+    ``window`` the number of days in the rolling average.
+    """
+    try:
+        from_date, to_date = date_range_args(default_days=30)
+    except ValueError:
+        return jsonify({"error": "from and to must be dates like 2024-01-31"}), 400
+    window = max(request.args.get('window', 7, type=int), 1)
+
+    rows = db.session.execute(
+        db.select(Sleep.id, Sleep.start_time, Sleep.end_time)
+        .where(Sleep.user_id == user_id)
+    ).all()
+    archived = archive_store().columns(user_id, 'sleep', ('id', 'start_time', 'end_time'))
+    ids = np.concatenate([archived['id'], np.array([row.id for row in rows], dtype=np.int64)])
+    starts = np.concatenate([
+        archived['start_time'].astype('datetime64[s]'),
+        sleep_analytics.to_datetime64([row.start_time for row in rows])
+    ])
+    ends = np.concatenate([
+        archived['end_time'].astype('datetime64[s]'),
+        sleep_analytics.to_datetime64([row.end_time for row in rows])
+    ])
+    order = np.lexsort((ids, starts))
+    ids, starts, ends = ids[order], starts[order], ends[order]
+
+    summary = sleep_analytics.sleep_summary(starts, ends, from_date, to_date, window=window)
+
+    # Wake windows are only returned for the sleeps that start in the range
+    start_days = starts.astype('datetime64[D]')
+    in_range = (start_days >= np.datetime64(from_date)) & (start_days <= np.datetime64(to_date))
+    wake_windows = summary["wake_windows"][in_range]
+
+    longest = None
+    if summary["longest"] is not None:
+        index = summary["longest"]
+        longest = {
+            "id": int(ids[index]),
+            "start_time": starts[index].item().isoformat(),
+            "end_time": ends[index].item().isoformat(),
+            "minutes": int(summary["durations"][index])
+        }
+
+    return jsonify({
+        "from": from_date.isoformat(),
+        "to": to_date.isoformat(),
+        "days": [str(day) for day in summary["days"]],
+        "total_sleep": np.round(summary["total"]).astype(int).tolist(),
+        "night_sleep": np.round(summary["night"]).astype(int).tolist(),
+        "nap_sleep": np.round(summary["nap"]).astype(int).tolist(),
+        "rolling_average": np.round(summary["rolling_average"], 1).tolist(),
+        "wake_windows": [
+            {"id": int(sleep_id), "wake_window": None if np.isnan(minutes) else int(minutes)}
+            for sleep_id, minutes in zip(ids[in_range], wake_windows)
+        ],
+        "average_wake_window": round(float(np.nanmean(wake_windows)), 1) if np.any(~np.isnan(wake_windows)) else None,
+        "longest_stretch": longest
+    }), 200
+
+# Record types in /export, oldest first within each type, with the column
+# to order by
+EXPORT_SOURCES = {
+    "feeding": (Feeding, Feeding.start_time),
+    "sleep": (Sleep, Sleep.start_time),
+    "diaper_change": (DiaperChange, DiaperChange.time),
+    "tummy_time": (TummyTime, TummyTime.start_time),
+    "todo": (Todo, Todo.time),
+    "reminder": (Reminder, Reminder.reminder_time),
+    "growth": (Growth, Growth.date),
+    "milestone": (Milestone, Milestone.date),
+}
+
+EXPORT_BATCH_SIZE = 1000
+
+def export_records(user_id):
+    """Yield ``(record_type, json)`` for every record of the user.
+
+    Rows are fetched ``EXPORT_BATCH_SIZE`` at a time through a server-side
+    cursor, and archived rows are merged in as they are decoded, so memory
+    use does not grow with the size of the history.
+    """
+    for record_type, (model, time_column) in EXPORT_SOURCES.items():
+        fields = RECORD_FIELDS[record_type]
+        time_key = time_column.key
+        query, encode = select_records(model, fields, list(fields), extra_columns=("id", time_key))
+        result = db.session.execute(
+            query.where(model.user_id == user_id)
+            .order_by(time_column, model.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        records = ((getattr(row, time_key), row.id, encode(row)) for partition in result.partitions() for row in partition)
+        if record_type in ARCHIVE_SOURCES:
+            # The export is a plain copy of the data, with the same columns for every row
+            encode_archived = archived_record_encoder(record_type, tuple(fields), read_only=False)
+            archived = ((getattr(row, time_key), row.id, encode_archived(row))
+                        for row in archive_store().iter_records(user_id, record_type))
+            records = heapq.merge(archived, records, key=lambda record: record[:2])
+        for _, _, record in records:
+            yield record_type, record
+
+def export_ndjson(records):
+    lines = []
+    for record_type, record in records:
+        lines.append(orjson.dumps({"record_type": record_type, **record}, option=orjson.OPT_APPEND_NEWLINE))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield b"".join(lines)
+            lines = []
+    yield b"".join(lines)
+
+def export_csv(records):
+    # One table with the union of all record fields, blank where a type has none
+    fieldnames = ["record_type"]
+    for record_type in EXPORT_SOURCES:
+        fieldnames.extend(name for name in RECORD_FIELDS[record_type] if name not in fieldnames)
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    writer.writeheader()
+    for count, (record_type, record) in enumerate(records, 1):
+        for name, value in record.items():
+            if isinstance(value, datetime.datetime):
+                record[name] = value.isoformat()
+        writer.writerow({"record_type": record_type, **record})
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@api.route('/export/<int:user_id>', methods=['GET'])
+def export(user_id):
+    """Stream every record of the user as NDJSON (default) or CSV (?format=csv).
+
+    The body is gzip compressed when the client accepts it.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format == 'ndjson':
+        chunks, mimetype, extension = export_ndjson(export_records(user_id)), 'application/x-ndjson', 'ndjson'
+    elif export_format == 'csv':
+        chunks, mimetype, extension = export_csv(export_records(user_id)), 'text/csv', 'csv'
+    else:
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+
+    headers = {"Content-Disposition": f"attachment; filename=baby_tracker_{user_id}.{extension}"}
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    headers["Vary"] = "Accept-Encoding"
+    return current_app.response_class(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+# OPENAI_BASE_URL points the AI chat client at another OpenAI-compatible
+# server, e.g. benchmarks/fake_openai.py.
+def chat_pool():
+    return current_app.extensions['chat_pool']
+
+# Replies to questions asked before, keyed by the normalized question and the
+# user context sent with it. AI_CACHE_SIMILARITY also reuses the reply to a
+# similar question that differs only in filler words (see ai_cache.STOP_WORDS).
+def ai_response_cache():
+    return current_app.extensions['ai_response_cache']
+
+AI_CONTEXT_WINDOW = datetime.timedelta(hours=24)
+
+def chat_context(user_id, now=None):
+    """Summary of the user's last 24 hours of feedings, sleep and diapers for
+    the AI assistant, newest events first, cut to AI_CONTEXT_TOKENS tokens.
+
+    Returns the summary and a key for the reply cache. The key leaves out
+    the summary's timestamp, so it only changes when the data does.
+    """
+    now = now or utcnow()
+    since = now - AI_CONTEXT_WINDOW
+    feedings = db.session.execute(
+        db.select(Feeding.type, Feeding.start_time, Feeding.end_time, Feeding.bottle_amount)
+        .where(Feeding.user_id == user_id, Feeding.start_time >= since, Feeding.start_time <= now)
+    ).all()
+    sleeps = db.session.execute(
+        db.select(Sleep.start_time, Sleep.end_time)
+        .where(Sleep.user_id == user_id, Sleep.end_time >= since, Sleep.start_time <= now)
+    ).all()
+    diapers = db.session.execute(
+        db.select(DiaperChange.type, DiaperChange.time)
+        .where(DiaperChange.user_id == user_id, DiaperChange.time >= since, DiaperChange.time <= now)
+    ).all()
+
+    events = []
+    for f in feedings:
+        amount = f", bottle amount {f.bottle_amount}" if f.bottle_amount else ""
+        events.append((f.start_time, f"{f.start_time:%H:%M} feeding ({f.type}), {minutes_between(f.start_time, f.end_time)} min{amount}"))
+    for s in sleeps:
+        events.append((s.start_time, f"{s.start_time:%H:%M}-{s.end_time:%H:%M} sleep"))
+    for d in diapers:
+        events.append((d.time, f"{d.time:%H:%M} diaper ({d.type})"))
+    events.sort(key=lambda event: event[0], reverse=True)
+
+    sleep_minutes = sum(minutes_between(max(s.start_time, since), min(s.end_time, now)) for s in sleeps)
+    wet = sum(1 for d in diapers if d.type in ('Wet', 'Mixed'))
+    dirty = sum(1 for d in diapers if d.type in ('Dirty', 'Mixed'))
+    timestamp = f"Tracked data for the baby in the 24 hours up to {now:%Y-%m-%d %H:%M} UTC: "
+    summary = fit_token_budget(
+        f"{len(feedings)} feedings (bottle total {sum(f.bottle_amount or 0 for f in feedings)}), "
+        f"{sleep_minutes / 60:.1f} hours of sleep, {len(diapers)} diapers ({wet} wet, {dirty} dirty). "
+        f"Most recent first:",
+        [line for _, line in events],
+        current_app.config['AI_CONTEXT_TOKENS'] - estimate_tokens(timestamp)
+    )
+    return timestamp + summary, hashlib.sha256(summary.encode('utf-8')).hexdigest()
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@api.route('/get-response', methods=['POST'])
 def get_response():
+    """Answer a chat message, as JSON or streamed as server-sent events.
+
+    With ``?stream=1`` (or ``Accept: text/event-stream``) each piece of the
+    reply is sent as ``data: {"delta": ...}`` as soon as the model produces
+    it, followed by an ``event: done`` carrying the whole reply, or an
+    ``event: error``.
+    """
     data = request.json
     user_input = data.get('text')
 
     if not os.getenv("OPENAI_API_KEY"):
         return jsonify({"response": "Error: No OpenAI API key found. Please check your configuration."}), 500
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",  # Use the model you have access to
-            messages=[{"role": "user", "content": user_input}]
-        )
+    # With a user_id the question is answered with that user's recent data
+    context, context_key = chat_context(int(data['user_id'])) if data.get('user_id') else (None, "")
+    messages = [{"role": "user", "content": user_input}]
+    if context:
+        messages.insert(0, {"role": "system", "content": context})
+    stream = request.args.get('stream') == '1' or request.accept_mimetypes.best == 'text/event-stream'
+
+    started = time.perf_counter()
+    cache = ai_response_cache()
+    cached = cache.get(user_input, context_key)
+    if cached is not None:
+        cache.record_latency(True, time.perf_counter() - started)
+        if not stream:
+            return jsonify({"response": cached})
+        body = sse_event({"delta": cached}) + sse_event({"response": cached}, event="done")
+        return current_app.response_class(body, mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
 
-        if response and hasattr(response, "choices") and len(response.choices) > 0:
-            reply = response.choices[0].message.content
+    try:
+        if not stream:
+            reply = chat_pool().complete(messages)
+            cache.put(user_input, reply, context_key)
+            cache.record_latency(False, time.perf_counter() - started)
             return jsonify({"response": reply})
-        else:
-            return jsonify({"response": "Error: Invalid AI response"}), 500
-
+        chunks = chat_pool().stream(messages)
+    except ChatBusy:
+        return jsonify({"response": "Error: AI service is busy, please try again shortly"}), 503, {"Retry-After": "5"}
+    except ChatTimeout:
+        return jsonify({"response": "Error: AI service timed out"}), 504
     except Exception as e:
-        print(f"OpenAI API Error: {e}")  # Debugging
+        log.error("OpenAI API error", extra={"error": str(e)})
         return jsonify({"response": "Error: AI service unavailable"}), 500
 
-@app.route("/", methods=["GET"])
+    def events():
+        reply = []
+        try:
+            for chunk in chunks:
+                reply.append(chunk)
+                yield sse_event({"delta": chunk})
+            cache.put(user_input, "".join(reply), context_key)
+            cache.record_latency(False, time.perf_counter() - started)
+            yield sse_event({"response": "".join(reply)}, event="done")
+        except ChatTimeout:
+            yield sse_event({"error": "AI service timed out"}, event="error")
+        except Exception as e:
+            log.error("OpenAI API error", extra={"error": str(e)})
+            yield sse_event({"error": "AI service unavailable"}, event="error")
+        finally:
+            chunks.close()
+
+    return current_app.response_class(events(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@api.route('/debug-ai-cache', methods=['GET'])
+def debug_ai_cache():
+    return jsonify(ai_response_cache().stats())
+
+@api.route("/", methods=["GET"])
 def index():
     return "🎉 Baby Tracker API is Live!"
 
 
-@app.route('/register-fcm-token', methods=['POST'])
+@api.route('/register-fcm-token', methods=['POST'])
 def register_fcm_token():
     data = request.json
     user_id = data.get('user_id')
@@ -625,12 +2453,17 @@ def register_fcm_token():
 
     if not user_id or not token:
         return jsonify({"message": "User ID and token are required"}), 400
+    # Clients send the id as a number or a string; the token cache is keyed by int
+    try:
+        user_id = int(user_id)
+    except (ValueError, TypeError):
+        return jsonify({"message": "User ID must be an integer"}), 400
 
     # Delete any existing token that matches this one
     existing_token = FCMToken.query.filter_by(token=token).first()
     if existing_token:
         # Token already exists, no need to add it again
-        print(f"[DEBUG] FCM token already exists for user {user_id}: {token}")
+        log.debug("FCM token already registered", extra={"user_id": user_id})
         return jsonify({"message": "FCM token already registered"}), 200
         
     # Option to remove all previous tokens for this user+platform combination
@@ -640,40 +2473,37 @@ def register_fcm_token():
     # Add the new token
     db.session.add(FCMToken(user_id=user_id, token=token, platform=platform))
     db.session.commit()
+    fcm_token_cache().invalidate([user_id])
 
-    print(f"[DEBUG] FCM token registered for user {user_id}: {token}")
+    log.debug("FCM token registered", extra={"user_id": user_id, "platform": platform})
     return jsonify({"message": "FCM token registered successfully"}), 200
 
 
-@app.route('/check-reminders', methods=['POST'])
+@api.route('/check-reminders', methods=['POST'])
 def check_reminders():
     now = datetime.datetime.now(datetime.timezone.utc)
     reminders = Reminder.query.filter(Reminder.reminder_time <= now, Reminder.notified == False).all()
 
-    print(f"[DEBUG] Found {len(reminders)} due reminder objects")
+    log.debug("Found due reminders", extra={"count": len(reminders)})
 
+    tokens_by_user = fcm_token_cache().get_many([r.user_id for r in reminders])
+
+    notifications = []
     for r in reminders:
-        tokens = FCMToken.query.filter_by(user_id=r.user_id).all()
-        for token in tokens:
-            try:
-                message = messaging.Message(
-                    token=token.token,
-                    notification=messaging.Notification(
-                        title="Reminder",
-                        body=f"Category: {r.category} at {r.reminder_time}"
-                    )
-                )
-                response = messaging.send(message)
-                print(f"[✅] Reminder sent for reminder ID {r.id} to {token.token}: {response}")
-            except Exception as e:
-                print(f"[❌] Reminder send failed: {e}")
+        notifications.append(Notification(
+            ('reminder', r.id),
+            tokens_by_user[r.user_id],
+            "Reminder",
+            f"Category: {r.category} at {r.reminder_time}"
+        ))
         r.notified = True
+    dispatch_notifications(notifications)
     db.session.commit()
 
     return jsonify({"message": f"Processed {len(reminders)} reminders"}), 200
 
         
-# @app.route('/homepage/<int:user_id>', methods=['GET'])
+# @api.route('/homepage/<int:user_id>', methods=['GET'])
 # def get_homepage_data(user_id):
 #     try:
 #         feedings = Feeding.query.filter_by(user_id=user_id).all()
@@ -732,117 +2562,376 @@ def check_reminders():
 #             "message": "Error fetching homepage data"
 #         }), 500
 
-@app.route('/homepage/<int:user_id>', methods=['GET'])
+# Each activity table contributes one branch to the homepage feed. The
+# "kind" column carries Feeding.type / DiaperChange.type and "duration" carries
+# TummyTime.duration so the details string can be built for the page only.
+FEED_SOURCES = {
+    "Feeding": (Feeding, Feeding.start_time, Feeding.end_time, Feeding.type, None),
+    "Diaper Change": (DiaperChange, DiaperChange.time, None, DiaperChange.type, None),
+    "Tummy Time": (TummyTime, TummyTime.start_time, TummyTime.end_time, None, TummyTime.duration),
+    "Sleep": (Sleep, Sleep.start_time, Sleep.end_time, None, None),
+}
+
+def encode_feed_cursor(time, activity_type, activity_id):
+    payload = json.dumps([time.isoformat(), activity_type, activity_id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_feed_cursor(cursor):
+    time, activity_type, activity_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    if activity_type not in FEED_SOURCES:
+        raise ValueError(f"Unknown activity type in cursor: {activity_type}")
+    return datetime.datetime.fromisoformat(time), activity_type, int(activity_id)
+
+def feed_query(user_id, fetch, cursor=None):
+    """Build a UNION ALL over the activity tables ordered by (time, type, id) desc.
+
+    Every branch is limited to ``fetch`` rows on its own, so the merge only
+    ever touches ``4 * fetch`` rows no matter how much history the user has.
+    """
+    branches = []
+    for activity_type, (model, time_col, end_col, kind_col, duration_col) in FEED_SOURCES.items():
+        branch = db.select(
+            model.id.label('id'),
+            db.literal(activity_type).label('type'),
+            time_col.label('time'),
+            (end_col if end_col is not None else db.null()).label('end_time'),
+            (kind_col if kind_col is not None else db.null()).label('kind'),
+            (duration_col if duration_col is not None else db.null()).label('duration'),
+            model.notes.label('notes')
+        ).where(model.user_id == user_id)
+
+        if cursor:
+            cursor_time, cursor_type, cursor_id = cursor
+            if activity_type < cursor_type:
+                branch = branch.where(time_col <= cursor_time)
+            elif activity_type == cursor_type:
+                branch = branch.where(db.or_(
+                    time_col < cursor_time,
+                    db.and_(time_col == cursor_time, model.id < cursor_id)
+                ))
+            else:
+                branch = branch.where(time_col < cursor_time)
+
+        branch = branch.order_by(time_col.desc(), model.id.desc()).limit(fetch).subquery()
+        branches.append(db.select(branch))
+
+    feed = db.union_all(*branches).subquery()
+    return db.select(feed).order_by(feed.c.time.desc(), feed.c.type.desc(), feed.c.id.desc())
+
+# A feed_query() row read from the archive
+FeedRow = collections.namedtuple('FeedRow', ['id', 'type', 'time', 'end_time', 'kind', 'duration', 'notes'])
+
+def archived_feed_rows(user_id, fetch, cursor=None):
+    """What feed_query() selects, from the user's archive, newest first.
+
+    Like the query, each activity type contributes at most ``fetch`` rows.
+    """
+    rows = []
+    for activity_type, (model, time_col, end_col, kind_col, duration_col) in FEED_SOURCES.items():
+        record_type = SYNC_TYPES[model]
+        if record_type not in ARCHIVE_SOURCES:
+            continue
+        before = None
+        if cursor:
+            # The cursor's (time, type, id) order as a (time, id) bound for this type
+            cursor_time, cursor_type, cursor_id = cursor
+            if activity_type < cursor_type:
+                before = (cursor_time, np.iinfo(np.int64).max)
+            elif activity_type == cursor_type:
+                before = (cursor_time, cursor_id)
+            else:
+                before = (cursor_time, 0)
+        for row in archive_store().iter_records(user_id, record_type, before=before, limit=fetch, descending=True):
+            rows.append(FeedRow(
+                row.id,
+                activity_type,
+                getattr(row, time_col.key),
+                getattr(row, end_col.key) if end_col is not None else None,
+                getattr(row, kind_col.key) if kind_col is not None else None,
+                getattr(row, duration_col.key) if duration_col is not None else None,
+                row.notes
+            ))
+    return rows
+
+def feed_total(user_id):
+    counts = [
+        db.select(db.func.count()).select_from(model).where(model.user_id == user_id).scalar_subquery()
+        for model, *_ in FEED_SOURCES.values()
+    ]
+    archived = sum(archive_store().count(user_id, SYNC_TYPES[model]) for model, *_ in FEED_SOURCES.values()
+                   if SYNC_TYPES[model] in ARCHIVE_SOURCES)
+    return db.session.execute(db.select(sum(counts[1:], counts[0]))).scalar() + archived
+
+def feed_activity(row):
+    activity = {
+        "id": row.id,
+        "type": row.type,
+        "time": row.time.isoformat(),
+        "notes": row.notes
+    }
+    if row.end_time is not None:
+        activity["end_time"] = row.end_time.isoformat()
+
+    if row.type == "Feeding":
+        activity["details"] = f"Type: {row.kind}, Duration: {(row.end_time - row.time).total_seconds() / 60:.0f} minutes"
+    elif row.type == "Diaper Change":
+        activity["activity_type"] = row.kind
+        activity["details"] = f"Type: {row.kind}"
+    elif row.type == "Tummy Time":
+        activity["details"] = f"Duration: {row.duration} minutes"
+    else:
+        activity["details"] = f"Duration: {(row.end_time - row.time).total_seconds() / 60:.0f} minutes"
+    if isinstance(row, FeedRow):
+        activity["read_only"] = True
+    return activity
+
+@api.route('/homepage/<int:user_id>', methods=['GET'])
+@cached_response
 def get_homepage_data(user_id):
     try:
         # Get pagination parameters from request
         page = request.args.get('page', 1, type=int)
         limit = request.args.get('limit', 10, type=int)
+        cursor = request.args.get('cursor')
 
-        # Calculate offset
-        offset = (page - 1) * limit
-
-        # Get all activities
-        feedings = Feeding.query.filter_by(user_id=user_id).all()
-        diaper_changes = DiaperChange.query.filter_by(user_id=user_id).all()
-        tummy_times = TummyTime.query.filter_by(user_id=user_id).all()
-        sleep = Sleep.query.filter_by(user_id=user_id).all()
-        
-        activities = []
-        activities.extend([{
-            "id": f.id,
-            "type": "Feeding",
-            "time": f.start_time.isoformat(),
-            "end_time": f.end_time.isoformat(),
-            "details": f"Type: {f.type}, Duration: {(f.end_time - f.start_time).total_seconds() / 60:.0f} minutes",
-            "notes": f.notes
-        } for f in feedings])
-
-        activities.extend([{
-            "id": d.id,
-            "type": "Diaper Change",
-            "activity_type": d.type,
-            "time": d.time.isoformat(),
-            "details": f"Type: {d.type}",
-            "notes": d.notes
-        } for d in diaper_changes])
-
-        activities.extend([{
-            "id": t.id,
-            "type": "Tummy Time",
-            "time": t.start_time.isoformat(),
-            "end_time": t.end_time.isoformat(),
-            "details": f"Duration: {t.duration} minutes",
-            "notes": t.notes
-        } for t in tummy_times])
-
-        activities.extend([{
-            "id": s.id,
-            "type": "Sleep",
-            "time": s.start_time.isoformat(),
-            "end_time": s.end_time.isoformat(),
-            "details": f"Duration: {(s.end_time - s.start_time).total_seconds() / 60:.0f} minutes",
-            "notes": s.notes
-        } for s in sleep])
-
-        # Sort all activities by time
-        activities.sort(key=lambda x: x['time'], reverse=True)
-
-        # Get total count before pagination
-        total_count = len(activities)
-
-        # Apply pagination
-        paginated_activities = activities[offset:offset + limit]
-
-        # Check if there are more items
-        has_more = (offset + limit) < total_count
+        try:
+            cursor = decode_feed_cursor(cursor) if cursor else None
+        except (ValueError, TypeError):
+            return jsonify({
+                "success": False,
+                "message": "Invalid cursor"
+            }), 400
+
+        # A cursor continues from the last item seen; otherwise fall back to
+        # page-based offsets for older clients
+        offset = 0 if cursor else (page - 1) * limit
+
+        # Fetch one extra row so we know whether there are more items. The
+        # offset is applied after merging in the archived activities.
+        fetch = offset + limit + 1
+        rows = db.session.execute(feed_query(user_id, fetch, cursor).limit(fetch)).all()
+        rows += archived_feed_rows(user_id, fetch, cursor)
+        rows.sort(key=lambda row: (row.time, row.type, row.id), reverse=True)
+        rows = rows[offset:offset + limit + 1]
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        next_cursor = None
+        if has_more and rows:
+            last = rows[-1]
+            next_cursor = encode_feed_cursor(last.time, last.type, last.id)
+
+        # Counting touches the user's whole history, so a page reached
+        # through a cursor leaves it out (null); the client keeps the total
+        # from the first page
+        total = feed_total(user_id) if cursor is None else None
 
         return jsonify({
             "success": True,
-            "activities": paginated_activities,
-            "total": total_count,
+            "activities": [feed_activity(row) for row in rows],
+            "total": total,
             "page": page,
-            "has_more": has_more
+            "has_more": has_more,
+            "next_cursor": next_cursor
         }), 200
     
-    except Exception as e:
-        print(f"Error fetching homepage data: {e}")
+    except Exception:
+        log.exception("Error fetching homepage data", extra={"user_id": user_id})
         return jsonify({
             "success": False,
             "message": "Error fetching homepage data"
         }), 500
 
-@app.route('/test-user-notification/<int:user_id>', methods=['POST'])
+@api.route('/test-user-notification/<int:user_id>', methods=['POST'])
 def test_user_notification(user_id):
     tokens = FCMToken.query.filter_by(user_id=user_id).all()
     
     if not tokens:
         return jsonify({"error": f"No FCM tokens found for user {user_id}"}), 404
     
-    success_count = 0
-    for token in tokens:
-        try:
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title="Test Notification",
-                    body="This is a test notification from Tracking Tots."
-                ),
-                token=token.token,
-            )
-            response = messaging.send(message)
-            print(f"[✅] Test notification sent to user {user_id}: {response}")
-            success_count += 1
-        except Exception as e:
-            print(f"[❌] Error sending test notification: {e}")
+    token_values = [token.token for token in tokens]
+    result = dispatch_notifications([Notification(
+        'test',
+        token_values,
+        "Test Notification",
+        "This is a test notification from Tracking Tots."
+    )])
+    db.session.commit()
+    success_count = result.sent
     
     return jsonify({
         "message": f"Test notifications sent to {success_count} out of {len(tokens)} devices",
-        "tokens": [t.token for t in tokens]
+        "tokens": token_values
     }), 200
 
+# SCHEDULER_ROLE picks the processes that send reminders:
+#   scheduler  sends them, starting as soon as the app is created
+#   web        never sends them, only tells the scheduler about changes
+#   auto       every worker competes for the lock file once it has served
+#              its first request, and the one holding it sends them
+SCHEDULER_ROLES = ('auto', 'scheduler', 'web')
+
+def optional_env(name, convert):
+    value = os.getenv(name)
+    return convert(value) if value else None
+
+def init_services(app):
+    """Build the services the views reach through fcm_token_cache(),
+    response_cache() and the other accessors, from ``app.config``."""
+    config = app.config
+    transport = StubTransport() if config['FCM_TRANSPORT'] == 'stub' else FCMTransport(firebase_service.get)
+    app.extensions['notification_dispatcher'] = NotificationDispatcher(
+        metrics.InstrumentedTransport(transport),
+        max_workers=config['FCM_WORKERS']
+    )
+    app.extensions['fcm_token_cache'] = TokenCache(load_fcm_tokens, ttl=config['FCM_TOKEN_CACHE_TTL'])
+
+    if config['RESPONSE_CACHE_VERSIONS'] == 'database':
+        versions = SQLVersionStore(lambda: db.engine, CacheVersion.__table__)
+    else:
+        versions = LocalVersionStore()
+    app.extensions['response_cache'] = ResponseCache(versions, max_bytes=config['RESPONSE_CACHE_MAX_BYTES'])
+
+    if config['EVENT_BROKER'] == 'database':
+        broker = SQLBroker(lambda: db.engine, StreamEvent.__table__, utcnow, poll_interval=config['EVENT_POLL_MS'] / 1000)
+    else:
+        broker = LocalBroker()
+    app.extensions['event_hub'] = EventHub(broker, max_subscribers=config['EVENT_MAX_STREAMS'])
+
+    app.extensions['archive_store'] = ArchiveStore(config['ARCHIVE_DIR'], {
+        record_type: (model.__table__, time_column.key) for record_type, (model, time_column) in ARCHIVE_SOURCES.items()
+    })
+
+    # Password hashes and AI chats run on their own small pools with a bounded
+    # queue, so a burst of logins or slow chats is turned away with a 503
+    # instead of occupying every request thread.
+    app.extensions['password_hasher'] = PasswordHasher(
+        rounds=config['BCRYPT_LOG_ROUNDS'],
+        target_seconds=config['BCRYPT_TARGET_MS'] / 1000,
+        max_workers=config['PASSWORD_WORKERS'],
+        max_queue=config['PASSWORD_MAX_QUEUE'],
+        timeout=config['PASSWORD_TIMEOUT']
+    )
+
+    app.extensions['chat_pool'] = ChatPool(
+        openai_service.get,
+        model=config['OPENAI_MODEL'],
+        max_workers=config['AI_WORKERS'],
+        max_queue=config['AI_MAX_QUEUE'],
+        timeout=config['AI_TIMEOUT']
+    )
+    app.extensions['ai_response_cache'] = PromptCache(
+        max_entries=config['AI_CACHE_SIZE'],
+        ttl=config['AI_CACHE_TTL'],
+        similarity=config['AI_CACHE_SIMILARITY']
+    )
+
+def create_app(config=None, firebase_app=None, openai_client=None):
+    """Build the Flask app.
+
+    ``config`` overrides settings read from the environment, under the same
+    names. ``firebase_app`` and ``openai_client`` replace the clients that
+    would otherwise be created from the credentials on first use. Nothing
+    here talks to Firebase or OpenAI; whether this process sends reminders
+    depends on SCHEDULER_ROLE.
+    """
+    app = Flask(__name__)
+    app.json = ORJSONProvider(app)
+    CORS(app)
+
+    # Database configuration (SQLite or PostgreSQL), see db_config.py
+    app.config['SQLALCHEMY_DATABASE_URI'] = db_config.database_uri()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['REMINDER_LOCK_FILE'] = os.getenv("REMINDER_LOCK_FILE", "/tmp/baby_tracker_reminders.lock")
+    app.config['SCHEDULER_ROLE'] = os.getenv("SCHEDULER_ROLE", "auto")
+    app.config['GROUP_COMMIT'] = os.getenv("GROUP_COMMIT", "0") == "1"
+    app.config['GROUP_COMMIT_MAX_BATCH'] = int(os.getenv("GROUP_COMMIT_MAX_BATCH", 64))
+    app.config['GROUP_COMMIT_MAX_DELAY_MS'] = float(os.getenv("GROUP_COMMIT_MAX_DELAY_MS", 0))
+    app.config['FCM_TRANSPORT'] = os.getenv("FCM_TRANSPORT", "fcm")
+    app.config['FCM_WORKERS'] = int(os.getenv("FCM_WORKERS", 4))
+    app.config['FCM_TOKEN_CACHE_TTL'] = int(os.getenv("FCM_TOKEN_CACHE_TTL", 300))
+    app.config['RESPONSE_CACHE_VERSIONS'] = os.getenv("RESPONSE_CACHE_VERSIONS", "local")
+    app.config['RESPONSE_CACHE_MAX_BYTES'] = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+    app.config['EVENT_BROKER'] = os.getenv("EVENT_BROKER", "local")
+    app.config['EVENT_POLL_MS'] = int(os.getenv("EVENT_POLL_MS", 500))
+    app.config['EVENT_MAX_STREAMS'] = int(os.getenv("EVENT_MAX_STREAMS", 8))
+    app.config['EVENT_STREAM_SECONDS'] = int(os.getenv("EVENT_STREAM_SECONDS", 300))
+    app.config['ARCHIVE_DIR'] = os.getenv("ARCHIVE_DIR", "/tmp/baby_tracker_archive")
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.getenv("ARCHIVE_AFTER_DAYS", 365))
+    app.config['BCRYPT_LOG_ROUNDS'] = optional_env("BCRYPT_LOG_ROUNDS", int)
+    app.config['BCRYPT_TARGET_MS'] = float(os.getenv("BCRYPT_TARGET_MS", 250))
+    app.config['PASSWORD_WORKERS'] = int(os.getenv("PASSWORD_WORKERS", 1))
+    app.config['PASSWORD_MAX_QUEUE'] = int(os.getenv("PASSWORD_MAX_QUEUE", 8))
+    app.config['PASSWORD_TIMEOUT'] = float(os.getenv("PASSWORD_TIMEOUT", 10))
+    app.config['OPENAI_MODEL'] = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+    app.config['AI_WORKERS'] = int(os.getenv("AI_WORKERS", 4))
+    app.config['AI_MAX_QUEUE'] = int(os.getenv("AI_MAX_QUEUE", 4))
+    app.config['AI_TIMEOUT'] = float(os.getenv("AI_TIMEOUT", 30))
+    app.config['AI_CACHE_SIZE'] = int(os.getenv("AI_CACHE_SIZE", 1000))
+    app.config['AI_CACHE_TTL'] = int(os.getenv("AI_CACHE_TTL", 24 * 3600))
+    app.config['AI_CACHE_SIMILARITY'] = optional_env("AI_CACHE_SIMILARITY", float)
+    app.config['AI_CONTEXT_TOKENS'] = int(os.getenv("AI_CONTEXT_TOKENS", 300))
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', db_config.engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+
+    role = app.config['SCHEDULER_ROLE']
+    if role not in SCHEDULER_ROLES:
+        raise ValueError(f"SCHEDULER_ROLE must be one of {', '.join(SCHEDULER_ROLES)}, not {role!r}")
+
+    db.init_app(app)
+    with app.app_context():
+        db_config.configure_engine(db.engine)
+        metrics.instrument_engine(db.engine)
+    metrics.init_app(app)
+    app.register_blueprint(api)
+    init_services(app)
+
+    if firebase_app is not None:
+        firebase_service.set(firebase_app)
+    if openai_client is not None:
+        openai_service.set(openai_client)
+
+    # Only one process holds the lock file and sends reminders
+    scheduler = ReminderScheduler(
+        functools.partial(load_pending_reminders, app),
+        metrics.timed_job(functools.partial(send_due_reminders, app)),
+        lock_path=app.config['REMINDER_LOCK_FILE']
+    )
+    app.extensions['reminder_scheduler'] = scheduler
+    if app.config['GROUP_COMMIT']:
+        app.extensions['group_committer'] = GroupCommitter(
+            functools.partial(commit_batch, app),
+            max_batch=app.config['GROUP_COMMIT_MAX_BATCH'],
+            max_delay=app.config['GROUP_COMMIT_MAX_DELAY_MS'] / 1000
+        )
+    if role == 'scheduler':
+        scheduler.start()
+    elif role == 'auto':
+        @app.before_request
+        def start_reminder_scheduler():
+            if not scheduler.running:
+                scheduler.start()
+
+    return app
+
+@api.cli.command('run-scheduler')
+def run_scheduler_command():
+    """Send reminders from this process until it is stopped."""
+    scheduler = reminder_scheduler()
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop()
+
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
         db.create_all()
+        with db.engine.begin() as conn:
+            migrate_schema(conn)
     port = int(os.environ.get("PORT", 5001))
     app.run(debug=True, host='0.0.0.0', port=port)
 
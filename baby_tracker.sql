@@ -76,4 +76,17 @@ CREATE TABLE reminders (
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
+-- Every list query filters by user and orders by time
+CREATE INDEX idx_feedings_user_start_time ON feedings (user_id, start_time);
+CREATE INDEX idx_sleeps_user_start_time ON sleeps (user_id, start_time);
+CREATE INDEX idx_sleeps_user_end_time ON sleeps (user_id, end_time);
+CREATE INDEX idx_diaper_changes_user_time ON diaper_changes (user_id, time);
+CREATE INDEX idx_tummy_times_user_time ON tummy_times (user_id, time);
+CREATE INDEX idx_growth_tracking_user_date ON growth_tracking (user_id, date);
+CREATE INDEX idx_milestones_user_date ON milestones (user_id, date);
+CREATE INDEX idx_reminders_user_reminder_time ON reminders (user_id, reminder_time);
+
+-- Reminders still waiting on a notification
+CREATE INDEX idx_reminders_pending ON reminders (reminder_time) WHERE notified = 0;
+
 COMMIT;
\ No newline at end of file
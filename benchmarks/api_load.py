@@ -0,0 +1,398 @@
+"""Load test of every API route against a seeded database.
+
+Seeds synthetic families (feedings, sleeps, diapers, tummy time, todos,
+reminders, growth measurements, milestones and FCM tokens for each user
+over ``--days`` days) into a
+throwaway SQLite file or ``--database-url``, then drives each route through
+the Flask test client from ``--concurrency`` threads. FCM is stubbed and
+OpenAI calls go to benchmarks/fake_openai.py running in-process. An /events
+request is timed until the stream's first line, then closed.
+
+Reports p50/p95/p99 latency, throughput and peak RSS per route. Results
+are written as JSON with ``--output`` and can be compared against an
+earlier run with ``--compare``.
+
+    python benchmarks/api_load.py --users 100 --days 60 --requests 200 --output results.json
+    python benchmarks/api_load.py --users 10000 --days 730 --compare results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+
+# Sets up sys.path, so it comes before the other imports
+import bench_env
+from fake_openai import make_handler
+
+QUESTIONS = [
+    "How much should a 2 month old eat?",
+    "How many naps does a 6 month old need?",
+    "When do babies start sleeping through the night?",
+    "How many wet diapers a day is normal?",
+    "How long should tummy time be?",
+    "Is it normal for my baby to feed every two hours?",
+]
+
+# bcrypt makes these deliberately slow, so they get fewer requests
+SLOW_ROUTES = {"POST /register", "POST /login"}
+SLOW_ROUTE_REQUESTS = 20
+
+INSERT_CHUNK = 10000
+
+
+def setup_environment():
+    os.environ['OPENAI_API_KEY'] = 'stub'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(latency=0, words_per_second=10000))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['OPENAI_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def insert_chunks(conn, table, rows):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        conn.execute(table.insert(), rows[start:start + INSERT_CHUNK])
+
+
+def seed(b, users, days, rng):
+    """Insert ``users`` families with ``days`` days of history up to now; returns row counts."""
+    now = b.utcnow().replace(second=0, microsecond=0)
+    first_day = now - datetime.timedelta(days=days)
+    password = b.password_hasher().hash('password')
+    minute = datetime.timedelta(minutes=1)
+
+    def times(per_day, spread):
+        # ``per_day`` events a day, evenly spaced with up to ``spread`` minutes of jitter
+        count = days * per_day
+        offsets = np.arange(count) * (24 * 60 // per_day) + rng.integers(0, spread, count)
+        return [first_day + int(m) * minute for m in offsets]
+
+    counts = {}
+    with b.db.engine.begin() as conn:
+        conn.execute(b.User.__table__.insert(), [
+            {'id': u, 'name': f"Parent {u}", 'email': f"parent{u}@example.com", 'password': password}
+            for u in range(1, users + 1)
+        ])
+        conn.execute(b.FCMToken.__table__.insert(), [
+            {'user_id': u, 'token': f"token-{u}", 'platform': 'ios'} for u in range(1, users + 1)
+        ])
+        tables = {name: [] for name in ('feeding', 'sleep', 'diaper_change', 'tummy_time', 'todo', 'reminder', 'growth', 'milestone')}
+        for u in range(1, users + 1):
+            for start in times(8, 60):
+                tables['feeding'].append({
+                    'user_id': u, 'type': 'Bottle', 'bottle_amount': int(rng.integers(60, 180)), 'notes': None,
+                    'start_time': start, 'end_time': start + int(rng.integers(10, 30)) * minute,
+                })
+            previous_end = None
+            for start in times(5, 30):
+                tables['sleep'].append({
+                    'user_id': u, 'start_time': start, 'end_time': start + int(rng.integers(30, 150)) * minute,
+                    'wake_window': int((start - previous_end) / minute) if previous_end else None, 'notes': None,
+                })
+                previous_end = tables['sleep'][-1]['end_time']
+            for time_ in times(7, 90):
+                tables['diaper_change'].append({
+                    'user_id': u, 'type': ('Wet', 'Dirty', 'Mixed')[int(rng.integers(0, 3))], 'time': time_, 'notes': None,
+                })
+            for start in times(1, 600):
+                tables['tummy_time'].append({
+                    'user_id': u, 'start_time': start, 'end_time': start + 10 * minute, 'duration': 10, 'notes': None,
+                })
+            for time_ in times(1, 600)[::5]:
+                tables['todo'].append({
+                    'user_id': u, 'time': time_, 'notes': 'Vitamin D drops', 'reminder_time': time_,
+                    'completed': time_ < now, 'reminder_notified': time_ < now,
+                })
+            for day in range(0, days, 7):
+                tables['growth'].append({
+                    'user_id': u, 'date': (first_day + datetime.timedelta(days=day)).date(), 'notes': None,
+                    'weight': round(3.5 + day * 0.025 + float(rng.normal(0, 0.2)), 2),
+                    'height': round(50 + day * 0.08 + float(rng.normal(0, 1)), 1),
+                    'head_circumference': round(35 + day * 0.03 + float(rng.normal(0, 0.5)), 1),
+                })
+            for day in range(0, days, 7):
+                tables['milestone'].append({
+                    'user_id': u, 'milestone': 'Rolled over', 'date': (first_day + datetime.timedelta(days=day)).date(), 'notes': None,
+                })
+            for days_ahead in (1, 2):
+                tables['reminder'].append({
+                    'user_id': u, 'category': 'Feeding', 'reminder_time': now + datetime.timedelta(days=days_ahead),
+                    'notified': False,
+                })
+
+            # Flush every so often to keep memory flat at large scales
+            if u % 100 == 0 or u == users:
+                for name, model in (('feeding', b.Feeding), ('sleep', b.Sleep), ('diaper_change', b.DiaperChange),
+                                    ('tummy_time', b.TummyTime), ('todo', b.Todo), ('reminder', b.Reminder),
+                                    ('growth', b.Growth), ('milestone', b.Milestone)):
+                    insert_chunks(conn, model.__table__, tables[name])
+                    counts[name] = counts.get(name, 0) + len(tables[name])
+                    tables[name] = []
+        b.rebuild_daily_stats(conn)
+    return counts
+
+
+def random_ids(b, model, count, rng):
+    """Up to ``count`` distinct ids in random order; callers wrap around with ``i % len``."""
+    ids = b.db.session.execute(b.db.select(model.id)).scalars().all()
+    return [int(i) for i in rng.choice(ids, size=min(count, len(ids)), replace=False)]
+
+
+def open_event_stream(client, path):
+    """GET an /events stream, read its first line and close it."""
+    response = client.get(path, buffered=False)
+    if response.status_code == 200:
+        next(response.response)
+    response.close()
+    return response
+
+
+def routes(b, args, rng):
+    """(name, function(client, index) -> response) for every route."""
+    now = b.utcnow()
+    user = lambda: int(rng.integers(1, args.users + 1))
+    iso = lambda dt: dt.replace(microsecond=0).isoformat()
+    recent = lambda: now - datetime.timedelta(minutes=int(rng.integers(0, 7 * 24 * 60)))
+    week_ago = (now - datetime.timedelta(days=7)).date().isoformat()
+    month = (now.date().replace(day=1).isoformat(), now.date().isoformat())
+    today = now.date().isoformat()
+    # Seeded histories start ``--days`` ago, so this keeps every measurement in the WHO range
+    birth_date = (now - datetime.timedelta(days=args.days + 30)).date().isoformat()
+
+    # Updates and deletes touch different rows while there are enough of them
+    n = args.requests
+    feedings = random_ids(b, b.Feeding, 2 * n, rng)
+    sleeps = random_ids(b, b.Sleep, 2 * n, rng)
+    diapers = random_ids(b, b.DiaperChange, 2 * n, rng)
+    tummy = random_ids(b, b.TummyTime, n, rng)
+    todos = random_ids(b, b.Todo, 3 * n, rng)
+    growths = random_ids(b, b.Growth, 2 * n, rng)
+    milestones = random_ids(b, b.Milestone, 2 * n, rng)
+    pick = lambda ids, i: ids[i % len(ids)]
+
+    def feeding_body():
+        start = recent()
+        return {'type': 'Bottle', 'bottle_amount': 120, 'start_time': iso(start),
+                'end_time': iso(start + datetime.timedelta(minutes=20))}
+
+    def sleep_body():
+        start = recent()
+        return {'start_time': iso(start), 'end_time': iso(start + datetime.timedelta(minutes=90))}
+
+    def batch_body(i):
+        start = recent()
+        return [
+            {'type': 'feeding', 'idempotency_key': f"bench-{i}-{k}", 'data': {
+                'type': 'Bottle', 'bottle_amount': 90, 'start_time': iso(start + k * datetime.timedelta(hours=3)),
+                'end_time': iso(start + k * datetime.timedelta(hours=3) + datetime.timedelta(minutes=15))}}
+            for k in range(10)
+        ]
+
+    return [
+        ("GET /", lambda c, i: c.get('/')),
+        ("GET /feeding", lambda c, i: c.get(f'/feeding/{user()}')),
+        ("GET /feeding?from&limit", lambda c, i: c.get(f'/feeding/{user()}?from={week_ago}&limit=50')),
+        ("GET /sleeping", lambda c, i: c.get(f'/sleeping/{user()}')),
+        ("GET /diaper-change", lambda c, i: c.get(f'/diaper-change/{user()}')),
+        ("GET /tummy-time", lambda c, i: c.get(f'/tummy-time/{user()}')),
+        ("GET /todo", lambda c, i: c.get(f'/todo/{user()}')),
+        ("GET /calendar", lambda c, i: c.get(f'/calendar/{user()}?from={month[0]}&to={month[1]}')),
+        ("GET /homepage", lambda c, i: c.get(f'/homepage/{user()}?limit=20')),
+        ("GET /growth", lambda c, i: c.get(f'/growth/{user()}')),
+        ("GET /growth/percentiles", lambda c, i: c.get(f'/growth/{user()}/percentiles?sex=female&birth_date={birth_date}')),
+        ("GET /milestone", lambda c, i: c.get(f'/milestone/{user()}')),
+        ("GET /events", lambda c, i: open_event_stream(c, f'/events/{user()}')),
+        ("GET /stats", lambda c, i: c.get(f'/stats/{user()}?granularity=week')),
+        ("GET /analytics/sleep", lambda c, i: c.get(f'/analytics/sleep/{user()}')),
+        ("GET /sync", lambda c, i: c.get(f'/sync/{user()}?since={iso(now - datetime.timedelta(hours=1))}')),
+        ("GET /export", lambda c, i: c.get(f'/export/{user()}')),
+        ("GET /debug-tokens", lambda c, i: c.get(f'/debug-tokens/{user()}')),
+        ("GET /debug-ai-cache", lambda c, i: c.get('/debug-ai-cache')),
+        ("GET /metrics", lambda c, i: c.get('/metrics')),
+        ("POST /login", lambda c, i: c.post('/login', json={'email': f"parent{user()}@example.com", 'password': 'password'})),
+        ("POST /register", lambda c, i: c.post('/register', json={
+            'name': 'New parent', 'email': f"new{i}-{time.monotonic_ns()}@example.com", 'password': 'password'})),
+        ("POST /feeding", lambda c, i: c.post(f'/feeding/{user()}', json=feeding_body())),
+        ("PUT /feeding", lambda c, i: c.put(f'/feeding/{pick(feedings, n + i)}', json={'notes': 'Updated'})),
+        ("POST /sleeping", lambda c, i: c.post(f'/sleeping/{user()}', json=sleep_body())),
+        ("PUT /sleeping", lambda c, i: c.put(f'/sleeping/{pick(sleeps, n + i)}', json={'notes': 'Updated'})),
+        ("POST /diaper-change", lambda c, i: c.post(f'/diaper-change/{user()}', json={'type': 'Wet', 'time': iso(recent())})),
+        ("PUT /diaper-change", lambda c, i: c.put(f'/diaper-change/{pick(diapers, n + i)}', json={'type': 'Dirty'})),
+        ("POST /tummy-time", lambda c, i: c.post(f'/tummy-time/{user()}', json=sleep_body())),
+        ("POST /todo", lambda c, i: c.post(f'/todo/{user()}', json={
+            'time': iso(now), 'notes': 'Bath', 'reminder_time': iso(now + datetime.timedelta(days=1))})),
+        ("PUT /todo", lambda c, i: c.put(f'/todo/{pick(todos, n + i)}', json={'notes': 'Updated'})),
+        ("PATCH /todo/toggle", lambda c, i: c.patch(f'/todo/{pick(todos, 2 * n + i)}/toggle')),
+        ("POST /growth", lambda c, i: c.post(f'/growth/{user()}', json={
+            'date': today, 'weight': 6.1, 'height': 61.5, 'head_circumference': 40.2})),
+        ("PUT /growth", lambda c, i: c.put(f'/growth/{pick(growths, n + i)}', json={'notes': 'Updated'})),
+        ("POST /milestone", lambda c, i: c.post(f'/milestone/{user()}', json={'milestone': 'First smile', 'date': today})),
+        ("PUT /milestone", lambda c, i: c.put(f'/milestone/{pick(milestones, n + i)}', json={'notes': 'Updated'})),
+        ("POST /batch", lambda c, i: c.post(f'/batch/{user()}', json=batch_body(i))),
+        ("POST /register-fcm-token", lambda c, i: c.post('/register-fcm-token', json={
+            'user_id': user(), 'token': f"bench-token-{i}", 'platform': 'android'})),
+        ("POST /get-response", lambda c, i: c.post('/get-response', json={'text': QUESTIONS[i % len(QUESTIONS)]})),
+        ("POST /get-response (context)", lambda c, i: c.post('/get-response', json={
+            'text': QUESTIONS[i % len(QUESTIONS)], 'user_id': user()})),
+        ("POST /check-reminders", lambda c, i: c.post('/check-reminders')),
+        ("POST /test-reminders", lambda c, i: c.post(f'/test-reminders/{user()}')),
+        ("POST /test-user-notification", lambda c, i: c.post(f'/test-user-notification/{user()}')),
+        ("DELETE /feeding", lambda c, i: c.delete(f'/feeding/{pick(feedings, i)}')),
+        ("DELETE /sleeping", lambda c, i: c.delete(f'/sleeping/{pick(sleeps, i)}')),
+        ("DELETE /diaper-change", lambda c, i: c.delete(f'/diaper-change/{pick(diapers, i)}')),
+        ("DELETE /tummy-time", lambda c, i: c.delete(f'/tummy-time/{pick(tummy, i)}')),
+        ("DELETE /growth", lambda c, i: c.delete(f'/growth/{pick(growths, i)}')),
+        ("DELETE /milestone", lambda c, i: c.delete(f'/milestone/{pick(milestones, i)}')),
+        ("DELETE /todo", lambda c, i: c.delete(f'/todo/{pick(todos, i)}')),
+        ("POST /delete-token", lambda c, i: c.post('/delete-token', json={'token': f"bench-token-{i}"})),
+    ]
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return None
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def run_route(app, request, count, concurrency):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    next_index = iter(range(count))
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                i = next(next_index, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            response = request(client, i)
+            response.get_data()  # read streamed bodies in full
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        "requests": count,
+        "errors": sum(n for status, n in statuses.items() if status >= 500),
+        "statuses": {str(status): n for status, n in sorted(statuses.items())},
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "throughput_rps": round(count / wall, 1),
+        "rss_mb": round(current_rss_mb(), 1) if current_rss_mb() else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=bench_env.ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["routes"]
+    print(f"\nChange in p95 against {baseline_path}")
+    for name, result in results.items():
+        if name in baseline and baseline[name]["p95_ms"]:
+            change = (result["p95_ms"] / baseline[name]["p95_ms"] - 1) * 100
+            print(f"  {name:32} {baseline[name]['p95_ms']:9.2f} -> {result['p95_ms']:9.2f} ms  {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help="default: a throwaway SQLite file")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--requests', type=int, default=200, help="requests per route")
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    setup_environment()
+    config = bench_env.config()
+    if args.database_url:
+        config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+
+    import baby_backend as b
+    app = b.create_app(config)
+    rng = np.random.default_rng(args.seed)
+
+    with app.app_context():
+        b.db.drop_all()
+        b.db.create_all()
+        started = time.perf_counter()
+        counts = seed(b, args.users, args.days, rng)
+        seed_seconds = time.perf_counter() - started
+        print(f"Seeded {sum(counts.values())} rows for {args.users} users in {seed_seconds:.1f} s")
+        route_list = routes(b, args, rng)
+        database = b.db.engine.dialect.name
+
+    results = {}
+    for name, request in route_list:
+        count = min(args.requests, SLOW_ROUTE_REQUESTS) if name in SLOW_ROUTES else args.requests
+        results[name] = run_route(app, request, count, args.concurrency)
+        result = results[name]
+        print(f"{name:32} p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}  p99 {result['p99_ms']:8.2f} ms"
+              f"  {result['throughput_rps']:8.1f} req/s  peak {result['peak_rss_mb']:7.1f} MB"
+              f"{'  errors ' + str(result['errors']) if result['errors'] else ''}")
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "database": database,
+            "users": args.users,
+            "days": args.days,
+            "rows": counts,
+            "requests_per_route": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+        },
+        "routes": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
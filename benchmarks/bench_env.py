@@ -0,0 +1,37 @@
+"""Setup shared by the benchmarks.
+
+Importing this module puts the repository root on sys.path, so the
+benchmarks import it before the backend. ``config`` gives create_app
+throwaway state in a temporary directory: a SQLite database, the reminder
+lock file and the cold storage archive. FCM is stubbed and the process does
+not send reminders.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+tmp = tempfile.mkdtemp()
+
+
+def sqlite_path(name='app'):
+    return os.path.join(tmp, name + '.db')
+
+
+def sqlite_uri(name='app'):
+    """URI of a SQLite database called ``name`` in the temporary directory."""
+    return f"sqlite:///{sqlite_path(name)}"
+
+
+def config(**overrides):
+    """Settings for create_app, with ``overrides`` on top."""
+    return {
+        'SQLALCHEMY_DATABASE_URI': sqlite_uri(),
+        'REMINDER_LOCK_FILE': os.path.join(tmp, 'reminders.lock'),
+        'ARCHIVE_DIR': os.path.join(tmp, 'archive'),
+        'FCM_TRANSPORT': 'stub',
+        'SCHEDULER_ROLE': 'web',
+        **overrides,
+    }
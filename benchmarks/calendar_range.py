@@ -0,0 +1,100 @@
+"""Month view latency of the calendar against the length of a user's history.
+
+Seeds one user with realistic daily activity (8 feedings, 5 sleeps, 7
+diapers, tummy time and a todo a day) for each history length, then times
+calendar_events() for the latest and for the oldest full month, next to
+loading the user's whole history as the calendar did before it took a range.
+
+    python benchmarks/calendar_range.py --days 30 365 730
+"""
+import argparse
+import datetime
+import statistics
+import time
+
+# Sets up sys.path, so it comes before the other imports
+import bench_env
+
+import sqlalchemy as sa
+
+import baby_backend
+from baby_backend import db, User, Feeding, Sleep, DiaperChange, TummyTime, Todo, calendar_events, calendar_queries
+
+app = baby_backend.create_app(bench_env.config())
+
+END = datetime.datetime(2025, 1, 1)
+
+
+def seed(user_id, days):
+    minute = datetime.timedelta(minutes=1)
+    first_day = END - datetime.timedelta(days=days)
+    rows = {Feeding: [], Sleep: [], DiaperChange: [], TummyTime: [], Todo: []}
+    for day in range(days):
+        midnight = first_day + datetime.timedelta(days=day)
+        for i in range(8):
+            start = midnight + (i * 180 + 15) * minute
+            rows[Feeding].append(dict(user_id=user_id, type='Bottle', bottle_amount=120, start_time=start, end_time=start + 20 * minute))
+        for i in range(5):
+            # The first sleep of the day starts the evening before
+            start = midnight + (i * 288 - 120) * minute
+            rows[Sleep].append(dict(user_id=user_id, start_time=start, end_time=start + 100 * minute))
+        for i in range(7):
+            rows[DiaperChange].append(dict(user_id=user_id, type='Wet', time=midnight + (i * 200 + 30) * minute))
+        rows[TummyTime].append(dict(user_id=user_id, start_time=midnight + 600 * minute, end_time=midnight + 610 * minute, duration=10))
+        rows[Todo].append(dict(user_id=user_id, time=midnight + 720 * minute, notes='Vitamin D drops'))
+    for model, values in rows.items():
+        db.session.execute(sa.insert(model.__table__), values)
+    db.session.commit()
+
+
+def whole_history(user_id):
+    # What the calendar loaded before it took a range
+    for model in (Feeding, Sleep):
+        db.session.execute(sa.select(model.id, model.start_time, model.end_time).where(model.user_id == user_id)).all()
+
+
+def timed(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 365, 730], help="history lengths to compare")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    month = (datetime.datetime(2024, 12, 1), END)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(sa.insert(User.__table__), [
+            {'id': user_id, 'name': 'Parent', 'email': f"parent{user_id}@example.com", 'password': 'x'}
+            for user_id in range(1, len(args.days) + 1)
+        ])
+        for user_id, days in enumerate(args.days, start=1):
+            seed(user_id, days)
+        db.session.execute(sa.text("ANALYZE"))
+
+        print(f"{'history':>8} {'latest month':>14} {'oldest month':>14} {'whole history':>15}")
+        for user_id, days in enumerate(args.days, start=1):
+            oldest = END - datetime.timedelta(days=days)
+            oldest = (oldest.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+            oldest_month = (oldest, (oldest + datetime.timedelta(days=32)).replace(day=1))
+            latest_ms = timed(lambda: calendar_events(user_id, *month), args.repeat)
+            oldest_ms = timed(lambda: calendar_events(user_id, *oldest_month), args.repeat)
+            history_ms = timed(lambda: whole_history(user_id), args.repeat)
+            print(f"{days:>5} d {latest_ms:>11.2f} ms {oldest_ms:>11.2f} ms {history_ms:>12.2f} ms")
+
+        print("\nQuery plans")
+        for event_type, query in calendar_queries(1, *month).items():
+            sql = str(query.compile(db.engine, compile_kwargs={"literal_binds": True}))
+            plan = [row[-1] for row in db.session.execute(sa.text("EXPLAIN QUERY PLAN " + sql))]
+            print(f"  {event_type:14} " + " | ".join(plan))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Read latency and hot table size before and after archiving old activity.
+
+Seeds users with two years (``--days``) of daily activity, times the list
+endpoints (newest page and a page a year back), the calendar for a recent
+and an old month, a full export and a full /sync, then archives everything
+older than ``--horizon`` days and times the same reads again. Also reports
+the rows left in the activity tables, the database file size and the size
+of the archive files.
+
+``--record-types`` seeds only some of the activity tables, to check that
+archiving copes with tables that have no rows at all.
+
+    python benchmarks/cold_storage.py --users 5 --days 730 --horizon 90
+    python benchmarks/cold_storage.py --record-types feeding sleep
+"""
+import argparse
+import datetime
+import os
+import statistics
+import time
+
+# Sets up sys.path, so it comes before the other imports
+import bench_env
+
+import sqlalchemy as sa
+
+import baby_backend
+from baby_backend import (db, User, Feeding, Sleep, DiaperChange, TummyTime, ARCHIVE_SOURCES, archive_records,
+                          calendar_events, export_records, list_records)
+
+app = baby_backend.create_app(bench_env.config())
+
+END = datetime.datetime(2025, 1, 1)
+ACTIVITY_MODELS = (Feeding, Sleep, DiaperChange, TummyTime)
+
+
+def seed(user_id, days, models):
+    minute = datetime.timedelta(minutes=1)
+    first_day = END - datetime.timedelta(days=days)
+    rows = {model: [] for model in ACTIVITY_MODELS}
+    for day in range(days):
+        midnight = first_day + datetime.timedelta(days=day)
+        for i in range(8):
+            start = midnight + (i * 180 + 15) * minute
+            rows[Feeding].append(dict(user_id=user_id, type='Bottle', bottle_amount=120, start_time=start, end_time=start + 20 * minute))
+        for i in range(5):
+            start = midnight + (i * 288 - 120) * minute
+            rows[Sleep].append(dict(user_id=user_id, start_time=start, end_time=start + 100 * minute))
+        for i in range(7):
+            rows[DiaperChange].append(dict(user_id=user_id, type='Wet', time=midnight + (i * 200 + 30) * minute))
+        rows[TummyTime].append(dict(user_id=user_id, start_time=midnight + 600 * minute, end_time=midnight + 610 * minute, duration=10))
+    for model in models:
+        db.session.execute(sa.insert(model.__table__), rows[model])
+    db.session.commit()
+
+
+def timed(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def list_page(user_id, query_string):
+    # list_records() directly, since the endpoint would answer from the response cache
+    with app.test_request_context(query_string=query_string):
+        return list_records(user_id, 'feeding')
+
+
+def reads(client, user_id):
+    year_ago = (END - datetime.timedelta(days=365)).isoformat()
+    recent_month = (END - datetime.timedelta(days=31), END)
+    old_month = (END - datetime.timedelta(days=396), END - datetime.timedelta(days=365))
+    return {
+        'list newest page': lambda: list_page(user_id, {'limit': 50}),
+        'list page a year back': lambda: list_page(user_id, {'limit': 50, 'to': year_ago}),
+        'calendar recent month': lambda: calendar_events(user_id, *recent_month),
+        'calendar old month': lambda: calendar_events(user_id, *old_month),
+        'export': lambda: sum(1 for _ in export_records(user_id)),
+        'full sync': lambda: client.get(f'/sync/{user_id}').get_data(),
+    }
+
+
+def measure(client, users, repeat):
+    results = {}
+    for user_id in range(1, users + 1):
+        for name, run in reads(client, user_id).items():
+            results.setdefault(name, []).append(timed(run, repeat))
+    return {name: statistics.mean(timings) for name, timings in results.items()}
+
+
+def storage():
+    hot_rows = sum(db.session.execute(sa.select(sa.func.count()).select_from(model)).scalar() for model in ACTIVITY_MODELS)
+    db.session.commit()
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(sa.text('VACUUM'))
+        # In WAL mode the vacuumed pages only reach the database file here
+        conn.execute(sa.text('PRAGMA wal_checkpoint(TRUNCATE)'))
+    db_size = os.path.getsize(bench_env.sqlite_path())
+    archive_dir = app.config['ARCHIVE_DIR']
+    archive_size = sum(os.path.getsize(os.path.join(archive_dir, name)) for name in os.listdir(archive_dir)) if os.path.isdir(archive_dir) else 0
+    return hot_rows, db_size, archive_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--days', type=int, default=730, help="days of history per user")
+    parser.add_argument('--horizon', type=int, default=90, help="archive records older than this many days")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--record-types', nargs='+', choices=list(ARCHIVE_SOURCES), default=list(ARCHIVE_SOURCES),
+                        help="activity tables to seed; the others stay empty")
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(sa.insert(User.__table__), [
+            {'id': user_id, 'name': 'Parent', 'email': f"parent{user_id}@example.com", 'password': 'x'}
+            for user_id in range(1, args.users + 1)
+        ])
+        for user_id in range(1, args.users + 1):
+            seed(user_id, args.days, [ARCHIVE_SOURCES[record_type][0] for record_type in args.record_types])
+        client = app.test_client()
+
+        before = measure(client, args.users, args.repeat)
+        before_storage = storage()
+        started = time.perf_counter()
+        moved = archive_records(END - datetime.timedelta(days=args.horizon))
+        archive_seconds = time.perf_counter() - started
+        after = measure(client, args.users, args.repeat)
+        after_storage = storage()
+
+    print(f"{args.users} users, {args.days} days each; archived {sum(moved.values())} rows older than {args.horizon} days in {archive_seconds:.1f}s")
+    print(f"{'':24} {'all hot':>10} {'archived':>10}")
+    for name in before:
+        print(f"{name:24} {before[name]:>8.2f}ms {after[name]:>8.2f}ms")
+    print(f"{'hot activity rows':24} {before_storage[0]:>10} {after_storage[0]:>10}")
+    print(f"{'database file':24} {before_storage[1] / 1e6:>8.1f}MB {after_storage[1] / 1e6:>8.1f}MB")
+    print(f"{'archive files':24} {before_storage[2] / 1e6:>8.1f}MB {after_storage[2] / 1e6:>8.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Concurrent write/read load against the database engine configuration.
+
+Runs writer threads inserting feedings (each in its own transaction) and
+reader threads fetching a user's latest feedings, first with a plain
+create_engine() and then with the settings from db_config. Reports
+throughput, latency percentiles and lock errors for both.
+
+    python benchmarks/db_concurrency.py --writers 4 --readers 8 --seconds 10
+    python benchmarks/db_concurrency.py --database-url postgresql://localhost/baby_bench
+"""
+import argparse
+import datetime
+import threading
+import time
+
+# Sets up sys.path, so it comes before the other imports
+import bench_env
+
+import numpy as np
+import sqlalchemy as sa
+
+import db_config
+from baby_backend import db, User, Feeding
+
+USERS = 100
+TABLES = [User.__table__, Feeding.__table__]
+
+
+def make_engine(url, configured):
+    if not configured:
+        return sa.create_engine(url, pool_size=32)
+    options = db_config.engine_options(url)
+    if db_config.is_sqlite(url):
+        options['pool_size'] = 32
+    engine = sa.create_engine(url, **options)
+    db_config.configure_engine(engine)
+    return engine
+
+
+def writer(engine, stop, latencies, errors, seed):
+    rng = np.random.default_rng(seed)
+    insert = sa.insert(Feeding.__table__)
+    while not stop.is_set():
+        user_id = int(rng.integers(1, USERS + 1))
+        start_time = datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=int(rng.integers(0, 500000)))
+        started = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert, {
+                    'user_id': user_id, 'type': 'Bottle', 'bottle_amount': 120, 'notes': None,
+                    'start_time': start_time, 'end_time': start_time + datetime.timedelta(minutes=20),
+                })
+        except sa.exc.OperationalError:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def reader(engine, stop, latencies, errors, seed):
+    rng = np.random.default_rng(seed)
+    table = Feeding.__table__
+    while not stop.is_set():
+        user_id = int(rng.integers(1, USERS + 1))
+        started = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(
+                    sa.select(table).where(table.c.user_id == user_id)
+                    .order_by(table.c.start_time.desc()).limit(20)
+                ).all()
+        except sa.exc.OperationalError:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def run(engine, writers, readers, seconds):
+    stop = threading.Event()
+    results = {'write': ([], []), 'read': ([], [])}
+    threads = [
+        threading.Thread(target=writer, args=(engine, stop, *results['write'], i)) for i in range(writers)
+    ] + [
+        threading.Thread(target=reader, args=(engine, stop, *results['read'], 1000 + i)) for i in range(readers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def report(name, results, seconds):
+    print(name)
+    for kind, (latencies, errors) in results.items():
+        if latencies:
+            p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+        else:
+            p50 = p95 = p99 = float('nan')
+        print(f"  {kind:5} {len(latencies) / seconds:9.0f} ops/s  "
+              f"p50 {p50:7.2f} ms  p95 {p95:7.2f} ms  p99 {p99:7.2f} ms  errors {len(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help="default: a throwaway SQLite file")
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    for name, configured in [('plain create_engine', False), ('db_config', True)]:
+        url = args.database_url or bench_env.sqlite_uri(f'bench_{configured}')
+        engine = make_engine(url, configured)
+        db.metadata.drop_all(engine, tables=TABLES)
+        db.metadata.create_all(engine, tables=TABLES)
+        with engine.begin() as conn:
+            conn.execute(sa.insert(User.__table__), [
+                {'id': user_id, 'name': f"User {user_id}", 'email': f"user{user_id}@example.com", 'password': 'x'}
+                for user_id in range(1, USERS + 1)
+            ])
+        report(name, run(engine, args.writers, args.readers, args.seconds), args.seconds)
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Read load and update delay of polling /homepage against the /events stream.
+
+Seeds ``--families`` users with a month of history, each shared by
+``--caregivers`` clients. One writer logs a diaper change for a random family
+every ``--write-interval`` seconds. First every client polls /homepage every
+``--poll-interval`` seconds (sending If-None-Match, so unchanged pages are
+304s), then every client holds an /events stream instead. Reports read
+requests and SQL statements per second and how long it took each client to
+see each new diaper change.
+
+    python benchmarks/event_stream.py --families 4 --caregivers 2 --seconds 10
+"""
+import argparse
+import datetime
+import random
+import threading
+import time
+
+# Sets up sys.path, so it comes before the other imports
+import bench_env
+
+import numpy as np
+import orjson
+import sqlalchemy as sa
+
+import baby_backend
+import metrics
+from baby_backend import db, User, Feeding, Sleep, DiaperChange
+
+
+def seed(families):
+    db.session.execute(sa.insert(User.__table__), [
+        {'id': user_id, 'name': 'Parent', 'email': f"parent{user_id}@example.com", 'password': 'x'}
+        for user_id in range(1, families + 1)
+    ])
+    minute = datetime.timedelta(minutes=1)
+    start = datetime.datetime(2024, 1, 1)
+    rows = {Feeding: [], Sleep: [], DiaperChange: []}
+    for user_id in range(1, families + 1):
+        for day in range(30):
+            midnight = start + datetime.timedelta(days=day)
+            for i in range(8):
+                time_ = midnight + (i * 180 + 15) * minute
+                rows[Feeding].append(dict(user_id=user_id, type='Bottle', start_time=time_, end_time=time_ + 20 * minute))
+                rows[DiaperChange].append(dict(user_id=user_id, type='Wet', time=time_ + 30 * minute))
+            for i in range(4):
+                time_ = midnight + (i * 360 + 60) * minute
+                rows[Sleep].append(dict(user_id=user_id, start_time=time_, end_time=time_ + 90 * minute))
+    for model, values in rows.items():
+        db.session.execute(sa.insert(model.__table__), values)
+    db.session.commit()
+
+
+def get_statements():
+    return sum(
+        sample.value
+        for metric in metrics.REQUEST_SQL_STATEMENTS.collect()
+        for sample in metric.samples
+        if sample.name.endswith('_sum') and sample.labels.get('method') == 'GET'
+    )
+
+
+class Writer:
+    """Logs diaper changes and remembers when each one was sent."""
+
+    def __init__(self, app, families, interval):
+        self.app = app
+        self.families = families
+        self.interval = interval
+        self.written = {}
+        self.count = 0
+
+    def run(self, stop):
+        client = self.app.test_client()
+        rng = random.Random(1)
+        while not stop.wait(self.interval):
+            self.count += 1
+            note = f"w{self.count}"
+            user_id = rng.randint(1, self.families)
+            # Delays count from when the request was sent
+            self.written[note] = time.perf_counter()
+            client.post(f'/diaper-change/{user_id}', json={
+                'type': 'Dirty', 'time': datetime.datetime.now().isoformat(), 'notes': note
+            })
+
+
+def poll(app, user_id, interval, stop, writer, delays, counts):
+    client = app.test_client()
+    etag = None
+    seen = set()
+    # Real clients don't poll in step with each other or the writer
+    stop.wait(random.uniform(0, interval))
+    while not stop.is_set():
+        headers = {'If-None-Match': etag} if etag else {}
+        response = client.get(f'/homepage/{user_id}', headers=headers)
+        counts.append(1)
+        if response.status_code == 200:
+            etag = response.headers.get('ETag', '').strip('"') or None
+            now = time.perf_counter()
+            for activity in response.json['activities']:
+                note = activity.get('notes')
+                if note in writer.written and note not in seen:
+                    seen.add(note)
+                    delays.append(now - writer.written[note])
+        stop.wait(interval)
+
+
+def listen(app, user_id, writer, delays, counts):
+    response = app.test_client().get(f'/events/{user_id}', buffered=False)
+    counts.append(1)
+    for chunk in response.response:
+        chunk = chunk if isinstance(chunk, str) else chunk.decode()
+        now = time.perf_counter()
+        for line in chunk.splitlines():
+            if line.startswith('data: '):
+                note = orjson.loads(line[6:]).get('record', {}).get('notes')
+                if note in writer.written:
+                    delays.append(now - writer.written[note])
+
+
+def run(app, mode, args):
+    stop = threading.Event()
+    writer = Writer(app, args.families, args.write_interval)
+    delays, counts = [], []
+    clients = []
+    for user_id in range(1, args.families + 1):
+        for _ in range(args.caregivers):
+            if mode == 'poll':
+                clients.append(threading.Thread(target=poll, args=(app, user_id, args.poll_interval, stop, writer, delays, counts)))
+            else:
+                clients.append(threading.Thread(target=listen, args=(app, user_id, writer, delays, counts)))
+
+    statements = get_statements()
+    cpu = time.process_time()
+    for thread in clients:
+        thread.start()
+    time.sleep(0.5)
+    writer_thread = threading.Thread(target=writer.run, args=(stop,))
+    writer_thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    writer_thread.join()
+    for thread in clients:
+        thread.join()
+    elapsed = args.seconds + 0.5
+    cpu = time.process_time() - cpu
+    statements = get_statements() - statements
+
+    delays = np.array(delays) * 1000 if delays else np.array([np.nan])
+    expected = writer.count * args.caregivers
+    return (len(counts) / elapsed, statements / elapsed, cpu / elapsed * 100,
+            np.percentile(delays, 50), np.percentile(delays, 95), len(delays), expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--families', type=int, default=4)
+    parser.add_argument('--caregivers', type=int, default=2, help="clients per family")
+    parser.add_argument('--poll-interval', type=float, default=5)
+    parser.add_argument('--write-interval', type=float, default=0.5)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    app = baby_backend.create_app(bench_env.config(
+        EVENT_MAX_STREAMS=args.families * args.caregivers,
+        # Streams end with the run
+        EVENT_STREAM_SECONDS=args.seconds + 0.5,
+    ))
+    with app.app_context():
+        db.create_all()
+        seed(args.families)
+
+    print(f"{args.families * args.caregivers} clients, a write every {args.write_interval}s")
+    print(f"{'':24} {'reads/s':>8} {'SQL/s':>8} {'CPU':>6} {'delay p50':>10} {'p95':>10} {'seen':>9}")
+    for name, mode in ((f'poll every {args.poll_interval:g}s', 'poll'), ('/events stream', 'stream')):
+        reads, statements, cpu, p50, p95, seen, expected = run(app, mode, args)
+        print(f"{name:24} {reads:>8.1f} {statements:>8.1f} {cpu:>5.0f}% {p50:>8.1f}ms {p95:>8.1f}ms {seen:>4}/{expected:<4}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Answers POST /v1/chat/completions, plain or streamed (stream=true), with a
+fixed reply after a configurable delay, so /get-response can be exercised
+without an API key or network access:
+
+    python benchmarks/fake_openai.py --port 8001 --latency 2
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=fake python baby_backend.py
+"""
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = "Most newborns feed 8 to 12 times a day. Watch for hunger cues like rooting and sucking on hands."
+
+
+def make_handler(latency, words_per_second):
+    class FakeOpenAIHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/v1/chat/completions':
+                self.send_error(404)
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            time.sleep(latency)
+            if request.get('stream'):
+                self.stream_reply(request['model'])
+            else:
+                self.send_json(completion(request['model']))
+
+        def send_json(self, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def stream_reply(self, model):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for word in REPLY.split(' '):
+                self.wfile.write(f"data: {json.dumps(chunk(model, word + ' '))}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(1 / words_per_second)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeOpenAIHandler
+
+
+def completion(model):
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": REPLY},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 10, "completion_tokens": len(REPLY.split()), "total_tokens": 10 + len(REPLY.split())},
+    }
+
+
+def chunk(model, content):
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=1.0, help="seconds before the first token")
+    parser.add_argument('--words-per-second', type=float, default=20)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(args.latency, args.words_per_second))
+    print(f"Fake OpenAI API on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
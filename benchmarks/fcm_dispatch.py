@@ -0,0 +1,72 @@
+"""Offline throughput of notification fan-out using the stub FCM transport.
+
+Compares the old pattern (one send per token, one after another) with
+NotificationDispatcher batches at several pool sizes. ``--latency`` is the
+simulated round trip of one FCM request.
+
+    python benchmarks/fcm_dispatch.py --users 5000 --tokens-per-user 2 --latency 0.05
+"""
+import argparse
+import time
+
+# Sets up sys.path, so it comes before the other imports
+import bench_env
+
+from notification_dispatch import Notification, NotificationDispatcher, StubTransport
+
+
+def make_notifications(users, tokens_per_user):
+    return [
+        Notification(
+            ('todo', user_id),
+            [f"token-{user_id}-{n}" for n in range(tokens_per_user)],
+            "Task Reminder",
+            f"Don't forget: todo {user_id}",
+            {"type": "todo", "id": str(user_id)}
+        )
+        for user_id in range(users)
+    ]
+
+
+def serial(notifications, latency):
+    transport = StubTransport(latency=latency)
+    started = time.perf_counter()
+    for notification in notifications:
+        for token in notification.tokens:
+            transport.send_batch([(token, notification.title, notification.body, notification.data)])
+    return len(transport.sent), time.perf_counter() - started
+
+
+def batched(notifications, latency, workers):
+    transport = StubTransport(latency=latency)
+    dispatcher = NotificationDispatcher(transport, max_workers=workers)
+    started = time.perf_counter()
+    result = dispatcher.dispatch(notifications)
+    elapsed = time.perf_counter() - started
+    dispatcher.executor.shutdown()
+    return result.sent, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--tokens-per-user', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per FCM request')
+    parser.add_argument('--serial-limit', type=int, default=200,
+                        help='only time the serial path on this many users and extrapolate')
+    args = parser.parse_args()
+
+    notifications = make_notifications(args.users, args.tokens_per_user)
+    total = args.users * args.tokens_per_user
+
+    sent, elapsed = serial(notifications[:args.serial_limit], args.latency)
+    print(f"serial, one request per token: {sent / elapsed:10.0f} msgs/s "
+          f"(~{elapsed * args.users / min(args.users, args.serial_limit):.1f}s for {total} messages)")
+
+    for workers in (1, 4, 8):
+        sent, elapsed = batched(notifications, args.latency, workers)
+        print(f"batched, {workers} worker(s):        {sent / elapsed:10.0f} msgs/s ({elapsed:.2f}s for {sent} messages)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Single-record write throughput with and without group commit.
+
+Runs 1, 16 and 64 client threads (``--clients``) posting feedings through
+the Flask test client, once with every request committing on its own and
+once with GROUP_COMMIT, each against a fresh SQLite file. Reports writes per
+second, latency percentiles, errors and the mean number of writes per
+commit. ``--synchronous FULL`` makes SQLite sync every commit to disk, which
+is where batching commits pays off most.
+
+    python benchmarks/group_commit.py --clients 1 16 64 --seconds 5
+    python benchmarks/group_commit.py --synchronous FULL
+"""
+import argparse
+import datetime
+import os
+import threading
+import time
+
+# Sets up sys.path, so it comes before the other imports
+import bench_env
+
+import numpy as np
+import sqlalchemy as sa
+
+import baby_backend
+import metrics
+from baby_backend import db, User
+
+USERS = 100
+
+
+def make_app(name, group_commit, max_delay_ms):
+    app = baby_backend.create_app(bench_env.config(
+        SQLALCHEMY_DATABASE_URI=bench_env.sqlite_uri(name),
+        GROUP_COMMIT=group_commit,
+        GROUP_COMMIT_MAX_DELAY_MS=max_delay_ms,
+    ))
+    with app.app_context():
+        db.create_all()
+        db.session.execute(sa.insert(User.__table__), [
+            {'id': user_id, 'name': 'Parent', 'email': f"parent{user_id}@example.com", 'password': 'x'}
+            for user_id in range(1, USERS + 1)
+        ])
+        db.session.commit()
+    return app
+
+
+def batch_totals():
+    sample = {s.name: s.value for s in metrics.GROUP_COMMIT_BATCH_SIZE.collect()[0].samples}
+    return sample['group_commit_batch_size_count'], sample['group_commit_batch_size_sum']
+
+
+def run(app, clients, seconds):
+    stop = threading.Event()
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    start = datetime.datetime(2024, 1, 1)
+
+    def client(worker):
+        test_client = app.test_client()
+        i = 0
+        while not stop.is_set():
+            user_id = 1 + (worker * 7 + i) % USERS
+            feeding_start = start + datetime.timedelta(minutes=worker * 100000 + i * 30)
+            started = time.perf_counter()
+            response = test_client.post(f'/feeding/{user_id}', json={
+                'type': 'Bottle', 'bottle_amount': 120,
+                'start_time': feeding_start.isoformat(),
+                'end_time': (feeding_start + datetime.timedelta(minutes=20)).isoformat(),
+            })
+            latencies[worker].append(time.perf_counter() - started)
+            if response.status_code != 201:
+                errors[worker] += 1
+            i += 1
+
+    commits_before, writes_before = batch_totals()
+    threads = [threading.Thread(target=client, args=(worker,)) for worker in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    commits_after, writes_after = batch_totals()
+
+    all_latencies = np.concatenate([np.array(worker_latencies) for worker_latencies in latencies]) * 1000
+    p50, p95, p99 = np.percentile(all_latencies, [50, 95, 99])
+    commits = commits_after - commits_before
+    per_commit = (writes_after - writes_before) / commits if commits else 1.0
+    return len(all_latencies) / elapsed, p50, p95, p99, sum(errors), per_commit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 16, 64], help="concurrent client threads")
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--synchronous', default='NORMAL', choices=['OFF', 'NORMAL', 'FULL'], help="SQLite synchronous pragma")
+    parser.add_argument('--max-delay-ms', type=float, default=0, help="GROUP_COMMIT_MAX_DELAY_MS")
+    args = parser.parse_args()
+    os.environ['SQLITE_SYNCHRONOUS'] = args.synchronous
+
+    print(f"SQLite synchronous={args.synchronous}")
+    print(f"{'':14} {'clients':>7} {'writes/s':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'errors':>6} {'per commit':>10}")
+    for name, group_commit in (('own commit', False), ('group commit', True)):
+        app = make_app(name.replace(' ', '_'), group_commit, args.max_delay_ms)
+        for clients in args.clients:
+            rate, p50, p95, p99, errors, per_commit = run(app, clients, args.seconds)
+            print(f"{name:14} {clients:>7} {rate:>9.0f} {p50:>7.2f}ms {p95:>7.2f}ms {p99:>7.2f}ms {errors:>6} {per_commit:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
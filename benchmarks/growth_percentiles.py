@@ -0,0 +1,93 @@
+"""Cost of scoring a growth history against the WHO reference.
+
+Scores ``--points`` random weight, length and head circumference measurements
+with the precomputed per-day arrays in growth_standards (one call per
+indicator), next to looking each point up in the bundled monthly table and
+interpolating in Python, and reports microseconds per point. Also times
+loading the reference.
+
+    python benchmarks/growth_percentiles.py --points 100 1000 10000
+"""
+import argparse
+import bisect
+import csv
+import math
+import statistics
+import time
+
+# Sets up sys.path, so it comes before the other imports
+import bench_env
+
+import numpy as np
+
+import growth_standards
+
+
+def load_table():
+    table = {}
+    with open(growth_standards.REFERENCE_FILE, newline='') as f:
+        for row in csv.DictReader(line for line in f if not line.startswith('#')):
+            table.setdefault((row['indicator'], row['sex']), []).append(
+                tuple(float(row[column]) for column in ('age_days', 'L', 'M', 'S'))
+            )
+    return table
+
+
+def per_point(table, indicator, sex, ages, values):
+    # Find the neighbouring table rows and interpolate L, M and S for every point
+    rows = table[(indicator, sex)]
+    days = [row[0] for row in rows]
+    percentiles = []
+    for age, value in zip(ages, values):
+        i = min(max(bisect.bisect_right(days, age), 1), len(rows) - 1)
+        (d0, *lms0), (d1, *lms1) = rows[i - 1], rows[i]
+        L, M, S = (a + (b - a) * (age - d0) / (d1 - d0) for a, b in zip(lms0, lms1))
+        z = math.log(value / M) / S if L == 0 else ((value / M) ** L - 1) / (L * S)
+        percentiles.append(50 * (1 + math.erf(z / math.sqrt(2))))
+    return percentiles
+
+
+def timed(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, nargs='+', default=[100, 1000, 10000], help="measurements per history")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    load = timed(growth_standards.GrowthReference, 5)
+    reference = growth_standards.reference()
+    table = load_table()
+    print(f"reference loaded in {load * 1000:.1f} ms, "
+          f"{sum(curves.nbytes for curves in reference.lms.values()) / 1024:.0f} KiB of arrays")
+
+    rng = np.random.default_rng(1)
+    indicators = {'weight': (3, 20), 'length': (48, 110), 'head_circumference': (33, 52)}
+    print(f"{'points':>7} {'arrays':>12} {'per point':>12} {'speedup':>8}")
+    for points in args.points:
+        ages = rng.integers(0, growth_standards.MAX_AGE_DAYS + 1, points)
+        history = {indicator: rng.uniform(low, high, points) for indicator, (low, high) in indicators.items()}
+
+        def vectorised():
+            for indicator, values in history.items():
+                reference.percentiles(indicator, 'female', ages, values)
+
+        def lookups():
+            for indicator, values in history.items():
+                per_point(table, indicator, 'female', ages.tolist(), values.tolist())
+
+        total = points * len(indicators)
+        fast = timed(vectorised, args.repeat) / total * 1e6
+        slow = timed(lookups, args.repeat) / total * 1e6
+        print(f"{points:>7} {fast:>9.3f} us {slow:>9.3f} us {slow / fast:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Login throughput and the latency of other endpoints during a login storm.
+
+Runs ``--logins`` threads that log in as fast as they can while one thread
+keeps reading a user's feedings, first with bcrypt called on the request
+threads (as /login used to) and then through the app's PasswordHasher pool.
+Reports completed and rejected logins per second and the feeding endpoint's
+latency percentiles, next to its latency with no logins at all.
+
+    python benchmarks/login_storm.py --logins 16 --seconds 10
+"""
+import argparse
+import datetime
+import threading
+import time
+
+# Sets up sys.path, so it comes before the other imports
+import bench_env
+
+import numpy as np
+import sqlalchemy as sa
+
+import baby_backend
+from baby_backend import db, User, Feeding
+from password_hashing import check_password, hash_password, hash_rounds
+
+app = baby_backend.create_app(bench_env.config())
+
+
+class InlineHasher:
+    """bcrypt on the calling thread, as /login and /register did before the pool."""
+
+    def __init__(self, rounds):
+        self.rounds = rounds
+
+    def hash(self, password):
+        return hash_password(password, self.rounds)
+
+    def check(self, hashed, password):
+        return check_password(hashed, password)
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) < self.rounds
+
+
+def seed(rounds):
+    password = hash_password('password', rounds)
+    db.session.execute(sa.insert(User.__table__), [
+        {'id': user_id, 'name': 'Parent', 'email': f"parent{user_id}@example.com", 'password': password}
+        for user_id in range(1, 101)
+    ])
+    start = datetime.datetime(2024, 1, 1)
+    db.session.execute(sa.insert(Feeding.__table__), [
+        {'user_id': 1, 'type': 'Bottle', 'bottle_amount': 120,
+         'start_time': start + datetime.timedelta(hours=3 * i),
+         'end_time': start + datetime.timedelta(hours=3 * i, minutes=20)}
+        for i in range(500)
+    ])
+    db.session.commit()
+
+
+def run(logins, seconds):
+    stop = threading.Event()
+    outcomes = {'ok': 0, 'rejected': 0}
+    lock = threading.Lock()
+
+    def log_in(worker):
+        client = app.test_client()
+        i = 0
+        while not stop.is_set():
+            response = client.post('/login', json={'email': f"parent{1 + (worker + i) % 100}@example.com", 'password': 'password'})
+            i += 1
+            with lock:
+                outcomes['ok' if response.status_code == 200 else 'rejected'] += 1
+            if response.status_code == 503:
+                # A real client would back off for Retry-After
+                time.sleep(0.5)
+
+    threads = [threading.Thread(target=log_in, args=(worker,)) for worker in range(logins)]
+    for thread in threads:
+        thread.start()
+
+    client = app.test_client()
+    latencies = []
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        # A new limit each time keeps the response cache out of the way
+        request_started = time.perf_counter()
+        client.get(f'/feeding/1?limit={50 + len(latencies) % 50}')
+        latencies.append((time.perf_counter() - request_started) * 1000)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return outcomes['ok'] / elapsed, outcomes['rejected'] / elapsed, p50, p95, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=16, help="threads logging in concurrently")
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    pool = app.extensions['password_hasher']
+    with app.app_context():
+        db.create_all()
+        seed(pool.rounds)
+    print(f"bcrypt cost {pool.rounds}, {pool.executor.max_workers} hashing process(es), queue of {pool.executor.max_pending - pool.executor.max_workers}")
+
+    print(f"{'':26} {'logins/s':>9} {'rejected/s':>11} {'GET p50':>9} {'p95':>9} {'p99':>9}")
+    for name, hasher, logins in (
+        ('no logins', pool, 0),
+        ('bcrypt on request threads', InlineHasher(pool.rounds), args.logins),
+        ('process pool', pool, args.logins),
+    ):
+        app.extensions['password_hasher'] = hasher
+        ok, rejected, p50, p95, p99 = run(logins, args.seconds)
+        print(f"{name:26} {ok:9.1f} {rejected:11.1f} {p50:7.2f}ms {p95:7.2f}ms {p99:7.2f}ms")
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Query plans and timings for the per-user list queries before and after
+schema migration 1 (per-user time indexes and pending reminder indexes).
+
+Seeds a throwaway SQLite database, drops the migration's indexes to mimic a
+database created before it, then runs every list/scanner query, applies the
+migration and runs them again.
+
+    python benchmarks/query_plans.py --rows 1000000 --users 1000
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+
+# Sets up sys.path, so it comes before the other imports
+import bench_env
+
+import sqlalchemy as sa
+
+from baby_backend import (
+    db, Feeding, Sleep, DiaperChange, TummyTime, Todo, Reminder, migrate_schema
+)
+
+START = datetime.datetime(2023, 1, 1)
+
+
+def seed(engine, rows, users):
+    rng = random.Random(42)
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+    def times(i):
+        start = START + datetime.timedelta(minutes=rng.randrange(0, 2 * 365 * 24 * 60))
+        return start, start + datetime.timedelta(minutes=rng.randrange(5, 120))
+
+    def pending(i, flag):
+        reminder_time = now + datetime.timedelta(minutes=rng.randrange(-10000, 10000))
+        return {'reminder_time': reminder_time, flag: reminder_time < now - datetime.timedelta(minutes=5)}
+
+    generators = {
+        Feeding: lambda i: dict(zip(('start_time', 'end_time'), times(i)), type='Bottle', bottle_amount=120),
+        Sleep: lambda i: dict(zip(('start_time', 'end_time'), times(i))),
+        DiaperChange: lambda i: dict(time=times(i)[0], type='Wet'),
+        TummyTime: lambda i: dict(zip(('start_time', 'end_time'), times(i)), duration=10),
+        # Reminders in the past have already been sent, as they would be in production
+        Todo: lambda i: dict(time=times(i)[0], notes='todo', completed=i % 3 == 0, **pending(i, 'reminder_notified')),
+        Reminder: lambda i: dict(category='Feeding', **pending(i, 'notified')),
+    }
+
+    batch = 50000
+    with engine.begin() as conn:
+        for model, make in generators.items():
+            for offset in range(0, rows, batch):
+                values = []
+                for i in range(offset, min(rows, offset + batch)):
+                    row = make(i)
+                    row['user_id'] = rng.randrange(1, users + 1)
+                    values.append(row)
+                conn.execute(sa.insert(model.__table__), values)
+
+
+def queries(user_id):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return {
+        'get_feeding_data': sa.select(Feeding).where(Feeding.user_id == user_id).order_by(Feeding.start_time.desc()),
+        'get_sleep_data': sa.select(Sleep).where(Sleep.user_id == user_id).order_by(Sleep.start_time.desc()),
+        'add_sleep last_sleep': sa.select(Sleep).where(Sleep.user_id == user_id).order_by(Sleep.end_time.desc()).limit(1),
+        'get_diaper_change_data': sa.select(DiaperChange).where(DiaperChange.user_id == user_id).order_by(DiaperChange.time.desc()),
+        'get_tummy_time_data': sa.select(TummyTime).where(TummyTime.user_id == user_id).order_by(TummyTime.start_time.desc()),
+        'get_todo_list': sa.select(Todo).where(Todo.user_id == user_id).order_by(Todo.time.desc()),
+        'send_due_reminders': sa.select(Todo).where(
+            Todo.reminder_time != None,
+            Todo.completed == False,
+            Todo.reminder_notified == False,
+            Todo.reminder_time <= now + datetime.timedelta(minutes=1),
+            Todo.reminder_time > now - datetime.timedelta(minutes=1)
+        ),
+        'check_reminders': sa.select(Reminder).where(Reminder.reminder_time <= now, Reminder.notified == False),
+    }
+
+
+def measure(engine, users, runs):
+    results = {}
+    with engine.connect() as conn:
+        for name, stmt in queries(1).items():
+            sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+
+            timings = []
+            for run in range(runs):
+                stmt = queries(1 + run % users)[name]
+                started = time.perf_counter()
+                conn.execute(stmt).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (plan, statistics.median(timings))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000, help='rows per activity table')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=20, help='timed runs per query')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = sa.create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            for model in (Feeding, Sleep, DiaperChange, TummyTime, Todo, Reminder):
+                for index in model.__table__.indexes:
+                    index.drop(conn)
+
+        print(f"Seeding {args.rows} rows per table for {args.users} users...")
+        seed(engine, args.rows, args.users)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+        before = measure(engine, args.users, args.runs)
+        with engine.begin() as conn:
+            migrate_schema(conn)
+            conn.exec_driver_sql("ANALYZE")
+        after = measure(engine, args.users, args.runs)
+
+    for name in before:
+        (plan_before, ms_before), (plan_after, ms_after) = before[name], after[name]
+        print(f"\n{name}: {ms_before:.2f} ms -> {ms_after:.2f} ms")
+        print("  before: " + " | ".join(plan_before))
+        print("  after:  " + " | ".join(plan_after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""SQL statements issued per reminder batch.
+
+Seeds a throwaway SQLite database with one due todo per user, then counts the
+statements and time taken by send_due_reminders with a cold and a warm token
+cache, next to the per-todo token lookups it used to make.
+
+    python benchmarks/reminder_queries.py --users 10000
+"""
+import argparse
+import datetime
+import time
+
+# Sets up sys.path, so it comes before the other imports
+import bench_env
+
+import sqlalchemy as sa
+
+import baby_backend
+from baby_backend import db, Todo, FCMToken, send_due_reminders, fcm_token_cache
+
+# The benchmark calls send_due_reminders itself
+app = baby_backend.create_app(bench_env.config())
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.count = 0
+        sa.event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def seed(users):
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    db.session.execute(sa.insert(FCMToken.__table__), [
+        {'user_id': user_id, 'token': f"token-{user_id}", 'platform': 'ios'} for user_id in range(1, users + 1)
+    ])
+    db.session.execute(sa.insert(Todo.__table__), [
+        {'user_id': user_id, 'time': now, 'notes': 'Bottle', 'reminder_time': now,
+         'completed': False, 'reminder_notified': False}
+        for user_id in range(1, users + 1)
+    ])
+    db.session.commit()
+    return [('todo', todo_id) for todo_id in db.session.execute(sa.select(Todo.id)).scalars()]
+
+
+def measure(counter, run):
+    before = counter.count
+    started = time.perf_counter()
+    run()
+    return counter.count - before, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        keys = seed(args.users)
+        counter = StatementCounter(db.engine)
+
+        def per_todo_lookups():
+            for todo in Todo.query.all():
+                FCMToken.query.filter_by(user_id=todo.user_id).all()
+
+        def reset():
+            db.session.execute(sa.update(Todo).values(reminder_notified=False))
+            db.session.commit()
+
+        results = [('per-todo token lookups (old)', measure(counter, per_todo_lookups))]
+        results.append(('send_due_reminders, cold cache', measure(counter, lambda: send_due_reminders(app, keys))))
+        reset()
+        results.append(('send_due_reminders, warm cache', measure(counter, lambda: send_due_reminders(app, keys))))
+        fcm_token_cache().invalidate()
+
+    print(f"{len(keys)} due reminders")
+    for name, (statements, ms) in results:
+        print(f"{name:32} {statements:6} statements {ms:10.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
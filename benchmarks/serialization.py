@@ -0,0 +1,110 @@
+"""Rows per second through the list endpoint serialization, old path vs new.
+
+The old path loads ORM objects, builds dicts with isoformat()/strftime() per
+row and encodes them with the standard json module, as the GET handlers
+used to. The new path is list_records: a Core select of the needed columns,
+a precompiled row encoder and orjson.
+
+    python benchmarks/serialization.py --rows 50000
+"""
+import argparse
+import datetime
+import json
+import time
+
+# Sets up sys.path, so it comes before the other imports
+import bench_env
+
+import sqlalchemy as sa
+
+import baby_backend
+from baby_backend import db, Feeding, Todo, list_records
+
+app = baby_backend.create_app(bench_env.config())
+
+
+def seed(rows):
+    start = datetime.datetime(2020, 1, 1)
+    db.session.execute(sa.insert(Feeding.__table__), [
+        {'user_id': 1, 'type': 'Bottle', 'bottle_amount': 120, 'notes': 'Finished the bottle',
+         'start_time': start + datetime.timedelta(minutes=10 * i),
+         'end_time': start + datetime.timedelta(minutes=10 * i + 20)}
+        for i in range(rows)
+    ])
+    db.session.execute(sa.insert(Todo.__table__), [
+        {'user_id': 1, 'time': start + datetime.timedelta(minutes=10 * i), 'notes': 'Vitamin D drops',
+         'reminder_time': start + datetime.timedelta(minutes=10 * i + 5), 'completed': False,
+         'reminder_notified': True}
+        for i in range(rows)
+    ])
+    db.session.commit()
+
+
+def old_feedings():
+    feedings = Feeding.query.filter_by(user_id=1).order_by(Feeding.start_time.desc()).all()
+    return json.dumps([{
+        "id": f.id,
+        "type": f.type,
+        "start_time": f.start_time.isoformat(),
+        "end_time": f.end_time.isoformat(),
+        "left_breast_duration": f.left_breast_duration,
+        "right_breast_duration": f.right_breast_duration,
+        "bottle_amount": f.bottle_amount,
+        "details": f"Type: {f.type}, Duration: {(f.end_time - f.start_time).total_seconds() / 60:.0f} minutes",
+        "notes": f.notes
+    } for f in feedings], sort_keys=True)
+
+
+def old_todos():
+    todos = Todo.query.filter_by(user_id=1).order_by(Todo.time.desc()).all()
+    return json.dumps([{
+        "id": t.id,
+        "time": t.time.replace(tzinfo=datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "notes": t.notes,
+        "completed": t.completed,
+        "reminder_time": t.reminder_time.replace(tzinfo=datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ") if t.reminder_time else None
+    } for t in todos], sort_keys=True)
+
+
+def new_list(record_type, query_string=''):
+    def run():
+        with app.test_request_context(f'/?{query_string}'):
+            return list_records(1, record_type).get_data()
+    return run
+
+
+def timed(run, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        seed(args.rows)
+
+        cases = [
+            ('feeding, old path', old_feedings),
+            ('feeding, list_records', new_list('feeding')),
+            ('feeding, fields=id,start_time', new_list('feeding', 'fields=id,start_time')),
+            ('todo, old path', old_todos),
+            ('todo, list_records', new_list('todo')),
+        ]
+        print(f"{args.rows} rows per type, best of {args.repeat}")
+        for name, run in cases:
+            seconds = timed(run, args.repeat)
+            print(f"{name:32} {seconds * 1000:9.1f} ms {args.rows / seconds:12,.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
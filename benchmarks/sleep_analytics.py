@@ -0,0 +1,66 @@
+"""Timing of the sleep analytics over a long synthetic sleep history.
+
+    python benchmarks/sleep_analytics.py --sleeps 100000
+"""
+import argparse
+import datetime
+import time
+
+# Sets up sys.path, so it comes before the other imports
+import bench_env
+
+import numpy as np
+
+import sleep_analytics
+
+
+def make_history(sleeps):
+    """Alternating naps and night sleeps with random wake windows, as datetimes."""
+    rng = np.random.default_rng(42)
+    awake = rng.integers(60, 240, sleeps)
+    asleep = rng.integers(30, 600, sleeps)
+    offsets = np.cumsum(awake + asleep) - asleep
+    start = datetime.datetime(2000, 1, 1)
+    starts = [start + datetime.timedelta(minutes=int(m)) for m in offsets]
+    ends = [s + datetime.timedelta(minutes=int(m)) for s, m in zip(starts, asleep)]
+    return starts, ends
+
+
+def python_wake_windows(starts, ends):
+    # One previous-sleep comparison per row, as add_sleep/update_sleep do
+    windows = [None]
+    for previous_end, start in zip(ends, starts[1:]):
+        windows.append(int((start - previous_end).total_seconds() / 60))
+    return windows
+
+
+def timed(run, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sleeps', type=int, default=100000)
+    args = parser.parse_args()
+
+    starts, ends = make_history(args.sleeps)
+    first_day, last_day = starts[0].date(), ends[-1].date()
+
+    convert_ms = timed(lambda: (sleep_analytics.to_datetime64(starts), sleep_analytics.to_datetime64(ends)))
+    starts64, ends64 = sleep_analytics.to_datetime64(starts), sleep_analytics.to_datetime64(ends)
+
+    print(f"{args.sleeps} sleeps over {(last_day - first_day).days + 1} days")
+    print(f"datetime -> datetime64 conversion:     {convert_ms:8.2f} ms")
+    print(f"wake windows, numpy:                   {timed(lambda: sleep_analytics.wake_windows(starts64, ends64)):8.2f} ms")
+    print(f"wake windows, python loop:             {timed(lambda: python_wake_windows(starts, ends)):8.2f} ms")
+    print(f"full summary (all days):               "
+          f"{timed(lambda: sleep_analytics.sleep_summary(starts64, ends64, first_day, last_day)):8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""An executor that turns work away instead of queueing it without limit.
+
+The password hasher and the AI chat pool both run slow work off the request
+threads. If their queues could grow without bound, a burst of logins or
+chats would leave every request thread waiting on them; with a bound, the
+callers beyond it get an error straight away and can answer with a 503.
+"""
+import threading
+
+
+class ExecutorBusy(Exception):
+    """Raised when ``max_workers`` tasks are running and ``max_queue`` more are waiting."""
+
+
+class BoundedExecutor:
+    """Admits at most ``max_workers + max_queue`` tasks at a time.
+
+    ``make_executor`` is called with ``max_workers`` on the first submit and
+    returns the concurrent.futures executor that runs the tasks.
+    """
+
+    def __init__(self, make_executor, max_workers, max_queue):
+        self.make_executor = make_executor
+        self.max_workers = max_workers
+        self.max_pending = max_workers + max_queue
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise ExecutorBusy()
+            self._pending += 1
+            if self._executor is None:
+                self._executor = self.make_executor(self.max_workers)
+            executor = self._executor
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown()
@@ -0,0 +1,211 @@
+"""Per-user archives of old activity rows in compressed columnar files.
+
+Each user's archive is one ``<user_id>.npz`` file: NumPy's zip of arrays,
+deflate compressed. For every record type it holds one array per column,
+named ``<record type>.<column>``. Datetimes are stored as datetime64, numbers
+as int64 or float64 and text as fixed-width unicode. A nullable column also
+gets a boolean ``.null`` mask. Rows are kept sorted by (time, id), so a time
+range is a binary search and only the rows it covers are turned back into
+Python values.
+
+Files are only ever replaced whole (written to a temporary file and renamed),
+so readers in other processes see either the old or the new archive.
+"""
+import collections
+import datetime
+import os
+import tempfile
+import threading
+
+import numpy as np
+import sqlalchemy as sa
+
+# Rows decoded at a time when iterating a whole archive
+DECODE_BATCH_SIZE = 1000
+
+
+def _column_dtype(column):
+    if isinstance(column.type, sa.DateTime):
+        return np.dtype('datetime64[us]')
+    if isinstance(column.type, sa.Date):
+        return np.dtype('datetime64[D]')
+    if isinstance(column.type, sa.Boolean):
+        return np.dtype(bool)
+    if isinstance(column.type, sa.Integer):
+        return np.dtype(np.int64)
+    if isinstance(column.type, sa.Float):
+        return np.dtype(np.float64)
+    return np.dtype(str)
+
+
+def _fill_value(dtype):
+    if dtype.kind == 'M':
+        return datetime.datetime(1970, 1, 1)
+    if dtype.kind == 'U':
+        return ''
+    return 0
+
+
+class ArchiveStore:
+    """Reads and writes the archives under ``directory``.
+
+    ``sources`` maps each record type to its table and the name of its time
+    column. The most recently used ``cache_size`` archives stay loaded; a
+    cached archive is reloaded when its file changes.
+    """
+
+    def __init__(self, directory, sources, cache_size=128):
+        self.directory = directory
+        self.sources = sources
+        self.cache_size = cache_size
+        self._row_types = {
+            record_type: collections.namedtuple('Row', [column.name for column in table.columns])
+            for record_type, (table, _) in sources.items()
+        }
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, user_id):
+        return os.path.join(self.directory, f"{user_id}.npz")
+
+    def load(self, user_id):
+        """The user's archive as ``{name: array}``, empty if there is none."""
+        path = self.path(user_id)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return {}
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached and cached[0] == version:
+                self._cache.move_to_end(user_id)
+                return cached[1]
+        with np.load(path) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+        with self._lock:
+            self._cache[user_id] = (version, arrays)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return arrays
+
+    def iter_records(self, user_id, record_type, start=None, end=None, before=None, limit=None, descending=False):
+        """Archived rows of one type with a time in [start, end), as named tuples.
+
+        Rows come in (time, id) order, or the reverse with ``descending``.
+        ``before`` is a (time, id) keyset cursor; only rows that sort before
+        it are returned.
+        """
+        arrays = self.load(user_id)
+        table, time_column = self.sources[record_type]
+        prefix = f"{record_type}."
+        if prefix + 'id' not in arrays:
+            return
+        times = arrays[prefix + time_column]
+        dtype = times.dtype
+
+        low = 0 if start is None else int(np.searchsorted(times, np.array(start, dtype=dtype), 'left'))
+        high = len(times) if end is None else int(np.searchsorted(times, np.array(end, dtype=dtype), 'left'))
+        if before is not None:
+            before_time = np.array(before[0], dtype=dtype)
+            first_equal = int(np.searchsorted(times, before_time, 'left'))
+            last_equal = int(np.searchsorted(times, before_time, 'right'))
+            ids = arrays[prefix + 'id'][first_equal:last_equal]
+            high = min(high, first_equal + int(np.searchsorted(ids, before[1], 'left')))
+        if high <= low:
+            return
+        if limit is not None:
+            low, high = (max(low, high - limit), high) if descending else (low, min(high, low + limit))
+
+        row_type = self._row_types[record_type]
+        columns = [column.name for column in table.columns]
+        batch_starts = range(low, high, DECODE_BATCH_SIZE)
+        for batch_start in reversed(batch_starts) if descending else batch_starts:
+            batch = slice(batch_start, min(batch_start + DECODE_BATCH_SIZE, high))
+            values = []
+            for name in columns:
+                column_values = arrays[prefix + name][batch].tolist()
+                nulls = arrays.get(prefix + name + '.null')
+                if nulls is not None:
+                    column_values = [None if null else value for value, null in zip(column_values, nulls[batch].tolist())]
+                values.append(column_values)
+            rows = [row_type(*row) for row in zip(*values)]
+            if descending:
+                rows.reverse()
+            yield from rows
+
+    def columns(self, user_id, record_type, names):
+        """Whole columns of the user's archived rows of one type, in (time, id) order.
+
+        Returns ``{name: array}`` without turning anything into Python
+        values, which suits NumPy code reading a user's whole history. Null
+        values come back as the column's fill value, so this is meant for
+        columns that can't be null.
+        """
+        arrays = self.load(user_id)
+        table, _ = self.sources[record_type]
+        prefix = f"{record_type}."
+        return {
+            name: arrays.get(prefix + name, np.empty(0, dtype=_column_dtype(table.c[name])))
+            for name in names
+        }
+
+    def count(self, user_id, record_type):
+        return len(self.load(user_id).get(f"{record_type}.id", ()))
+
+    def records(self, user_id, record_type, start=None, end=None, before=None, limit=None, descending=False):
+        return list(self.iter_records(user_id, record_type, start, end, before, limit, descending))
+
+    def append(self, user_id, rows_by_type):
+        """Add rows (anything with the table's columns as attributes) to the user's archive.
+
+        Rows whose id is already archived replace the archived copy, so
+        archiving the same rows twice is harmless.
+        """
+        arrays = dict(self.load(user_id))
+        for record_type, rows in rows_by_type.items():
+            if not rows:
+                continue
+            table, time_column = self.sources[record_type]
+            prefix = f"{record_type}."
+            new = self._encode(table, rows)
+            if prefix + 'id' in arrays:
+                keep = ~np.isin(arrays[prefix + 'id'], new['id'])
+                old = {name[len(prefix):]: array[keep] for name, array in arrays.items() if name.startswith(prefix)}
+                new = {name: np.concatenate([old[name], new[name]]) for name in new}
+            order = np.lexsort((new['id'], new[time_column]))
+            for name, array in new.items():
+                arrays[prefix + name] = array[order]
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.npz.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+                # The rows are deleted from the database next, so the file
+                # has to be on disk first
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path(user_id))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def _encode(self, table, rows):
+        arrays = {}
+        for column in table.columns:
+            dtype = _column_dtype(column)
+            values = [getattr(row, column.name) for row in rows]
+            if column.nullable:
+                nulls = np.array([value is None for value in values])
+                fill = _fill_value(dtype)
+                values = [fill if value is None else value for value in values]
+                arrays[column.name + '.null'] = nulls
+            arrays[column.name] = np.array(values, dtype=dtype)
+        return arrays
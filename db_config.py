@@ -0,0 +1,72 @@
+"""Database engine configuration, chosen by environment.
+
+DATABASE_URL picks the database (default: SQLite in /tmp).
+
+SQLite runs in WAL mode so readers don't block behind the writer. Writers
+wait up to SQLITE_BUSY_TIMEOUT_MS for the lock instead of failing straight
+away. synchronous=NORMAL (SQLITE_SYNCHRONOUS) is safe in WAL mode but may
+lose the last commits on power loss; FULL syncs every commit. Reads go
+through a SQLITE_MMAP_SIZE byte memory map.
+
+PostgreSQL gets a connection pool of DB_POOL_SIZE connections plus
+DB_MAX_OVERFLOW extra under load, checked with a ping before use and
+recycled after DB_POOL_RECYCLE seconds.
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URL = 'sqlite:////tmp/baby_tracker.db'
+
+
+def database_uri():
+    uri = os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL)
+    # Hosting providers hand out postgres:// URLs, which SQLAlchemy no longer accepts
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def is_sqlite(uri):
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+
+def engine_options(uri):
+    """Keyword arguments for create_engine (SQLALCHEMY_ENGINE_OPTIONS)."""
+    if is_sqlite(uri):
+        return {
+            # Python's sqlite3 waits this long (seconds) for a lock before raising
+            "connect_args": {"timeout": int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000},
+        }
+    return {
+        "pool_size": int(os.getenv('DB_POOL_SIZE', 5)),
+        "max_overflow": int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        "pool_timeout": int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        "pool_recycle": int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        "pool_pre_ping": True,
+    }
+
+
+def sqlite_pragmas():
+    return {
+        "journal_mode": "WAL",
+        "busy_timeout": int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        "synchronous": os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        "mmap_size": int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    }
+
+
+def configure_engine(engine):
+    """Apply the per-connection settings that can't go through create_engine."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
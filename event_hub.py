@@ -0,0 +1,206 @@
+"""Record change events for the /events stream.
+
+Handlers don't publish anything themselves: the backend turns every
+committed change to a synced record into an event and hands it to the
+EventHub. The hub passes events to a broker, and the broker delivers them to
+the hub of every process serving /events streams:
+
+- LocalBroker delivers straight back to this process. It is enough for a
+  single worker.
+- SQLBroker appends events to a database table that every worker polls. It
+  is for running several gunicorn workers.
+"""
+import datetime
+import itertools
+import logging
+import queue
+import threading
+import time
+
+import sqlalchemy as sa
+
+log = logging.getLogger(__name__)
+
+
+class StreamsBusy(Exception):
+    """Raised when this process already serves as many streams as it allows."""
+
+
+class Subscription:
+    """The events for one open stream, in a bounded queue.
+
+    A stream that falls more than ``max_queue`` events behind is marked
+    ``overflowed`` and gets no more events; the client should reconnect and
+    catch up with /sync.
+    """
+
+    def __init__(self, hub, user_id, max_queue):
+        self.hub = hub
+        self.user_id = user_id
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize=max_queue)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """The next ``(event id, payload)``, or None if nothing arrived within ``timeout`` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class EventHub:
+    """Fans events out to the streams open in this process.
+
+    An event is ``(user_id, payload)``, where ``payload`` is the JSON text
+    sent as the event's data. At most ``max_subscribers`` streams may be
+    open at once, since each one holds a worker thread.
+    """
+
+    def __init__(self, broker, max_subscribers=8, max_queue=256):
+        self.broker = broker
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self._subscribers = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def wants(self, user_id):
+        """Whether events for ``user_id`` could reach any stream.
+
+        Callers use this to skip building events nobody will read. Only the
+        local broker can tell; with a shared broker a stream may be open in
+        another process.
+        """
+        return self.broker.shared or user_id in self._subscribers
+
+    def subscribe(self, user_id):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise StreamsBusy()
+            self._count += 1
+            subscription = Subscription(self, user_id, self.max_queue)
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        self.broker.start(self.deliver)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, events):
+        if events:
+            self.broker.publish(events)
+
+    def deliver(self, events):
+        """Queue ``(event id, user_id, payload)`` events for this process's streams."""
+        with self._lock:
+            for event_id, user_id, payload in events:
+                for subscription in self._subscribers.get(user_id, ()):
+                    subscription.put((event_id, payload))
+
+
+class LocalBroker:
+    """Delivers events to the hub of this process only."""
+
+    shared = False
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._deliver = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, events):
+        if self._deliver:
+            self._deliver([(next(self._ids), user_id, payload) for user_id, payload in events])
+
+
+class SQLBroker:
+    """Shares events between processes through a database table.
+
+    ``table`` needs an integer ``id`` primary key that is never reused
+    (sqlite_autoincrement on SQLite), plus ``user_id``, ``payload`` (text)
+    and ``created_at`` columns. A process starts polling the table every
+    ``poll_interval`` seconds once it has its first stream. From then on it
+    delivers every event added after that. Events older than ``retention``
+    seconds are deleted while polling.
+    """
+
+    shared = True
+
+    # Ids are handed out before the inserting transaction commits, so an
+    # event can become visible after one with a higher id. Events are looked
+    # at again until they are this old.
+    SETTLE_SECONDS = 5
+
+    def __init__(self, get_engine, table, now, poll_interval=0.5, retention=300):
+        self.get_engine = get_engine
+        self.table = table
+        self.now = now
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, deliver):
+        with self._lock:
+            if self._thread is None:
+                # Called while serving a request, where get_engine works
+                engine = self.get_engine()
+                self._thread = threading.Thread(target=self._poll, args=(engine, deliver), name="event-poller", daemon=True)
+                self._thread.start()
+
+    def publish(self, events):
+        created_at = self.now()
+        with self.get_engine().begin() as conn:
+            conn.execute(self.table.insert(), [
+                {"user_id": user_id, "payload": payload, "created_at": created_at} for user_id, payload in events
+            ])
+
+    def _poll(self, engine, deliver):
+        table = self.table
+        with engine.connect() as conn:
+            low_water = conn.execute(sa.select(sa.func.max(table.c.id))).scalar() or 0
+        delivered = set()
+        last_cleanup = time.monotonic()
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                with engine.begin() as conn:
+                    rows = conn.execute(
+                        sa.select(table.c.id, table.c.user_id, table.c.payload, table.c.created_at)
+                        .where(table.c.id > low_water)
+                        .order_by(table.c.id)
+                    ).all()
+                    if time.monotonic() - last_cleanup > self.retention / 10:
+                        cutoff = self.now() - datetime.timedelta(seconds=self.retention)
+                        conn.execute(table.delete().where(table.c.created_at < cutoff))
+                        last_cleanup = time.monotonic()
+            except Exception:
+                log.exception("Error polling for events")
+                continue
+
+            new = [(row.id, row.user_id, row.payload) for row in rows if row.id not in delivered]
+            if new:
+                delivered.update(event[0] for event in new)
+                deliver(new)
+            settled = self.now() - datetime.timedelta(seconds=self.SETTLE_SECONDS)
+            settled_ids = [row.id for row in rows if row.created_at < settled]
+            if settled_ids:
+                low_water = max(settled_ids)
+                delivered = {event_id for event_id in delivered if event_id > low_water}
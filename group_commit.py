@@ -0,0 +1,89 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+log = logging.getLogger(__name__)
+
+
+class WriteTimeout(Exception):
+    """Raised when a write was not committed within the committer's timeout.
+
+    The write is still queued and may be committed later.
+    """
+
+
+class GroupCommitter:
+    """Commits writes from many request threads in shared transactions.
+
+    ``submit(write)`` queues ``write`` and blocks until it is committed. One
+    writer thread takes everything queued so far, up to ``max_batch``
+    writes, and passes them to ``commit(writes)``. That function runs them in
+    one transaction, commits, and returns their results in order. With
+    ``max_delay`` the thread waits up to that many seconds after the first
+    write for the batch to fill. Without it, a batch is whatever queued up
+    while the previous one was committing, so a lone client pays no extra
+    latency.
+
+    If a batch fails, each of its writes is retried in a transaction of its
+    own. The write that caused the failure then gets its own exception and
+    the rest still commit. Writes must therefore be safe to run again after
+    a rollback, i.e. only change the database.
+    """
+
+    def __init__(self, commit, max_batch=64, max_delay=0.0, timeout=10):
+        self.commit = commit
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, write):
+        future = Future()
+        self._queue.put((write, future))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise WriteTimeout()
+
+    def _take_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                results = self.commit([write for write, _ in batch])
+            except Exception as exc:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(exc)
+                    continue
+                log.info("Group commit failed, retrying writes one by one", extra={"writes": len(batch)})
+                for write, future in batch:
+                    try:
+                        [result] = self.commit([write])
+                    except Exception as exc:
+                        future.set_exception(exc)
+                    else:
+                        future.set_result(result)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,89 @@
+import csv
+import functools
+import os
+
+import numpy as np
+
+REFERENCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'who_growth_lms.csv')
+
+INDICATORS = ('weight', 'length', 'head_circumference')
+SEXES = ('male', 'female')
+
+# The WHO standards end at five years (60 months of 30.4375 days)
+MAX_AGE_DAYS = 1826
+
+# Weight and head circumference are skewed, so WHO measures z-scores beyond
+# +/-3 in units of the distance between the 2 and 3 SD curves instead
+RESTRICTED_TAILS = {'weight', 'head_circumference'}
+
+
+class GrowthReference:
+    """WHO LMS curves as arrays indexed by ``[sex, age in days]``.
+
+    The bundled table has weekly points for the first 13 weeks and monthly
+    points after that; L, M and S are interpolated linearly to every day once,
+    when the reference is loaded, so scoring a measurement is an array lookup.
+    """
+
+    def __init__(self, path=REFERENCE_FILE):
+        points = {}
+        with open(path, newline='') as f:
+            for row in csv.DictReader(line for line in f if not line.startswith('#')):
+                points.setdefault((row['indicator'], row['sex']), []).append(
+                    [float(row[column]) for column in ('age_days', 'L', 'M', 'S')]
+                )
+
+        days = np.arange(MAX_AGE_DAYS + 1)
+        self.lms = {}
+        for indicator in INDICATORS:
+            curves = np.empty((len(SEXES), len(days), 3))
+            for sex_index, sex in enumerate(SEXES):
+                table = np.array(points[(indicator, sex)])
+                for parameter in range(3):
+                    curves[sex_index, :, parameter] = np.interp(days, table[:, 0], table[:, parameter + 1])
+            self.lms[indicator] = curves
+
+    def z_scores(self, indicator, sex, age_days, values):
+        """z-scores of ``values`` measured at ``age_days``, for one sex.
+
+        Ages outside 0 to MAX_AGE_DAYS and missing values (NaN) give NaN.
+        """
+        age_days = np.asarray(age_days, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        in_range = (age_days >= 0) & (age_days <= MAX_AGE_DAYS)
+        curves = self.lms[indicator][SEXES.index(sex), np.clip(age_days, 0, MAX_AGE_DAYS)]
+        L, M, S = curves[:, 0], curves[:, 1], curves[:, 2]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = np.where(L == 0, np.log(values / M) / S, ((values / M) ** L - 1) / (L * S))
+            if indicator in RESTRICTED_TAILS:
+                sd2, sd3 = lms_value(L, M, S, 2), lms_value(L, M, S, 3)
+                z = np.where(z > 3, 3 + (values - sd3) / (sd3 - sd2), z)
+                sd2, sd3 = lms_value(L, M, S, -2), lms_value(L, M, S, -3)
+                z = np.where(z < -3, -3 + (values - sd3) / (sd2 - sd3), z)
+        return np.where(in_range, z, np.nan)
+
+    def percentiles(self, indicator, sex, age_days, values):
+        return normal_cdf(self.z_scores(indicator, sex, age_days, values)) * 100
+
+
+def lms_value(L, M, S, z):
+    """The measurement at z-score ``z`` on the LMS curve."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(L == 0, M * np.exp(S * z), M * (1 + L * S * z) ** (1 / L))
+
+
+def normal_cdf(z):
+    # Abramowitz and Stegun 7.1.26, accurate to about 1e-7, which is plenty
+    # for percentiles and avoids depending on SciPy for erf
+    x = np.abs(z) / np.sqrt(2)
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1 - poly * np.exp(-x * x)
+    return 0.5 * (1 + np.sign(z) * erf)
+
+
+@functools.lru_cache(maxsize=None)
+def reference():
+    """The bundled WHO reference, loaded on first use."""
+    return GrowthReference()
@@ -0,0 +1,147 @@
+"""Prometheus metrics for requests, SQL, the reminder scheduler, FCM and group commit.
+
+With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR to an empty
+directory so /metrics reports every worker, not just the one answering.
+"""
+import os
+import threading
+import time
+
+from flask import Response, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess
+)
+from sqlalchemy import event
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', "Time spent handling a request",
+    ['method', 'route', 'status']
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', "Size of response bodies (streamed responses excluded)",
+    ['method', 'route'], buckets=SIZE_BUCKETS
+)
+REQUEST_SQL_STATEMENTS = Histogram(
+    'http_request_sql_statements', "SQL statements executed per request",
+    ['method', 'route'], buckets=COUNT_BUCKETS
+)
+REQUEST_SQL_SECONDS = Histogram(
+    'http_request_sql_duration_seconds', "Time spent in SQL per request",
+    ['method', 'route']
+)
+REMINDER_JOB_SECONDS = Histogram(
+    'reminder_job_duration_seconds', "Time spent sending one batch of due reminders"
+)
+REMINDER_JOB_FAILURES = Counter(
+    'reminder_job_failures_total', "Reminder batches that raised an error"
+)
+FCM_BATCH_SECONDS = Histogram(
+    'fcm_batch_duration_seconds', "Latency of one FCM batch send"
+)
+FCM_MESSAGES = Counter(
+    'fcm_messages_total', "FCM messages by outcome",
+    ['outcome']
+)
+GROUP_COMMIT_BATCH_SIZE = Histogram(
+    'group_commit_batch_size', "Writes committed together by the group commit thread",
+    buckets=COUNT_BUCKETS
+)
+
+# SQL statements and time of the request running on this thread
+_sql = threading.local()
+
+
+def _start_sql_tally():
+    _sql.statements = 0
+    _sql.seconds = 0.0
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    if getattr(_sql, 'statements', None) is not None:
+        _sql.statements += 1
+        _sql.seconds += time.perf_counter() - started
+
+
+def instrument_engine(engine):
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def init_app(app):
+    """Time every request and serve the metrics at /metrics."""
+
+    @app.before_request
+    def start_timer():
+        request.environ['metrics.started'] = time.perf_counter()
+        _start_sql_tally()
+
+    @app.after_request
+    def record_request(response):
+        started = request.environ.get('metrics.started')
+        if started is None:
+            return response
+        # The route pattern keeps the label set small (no ids)
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        method = request.method
+        REQUEST_LATENCY.labels(method, route, str(response.status_code)).observe(time.perf_counter() - started)
+        if not response.is_streamed:
+            RESPONSE_SIZE.labels(method, route).observe(response.calculate_content_length() or 0)
+        REQUEST_SQL_STATEMENTS.labels(method, route).observe(_sql.statements)
+        REQUEST_SQL_SECONDS.labels(method, route).observe(_sql.seconds)
+        _sql.statements = None
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def timed_job(job):
+    """Wrap a reminder scheduler callback to record its duration and failures."""
+    def run(keys):
+        started = time.perf_counter()
+        try:
+            return job(keys)
+        except Exception:
+            REMINDER_JOB_FAILURES.inc()
+            raise
+        finally:
+            REMINDER_JOB_SECONDS.observe(time.perf_counter() - started)
+    return run
+
+
+class InstrumentedTransport:
+    """Wraps an FCM transport to record batch latency and message outcomes."""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def send_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            results = self.transport.send_batch(batch)
+        except Exception:
+            FCM_MESSAGES.labels('error').inc(len(batch))
+            raise
+        finally:
+            FCM_BATCH_SECONDS.observe(time.perf_counter() - started)
+        for result in results:
+            FCM_MESSAGES.labels('success' if result.success else 'invalid' if result.invalid else 'failed').inc()
+        return results
+
+    def __getattr__(self, name):
+        # Keep StubTransport's .sent and .batches reachable
+        return getattr(self.transport, name)
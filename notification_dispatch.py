@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# One notification for every device token of a user. ``key`` is whatever the
+# caller uses to recognise the notification in the results (e.g. a Todo id).
+Notification = namedtuple('Notification', ['key', 'tokens', 'title', 'body', 'data'], defaults=[None])
+
+# Outcome of sending to a single token. ``invalid`` means the token will never
+# work again and should be removed.
+SendResult = namedtuple('SendResult', ['success', 'invalid', 'error'])
+
+# FCM accepts at most 500 messages per batch request
+MAX_BATCH_SIZE = 500
+
+log = logging.getLogger(__name__)
+
+
+class FCMTransport:
+    """Sends batches of messages through Firebase Cloud Messaging.
+
+    ``get_app`` returns the Firebase app to send with; it is called on the
+    first send, so the credentials are only read once they are needed.
+    """
+
+    def __init__(self, get_app=None):
+        self.get_app = get_app
+
+    def send_batch(self, batch):
+        from firebase_admin import messaging
+
+        messages = [
+            messaging.Message(
+                token=token,
+                notification=messaging.Notification(title=title, body=body),
+                data=data
+            )
+            for token, title, body, data in batch
+        ]
+        response = messaging.send_each(messages, app=self.get_app() if self.get_app else None)
+        invalid_token_errors = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+        return [
+            SendResult(r.success, isinstance(r.exception, invalid_token_errors), r.exception)
+            for r in response.responses
+        ]
+
+
+class StubTransport:
+    """Local stand-in for FCMTransport that records messages instead of sending them.
+
+    ``latency`` is slept once per batch to model the FCM round trip, and any
+    token in ``invalid_tokens`` is reported as unregistered.
+    """
+
+    def __init__(self, latency=0.0, invalid_tokens=()):
+        self.latency = latency
+        self.invalid_tokens = set(invalid_tokens)
+        self.sent = []
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def send_batch(self, batch):
+        if self.latency:
+            time.sleep(self.latency)
+        results = []
+        for token, title, body, data in batch:
+            if token in self.invalid_tokens:
+                results.append(SendResult(False, True, "Token is not registered"))
+            else:
+                results.append(SendResult(True, False, None))
+        with self._lock:
+            self.batches += 1
+            self.sent.extend(message for message, result in zip(batch, results) if result.success)
+        return results
+
+
+class DispatchResult:
+    def __init__(self):
+        self.delivered = set()
+        self.invalid_tokens = set()
+        self.sent = 0
+        self.failed = 0
+
+
+class NotificationDispatcher:
+    """Fans notifications out to device tokens in batches on a bounded pool of threads."""
+
+    def __init__(self, transport, max_workers=4, batch_size=MAX_BATCH_SIZE):
+        self.transport = transport
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fcm-dispatch")
+
+    def dispatch(self, notifications):
+        keys = []
+        messages = []
+        for notification in notifications:
+            for token in notification.tokens:
+                keys.append(notification.key)
+                messages.append((token, notification.title, notification.body, notification.data))
+
+        batches = [
+            messages[start:start + self.batch_size]
+            for start in range(0, len(messages), self.batch_size)
+        ]
+
+        result = DispatchResult()
+        index = 0
+        for batch, outcomes in zip(batches, self.executor.map(self._send, batches)):
+            for (token, _, _, _), outcome in zip(batch, outcomes):
+                if outcome.success:
+                    result.sent += 1
+                    result.delivered.add(keys[index])
+                else:
+                    result.failed += 1
+                    log.warning("Error sending notification", extra={"token": token, "error": str(outcome.error)})
+                    if outcome.invalid:
+                        result.invalid_tokens.add(token)
+                index += 1
+        return result
+
+    def _send(self, batch):
+        try:
+            return self.transport.send_batch(batch)
+        except Exception as e:
+            # The whole request failed, count every message in it as failed
+            return [SendResult(False, False, e)] * len(batch)
+
+
+class TokenCache:
+    """Device tokens per user, loaded in bulk for the users that are missing.
+
+    ``load`` takes a list of user ids and returns ``{user_id: [token, ...]}``.
+    Entries expire after ``ttl`` seconds so tokens registered through another
+    worker are picked up eventually; this process invalidates its own entries
+    whenever it changes a user's tokens.
+    """
+
+    def __init__(self, load, ttl=300):
+        self.load = load
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, user_ids):
+        now = time.monotonic()
+        tokens = {}
+        missing = []
+        with self._lock:
+            for user_id in set(user_ids):
+                entry = self._entries.get(user_id)
+                if entry and entry[0] > now:
+                    tokens[user_id] = entry[1]
+                else:
+                    missing.append(user_id)
+
+        if missing:
+            loaded = self.load(missing)
+            with self._lock:
+                for user_id in missing:
+                    tokens[user_id] = loaded.get(user_id, [])
+                    self._entries[user_id] = (now + self.ttl, tokens[user_id])
+        return tokens
+
+    def invalidate(self, user_ids=None):
+        with self._lock:
+            if user_ids is None:
+                self._entries.clear()
+            else:
+                for user_id in user_ids:
+                    self._entries.pop(user_id, None)
@@ -0,0 +1,123 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+from bounded_executor import BoundedExecutor, ExecutorBusy
+
+# bcrypt only looks at the first 72 bytes; newer versions of the library
+# raise instead of ignoring the rest, so cut them off like older ones did
+MAX_PASSWORD_BYTES = 72
+
+
+class HashingBusy(Exception):
+    """Raised when too many passwords are already being hashed or waiting."""
+
+
+class HashingTimeout(Exception):
+    pass
+
+
+def _encode(password):
+    return password.encode('utf-8')[:MAX_PASSWORD_BYTES]
+
+
+def hash_password(password, rounds):
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def check_password(hashed, password):
+    return bcrypt.checkpw(_encode(password), hashed.encode('utf-8'))
+
+
+def hash_rounds(hashed):
+    """The bcrypt cost stored in a hash such as ``$2b$12$...``."""
+    return int(hashed.split('$')[2])
+
+
+def calibrate_rounds(target_seconds, min_rounds=12, max_rounds=14, sample_rounds=8):
+    """The largest bcrypt cost whose hash takes at most ``target_seconds`` here.
+
+    Never less than ``min_rounds``, the cost Flask-Bcrypt used before, so a
+    slow host keeps hashes at least as strong. Every extra round doubles the
+    work, so one cheap hash at ``sample_rounds`` is enough to estimate the
+    others.
+    """
+    sample = min(_time_hash(sample_rounds) for _ in range(3))
+    rounds = min_rounds
+    while rounds < max_rounds and sample * 2 ** (rounds + 1 - sample_rounds) <= target_seconds:
+        rounds += 1
+    return rounds
+
+
+def _process_pool(max_workers):
+    # Forking a process with running threads can copy held locks, so the
+    # workers are forked from a separate fork server
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__])
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+
+def _time_hash(rounds):
+    started = time.perf_counter()
+    bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds))
+    return time.perf_counter() - started
+
+
+class PasswordHasher:
+    """Hashes and checks passwords on a BoundedExecutor of processes.
+
+    bcrypt is deliberately slow, so running it in processes keeps a burst of
+    logins from starving the other endpoints of CPU. At most ``max_workers``
+    hashes run at once and ``max_queue`` more may wait; anything beyond that
+    raises HashingBusy. ``timeout`` is the total number of seconds a caller
+    waits.
+
+    ``rounds`` is the bcrypt cost of new hashes. Without it the cost is
+    calibrated on first use so that one hash takes about ``target_seconds``.
+    Checking always uses the cost stored in the hash, and ``needs_rehash``
+    tells whether it is below the current cost. The processes are also
+    started on first use, so importing the app stays cheap.
+    """
+
+    def __init__(self, rounds=None, target_seconds=0.25, max_workers=1, max_queue=8, timeout=10):
+        self._rounds = rounds
+        self.target_seconds = target_seconds
+        self.timeout = timeout
+        self.executor = BoundedExecutor(_process_pool, max_workers, max_queue)
+        self._lock = threading.Lock()
+
+    @property
+    def rounds(self):
+        with self._lock:
+            if self._rounds is None:
+                self._rounds = calibrate_rounds(self.target_seconds)
+            return self._rounds
+
+    def pending(self):
+        return self.executor.pending()
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.rounds)
+
+    def check(self, hashed, password):
+        return self._run(check_password, hashed, password)
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) < self.rounds
+
+    def _run(self, fn, *args):
+        try:
+            future = self.executor.submit(fn, *args)
+        except ExecutorBusy:
+            raise HashingBusy() from None
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HashingTimeout()
+
+    def shutdown(self):
+        self.executor.shutdown()
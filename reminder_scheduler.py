@@ -0,0 +1,229 @@
+import datetime
+import fcntl
+import heapq
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class ReminderScheduler:
+    """Fires reminders at their due time from an in-memory min-heap.
+
+    Only one process (the leader) keeps the heap. Leadership is an exclusive
+    flock on ``lock_path``; the other processes keep retrying the lock so a
+    new leader takes over if the old one exits. Processes that are not the
+    leader tell it about reminder changes by touching the lock file, which
+    makes the leader reload the pending reminders from the database.
+
+    ``load_pending`` returns ``(key, due_time)`` pairs for every reminder that
+    still needs to be sent and ``fire`` is called with the list of keys that
+    are due. Naive datetimes are treated as UTC.
+
+    ``fire`` returns the keys it could not deliver (or raises, which counts
+    as none delivered). Those are tried again after ``retry_delay`` seconds,
+    doubling with every attempt, until ``max_attempts`` sends have failed.
+    """
+
+    def __init__(self, load_pending, fire, lock_path, signal_interval=1.0, leader_retry=5.0,
+                 retry_delay=30.0, max_attempts=5):
+        self.load_pending = load_pending
+        self.fire = fire
+        self.lock_path = lock_path
+        self.signal_interval = signal_interval
+        self.leader_retry = leader_retry
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+
+        self.is_leader = False
+        self._heap = []
+        self._due = {}
+        # Failed sends per key, for keys waiting for a retry or given up on
+        self._attempts = {}
+        # Changes made by schedule() and cancel() while _reload() reads the
+        # database, or None when no reload is running
+        self._reload_changes = None
+        self._condition = threading.Condition()
+        self._lock_file = None
+        self._signal_mtime = None
+        self._stopped = False
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Start the scheduler thread; does nothing if it is already running."""
+        with self._condition:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread:
+            self._thread.join()
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+            self.is_leader = False
+
+    def schedule(self, key, due_time):
+        """Add or move a reminder. Replaces any earlier due time for ``key``."""
+        if not self.is_leader:
+            self._signal_change()
+            return
+
+        timestamp = self._timestamp(due_time)
+        with self._condition:
+            self._due[key] = timestamp
+            heapq.heappush(self._heap, (timestamp, key))
+            self._attempts.pop(key, None)
+            if self._reload_changes is not None:
+                self._reload_changes[key] = timestamp
+            # Wake the scheduler thread in case this is now the earliest reminder
+            self._condition.notify()
+
+    def cancel(self, key):
+        if not self.is_leader:
+            self._signal_change()
+            return
+
+        with self._condition:
+            # The heap entry is skipped when it is popped
+            self._due.pop(key, None)
+            self._attempts.pop(key, None)
+            if self._reload_changes is not None:
+                self._reload_changes[key] = None
+
+    def pending(self):
+        with self._condition:
+            return len(self._due)
+
+    @staticmethod
+    def _timestamp(due_time):
+        if due_time.tzinfo is None:
+            due_time = due_time.replace(tzinfo=datetime.timezone.utc)
+        return due_time.timestamp()
+
+    def _acquire_leadership(self):
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self.is_leader = True
+        return True
+
+    def _signal_change(self):
+        try:
+            os.utime(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+    def _reload(self):
+        # Request threads keep scheduling while the database is read. Their
+        # changes are recorded and applied on top of what was loaded, since
+        # the rows they come from may have been read before they were written
+        with self._condition:
+            self._reload_changes = {}
+        try:
+            loaded = {key: self._timestamp(due_time) for key, due_time in self.load_pending()}
+        except Exception:
+            with self._condition:
+                self._reload_changes = None
+            raise
+
+        with self._condition:
+            # Undelivered reminders are still pending in the database; keep
+            # their backoff, and leave out the ones given up on
+            due = {}
+            for key, timestamp in loaded.items():
+                if key not in self._attempts:
+                    due[key] = timestamp
+                elif key in self._due:
+                    due[key] = max(timestamp, self._due[key])
+            self._attempts = {key: attempts for key, attempts in self._attempts.items() if key in loaded}
+            for key, timestamp in self._reload_changes.items():
+                if timestamp is None:
+                    due.pop(key, None)
+                else:
+                    due[key] = timestamp
+            self._reload_changes = None
+            self._heap = [(timestamp, key) for key, timestamp in due.items()]
+            heapq.heapify(self._heap)
+            self._due = due
+            self._condition.notify()
+        log.info("Reminder scheduler loaded pending reminders", extra={"count": len(due)})
+
+    def _pop_due(self, now):
+        due = []
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                timestamp, key = heapq.heappop(self._heap)
+                # Skip entries that were cancelled or rescheduled since they were pushed
+                if self._due.get(key) == timestamp:
+                    del self._due[key]
+                    due.append(key)
+        return due
+
+    def _retry(self, fired, undelivered):
+        now = time.time()
+        with self._condition:
+            for key in fired:
+                if key not in undelivered:
+                    self._attempts.pop(key, None)
+            for key in undelivered:
+                # Rescheduled while it was being sent
+                if key in self._due:
+                    continue
+                attempts = self._attempts.get(key, 0) + 1
+                self._attempts[key] = attempts
+                if attempts >= self.max_attempts:
+                    log.warning("Giving up on reminder", extra={"key": str(key), "attempts": attempts})
+                    continue
+                timestamp = now + self.retry_delay * 2 ** (attempts - 1)
+                self._due[key] = timestamp
+                heapq.heappush(self._heap, (timestamp, key))
+
+    def _run(self):
+        while not self._stopped:
+            if not self.is_leader and not self._acquire_leadership():
+                with self._condition:
+                    self._condition.wait(self.leader_retry)
+                continue
+
+            try:
+                mtime = os.stat(self.lock_path).st_mtime_ns
+                if mtime != self._signal_mtime:
+                    self._reload()
+                    self._signal_mtime = mtime
+            except Exception:
+                log.exception("Error loading pending reminders")
+
+            due = self._pop_due(time.time())
+            if due:
+                try:
+                    undelivered = set(self.fire(due) or ())
+                except Exception:
+                    log.exception("Error firing reminders")
+                    undelivered = set(due)
+                self._retry(due, undelivered)
+
+            with self._condition:
+                if self._stopped:
+                    break
+                # Sleep until the next reminder is due, but wake up often enough
+                # to notice changes signalled by other processes
+                timeout = self.signal_interval
+                if self._heap:
+                    timeout = min(timeout, max(0.0, self._heap[0][0] - time.time()))
+                self._condition.wait(timeout)
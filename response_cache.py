@@ -0,0 +1,119 @@
+import itertools
+import threading
+import uuid
+from collections import OrderedDict
+
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+
+
+class LocalVersionStore:
+    """Per-user data versions kept in this process.
+
+    Only correct when a single process serves all requests. Versions start
+    from a random prefix so ETags handed out before a restart never match.
+    """
+
+    def __init__(self):
+        self._prefix = uuid.uuid4().hex[:8]
+        self._counter = itertools.count(1)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        return self._versions.get(user_id, self._prefix)
+
+    def bump(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._versions[user_id] = f"{self._prefix}-{next(self._counter)}"
+
+
+class SQLVersionStore:
+    """Per-user data versions kept in a database table shared by all workers.
+
+    ``table`` needs integer ``user_id`` (primary key) and ``version`` columns.
+    Reading a version is a single primary key lookup.
+    """
+
+    def __init__(self, get_engine, table):
+        self.get_engine = get_engine
+        self.table = table
+
+    def get(self, user_id):
+        with self.get_engine().connect() as conn:
+            version = conn.execute(
+                sa.select(self.table.c.version).where(self.table.c.user_id == user_id)
+            ).scalar()
+        return str(version or 0)
+
+    def bump(self, user_ids):
+        with self.get_engine().begin() as conn:
+            for user_id in user_ids:
+                updated = conn.execute(
+                    self.table.update()
+                    .where(self.table.c.user_id == user_id)
+                    .values(version=self.table.c.version + 1)
+                ).rowcount
+                if not updated:
+                    try:
+                        with conn.begin_nested():
+                            conn.execute(self.table.insert().values(user_id=user_id, version=1))
+                    except IntegrityError:
+                        # Another worker inserted the row first
+                        conn.execute(
+                            self.table.update()
+                            .where(self.table.c.user_id == user_id)
+                            .values(version=self.table.c.version + 1)
+                        )
+
+
+class ResponseCache:
+    """LRU cache of response bodies, keyed by URL and the user's data version.
+
+    Each body is stored with the response headers it needs, e.g. the next
+    page's cursor, as ``(name, value)`` pairs.
+
+    Bumping a user's version makes all of their cached responses unreachable;
+    they are evicted as the cache fills up. ``max_bytes`` caps the total size
+    of the cached bodies.
+    """
+
+    def __init__(self, versions, max_bytes=32 * 1024 * 1024):
+        self.versions = versions
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The cached ``(body, headers)``, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, headers=()):
+        # Don't let one huge response flush everything else
+        if len(body) > self.max_bytes // 4:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self._entries[key] = (body, tuple(headers))
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
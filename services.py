@@ -0,0 +1,50 @@
+"""Clients for external services, created the first time they are used.
+
+Importing the backend or starting a worker no longer reads the Firebase
+credentials or imports the OpenAI SDK; a worker that never sends a
+notification or asks the assistant never pays for either. ``set`` injects a
+ready-made client instead, e.g. a fake in a benchmark.
+"""
+import os
+import threading
+
+
+class LazyService:
+    """Holds one client, built by ``factory`` on the first ``get``."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self.factory()
+                client = self._client
+        return client
+
+    def set(self, client):
+        with self._lock:
+            self._client = client
+
+    @property
+    def initialized(self):
+        return self._client is not None
+
+
+def create_firebase_app():
+    # FIREBASE_CREDENTIALS is the path of the service account key file
+    import firebase_admin
+    from firebase_admin import credentials
+
+    path = os.getenv("FIREBASE_CREDENTIALS", "firebase_credentials.json")
+    return firebase_admin.initialize_app(credentials.Certificate(path))
+
+
+def create_openai_client():
+    from openai import OpenAI
+
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
@@ -0,0 +1,103 @@
+import datetime
+
+import numpy as np
+
+MINUTE = np.timedelta64(60, 's')
+DAY = np.timedelta64(1, 'D')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+SECOND = datetime.timedelta(seconds=1)
+
+
+def to_datetime64(times):
+    """Convert a list of naive datetimes to a datetime64[s] array.
+
+    Plain timedelta arithmetic is several times faster than letting NumPy
+    convert datetime objects itself.
+    """
+    seconds = np.fromiter(((t - EPOCH) // SECOND for t in times), dtype=np.int64, count=len(times))
+    return seconds.view('datetime64[s]')
+
+
+def wake_windows(starts, ends):
+    """Minutes awake before each sleep, for sleeps sorted by start time.
+
+    Measured from the latest end of any earlier sleep, so edits and deletes
+    never leave stale values behind. The first sleep has no wake window
+    (NaN), and overlapping sleeps get 0.
+    """
+    windows = np.full(len(starts), np.nan)
+    if len(starts) > 1:
+        latest_end = np.maximum.accumulate(ends)[:-1]
+        windows[1:] = np.maximum((starts[1:] - latest_end) / MINUTE, 0)
+    return windows
+
+
+def sleep_before(starts, ends, times):
+    """Total minutes slept before each of ``times``, summed over all sleeps.
+
+    Uses prefix sums over the sorted start and end times, so evaluating many
+    points costs O((n + k) log n) instead of O(n * k).
+    """
+    starts = np.sort(starts).astype(np.int64)
+    ends = np.sort(ends).astype(np.int64)
+    times = times.astype(np.int64)
+
+    start_sums = np.concatenate(([0], np.cumsum(starts)))
+    end_sums = np.concatenate(([0], np.cumsum(ends)))
+    started = np.searchsorted(starts, times, side='right')
+    ended = np.searchsorted(ends, times, side='right')
+
+    seconds = (started * times - start_sums[started]) - (ended * times - end_sums[ended])
+    return seconds / 60
+
+
+def daily_totals(starts, ends, first_day, days):
+    """Minutes slept on each of ``days`` calendar days from ``first_day``.
+
+    Sleeps that cross midnight are split between the two days.
+    """
+    boundaries = first_day + np.arange(days + 1) * DAY
+    return np.diff(sleep_before(starts, ends, boundaries.astype('datetime64[s]')))
+
+
+def is_night(starts, night_start=19, night_end=7):
+    """Whether each sleep starts between ``night_start`` and ``night_end`` o'clock."""
+    hour = (starts - starts.astype('datetime64[D]')).astype('timedelta64[h]').astype(np.int64)
+    if night_start > night_end:
+        return (hour >= night_start) | (hour < night_end)
+    return (hour >= night_start) & (hour < night_end)
+
+
+def rolling_average(values, window):
+    """Trailing mean over ``window`` values (fewer at the start of the series)."""
+    sums = np.cumsum(np.concatenate(([0.0], values)))
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return (sums[1:] - sums[np.arange(1, len(values) + 1) - counts]) / counts
+
+
+def sleep_summary(starts, ends, first_day, last_day, window=7, night_start=19, night_end=7):
+    """Daily sleep statistics between two dates (inclusive) from a full sleep history.
+
+    ``starts`` and ``ends`` are datetime64 arrays sorted by start time.
+    """
+    first_day = np.datetime64(first_day, 'D')
+    days = int((np.datetime64(last_day, 'D') - first_day) / DAY) + 1
+
+    night = is_night(starts, night_start, night_end)
+    total = daily_totals(starts, ends, first_day, days)
+    night_total = daily_totals(starts[night], ends[night], first_day, days)
+
+    durations = (ends - starts) / MINUTE
+    longest = int(np.argmax(durations)) if len(durations) else None
+
+    return {
+        "days": first_day + np.arange(days) * DAY,
+        "total": total,
+        "night": night_total,
+        "nap": total - night_total,
+        "rolling_average": rolling_average(total, window),
+        "wake_windows": wake_windows(starts, ends),
+        "longest": longest,
+        "durations": durations,
+    }
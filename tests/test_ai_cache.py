@@ -0,0 +1,34 @@
+import pytest
+
+from ai_cache import PromptCache, hashed_embedding, normalize_prompt
+
+
+def similarity(a, b):
+    return float(hashed_embedding(normalize_prompt(a)) @ hashed_embedding(normalize_prompt(b)))
+
+
+@pytest.mark.parametrize('cached, asked', [
+    ("is it safe to give my baby honey", "is it safe to give my baby water"),
+    ("tylenol for a 2 month old", "tylenol for a 6 month old"),
+    ("how much should a 2 month old eat", "how much should a 3 month old eat"),
+])
+def test_different_question_misses(cached, asked):
+    cache = PromptCache(similarity=0.7)
+    cache.put(cached, "reply")
+    # The word overlap alone would accept these
+    assert similarity(cached, asked) >= cache.similarity
+    assert cache.get(asked) is None
+    assert cache.similar_hits == 0
+
+
+def test_rephrased_question_hits():
+    cache = PromptCache(similarity=0.75)
+    cache.put("how much should a 2 month old eat", "reply")
+    assert cache.get("How much does a 2 month old eat?") == "reply"
+    assert cache.similar_hits == 1
+
+
+def test_similar_hits_stay_within_context():
+    cache = PromptCache(similarity=0.75)
+    cache.put("how much should a 2 month old eat", "reply", context_key="a")
+    assert cache.get("how much does a 2 month old eat", context_key="b") is None